@@ -0,0 +1,218 @@
+import json
+import threading
+import zlib
+from pathlib import Path
+
+from . import note_copy
+from .utils import LazyModule
+from .utils import cached_property
+
+sqlite3 = LazyModule('sqlite3')
+
+# The largest pages Danbooru serves for each index
+POSTS_PER_PAGE = 200
+NOTES_PER_PAGE = 1000
+
+
+class Archive:
+    """
+    The notes and image size of many posts of a site, kept in a local file.
+
+    Each post is a row of an SQLite database keyed by its ID, with its notes compressed, so a
+    post is found without reading the rest of the archive.
+    """
+    def __init__(self, path, domain=note_copy.DanbooruPost.domain):
+        """
+        :param path: the file of the archive, which is created if needed
+        :type path: str|Path
+        :param domain: the site of the posts, for a new archive; an existing archive keeps the
+            site it was created with
+        :type domain: str
+        """
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        # The connection is shared by the batch's threads, which take turns using the lock
+        self.connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS posts ('
+                'post_id INTEGER PRIMARY KEY, '
+                'width INTEGER NOT NULL, '
+                'height INTEGER NOT NULL, '
+                'notes BLOB NOT NULL)'
+            )
+            self.connection.execute(
+                'INSERT OR IGNORE INTO metadata VALUES (?, ?)',
+                ('domain', domain),
+            )
+
+        self.domain = self.connection.execute(
+            'SELECT value FROM metadata WHERE key = ?',
+            ('domain',),
+        ).fetchone()[0]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+
+    def add(self, posts):
+        """
+        Store posts, replacing the ones already in the archive.
+
+        :param posts: the ID, image size and notes of each post
+        :type posts: iterable[(int, (int, int), list[note_copy.Note])]
+        """
+        rows = []
+
+        for post_id, (width, height), notes in posts:
+            data = [[note.x, note.y, note.width, note.height, note.body] for note in notes]
+            compressed = zlib.compress(json.dumps(data).encode('utf-8'))
+            rows.append((post_id, width, height, compressed))
+
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?)', rows)
+
+    def get(self, post_id):
+        """
+        :return: the image size and notes of a post, if it is in the archive
+        :rtype: ((int, int), list[note_copy.Note])|None
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT width, height, notes FROM posts WHERE post_id = ?',
+                (post_id,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        width, height, compressed = row
+        data = json.loads(zlib.decompress(compressed).decode('utf-8'))
+        return (width, height), [note_copy.Note(*note) for note in data]
+
+    def get_post(self, post):
+        """
+        Find the archived copy of a post.
+
+        :type post: note_copy.BooruPost
+        :return: a post that reads from the archive, or None if the post is not in it
+        :rtype: ArchivePost|None
+        """
+        if post.domain != self.domain:
+            return None
+
+        entry = self.get(post.post_id)
+
+        if entry is None:
+            return None
+
+        dimensions, notes = entry
+        return ArchivePost(post, dimensions, notes)
+
+    def set_metadata(self, key, value):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?)', (key, value))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class ArchivePost(note_copy.DanbooruPost):
+    """
+    A Danbooru post whose notes and image size come from an archive instead of the site.
+
+    It can be used as a source anywhere a DanbooruPost can, without sending any requests.
+    """
+    def __init__(self, post, dimensions, notes):
+        """
+        :param post: the post that was archived
+        :type post: note_copy.BooruPost
+        :param dimensions: the width and height of the image
+        :type dimensions: (int, int)
+        :param notes: the notes of the post
+        :type notes: list[note_copy.Note]
+        """
+        super().__init__(post.post_id, mode=post.mode, auth_dir=post.auth_dir)
+        self.archived_dimensions = dimensions
+        self.archived_notes = notes
+
+    @cached_property
+    def notes(self):
+        return list(self.archived_notes)
+
+    def _get_dimensions(self):
+        return self.archived_dimensions
+
+    def get_notes_updated_since(self, updated_at):
+        # The archive does not know when notes changed
+        raise NotImplementedError
+
+
+def export(tags, path, *, auth=None):
+    """
+    Save the notes and image size of every Danbooru post matching a tag search to an archive.
+
+    Posts are listed a page at a time, and the notes of each page of posts are fetched
+    together, so only one page is held in memory at a time and a post costs no request of
+    its own. Posts already in the archive are replaced.
+
+    :param tags: the tag search, such as 'translated comic'
+    :type tags: str
+    :param path: the file of the archive
+    :type path: str|Path
+    :param auth: the login and API key to search with
+    :type auth: dict[str, str]|None
+    :return: the number of posts and notes exported
+    :rtype: (int, int)
+    """
+    auth = auth or {}
+    archive = Archive(path)
+    post_count = 0
+    note_count = 0
+
+    try:
+        archive.set_metadata('tags', tags)
+        post_params = dict(auth, tags=tags, only='id,image_width,image_height')
+        post_url = note_copy.DanbooruPost.base_url + '/posts.json'
+
+        for posts in note_copy.DanbooruPost.get_pages(post_url, post_params, POSTS_PER_PAGE):
+            # Posts hidden from the account come without their image
+            posts = [post for post in posts if post.get('image_width')]
+
+            if not posts:
+                continue
+
+            notes = {post['id']: [] for post in posts}
+            note_params = dict(auth)
+            note_params.update({
+                'group_by': 'note',
+                'search[post_id]': ','.join(str(post_id) for post_id in notes),
+                'search[is_active]': 'true',
+            })
+
+            for api_notes in note_copy.DanbooruPost.get_pages(note_copy.DanbooruPost.note_url,
+                                                              note_params, NOTES_PER_PAGE):
+                for note in api_notes:
+                    notes[note['post_id']].append(note_copy.Note(
+                        note['x'],
+                        note['y'],
+                        note['width'],
+                        note['height'],
+                        note['body'],
+                    ))
+
+            archive.add(
+                (post['id'], (post['image_width'], post['image_height']), notes[post['id']])
+                for post in posts
+            )
+            post_count += len(posts)
+            note_count += sum(len(post_notes) for post_notes in notes.values())
+    finally:
+        archive.close()
+
+    return post_count, note_count
@@ -0,0 +1,551 @@
+import itertools
+import queue
+import threading
+import time
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from . import archive
+from . import note_copy
+from . import profiling
+from . import sync
+from . import transport
+
+
+class ProgressEvent:
+    """
+    A change in the state of one pair of a batch.
+    """
+    STARTED = 'started'
+    FINISHED = 'finished'
+
+    def __init__(self, kind, index, result, completed, throttles=None):
+        """
+        :param kind: whether the pair has just started or finished
+        :type kind: str
+        :param index: the position of the pair in the batch
+        :type index: int
+        :param result: the result of the pair, which is only complete once it has finished
+        :type result: note_copy.CopyResult
+        :param completed: the number of pairs in the batch that have finished so far
+        :type completed: int
+        :param throttles: the throttle of each site used by the batch, by domain
+        :type throttles: dict[str, SiteThrottle]|None
+        """
+        self.kind = kind
+        self.index = index
+        self.result = result
+        self.completed = completed
+        self.throttles = throttles or {}
+
+    def __repr__(self):
+        return '<ProgressEvent {0} #{1}>'.format(self.kind, self.index)
+
+    def get_site_status(self):
+        """
+        Look at the sites as they are now, rather than when the event happened.
+
+        :return: the number of pairs waiting for each site and the seconds left of its
+            cooldown, by domain
+        :rtype: dict[str, (int, float)]
+        """
+        return {domain: throttle.get_status() for domain, throttle in self.throttles.items()}
+
+
+class SiteThrottle:
+    """
+    Space out the pairs that involve a site by its cooldown.
+
+    The lock is held for the whole pair, so pairs on the same site never run at the same time
+    while pairs on different sites can.
+    """
+    def __init__(self, cooldown):
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.last_release = None
+        # The number of pairs waiting for the pair on the site to finish
+        self.waiting = 0
+        self.waiting_lock = threading.Lock()
+
+    def __enter__(self):
+        with self.waiting_lock:
+            self.waiting += 1
+
+        self.lock.acquire()
+
+        with self.waiting_lock:
+            self.waiting -= 1
+
+        if self.last_release is not None:
+            remaining = self.last_release + self.cooldown - time.monotonic()
+
+            if remaining > 0 and not transport.is_replaying():
+                with profiling.waiting(profiling.SLEEP):
+                    time.sleep(remaining)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.last_release = time.monotonic()
+        self.lock.release()
+
+    def get_status(self):
+        """
+        :return: the number of pairs waiting for the site, and the seconds left before the
+            next pair on it may start
+        :rtype: (int, float)
+        """
+        cooldown = 0
+
+        if self.last_release is not None:
+            cooldown = max(0, self.last_release + self.cooldown - time.monotonic())
+
+        return self.waiting, cooldown
+
+
+def read_pairs(path):
+    """
+    Read the pairs of posts in a batch file, skipping blank lines and comments after a #.
+
+    :param path: a file with a source and destination post per line, separated by whitespace
+    :type path: str
+    :return: the source and destination post strings of each pair
+    :rtype: iterator[(str, str)]
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+
+            # Ignore blank lines
+            if not line:
+                continue
+
+            source_id, destination_id = line.split()
+            yield source_id, destination_id
+
+
+def post_string(post):
+    """
+    :return: a string that instantiate_post turns back into the post
+    :rtype: str
+    """
+    if isinstance(post, note_copy.BooruPost):
+        return '{0}{1}'.format(post.short_code, post.post_id)
+
+    return post
+
+
+class DeadLetterFile:
+    """
+    A batch file of the pairs that failed, which can be given to --file to retry them later.
+
+    Each line has the error of the pair as a comment after the pair.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def add(self, result):
+        """
+        Append a failed pair to the file.
+
+        :type result: note_copy.CopyResult
+        """
+        line = '{src} {dest}  # {error_type}: {error}\n'.format(
+            src=post_string(result.source),
+            dest=post_string(result.destination),
+            error_type=type(result.error).__name__,
+            error=str(result.error).replace('\n', ' '),
+        )
+
+        # The file is appended to as pairs fail, so an interrupted batch keeps its failures
+        with self.lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+class _BatchRunner:
+    def __init__(self, *, on_progress=None, sync_state=None, destination_options=None,
+                 source_archive=None, read_concurrency=None, write_concurrency=None):
+        self.on_progress = on_progress
+        self.sync_state = sync_state
+        self.destination_options = destination_options or {}
+        self.source_archive = source_archive
+        self.write_concurrency = write_concurrency or {}
+        self.valid_classes = note_copy.get_valid_classes()
+        self.throttles = {cls.domain: SiteThrottle(cls.cooldown) for cls in self.valid_classes}
+        read_concurrency = read_concurrency or {}
+        # Sources read ahead of their copy wait for each other beyond each site's limit
+        self.read_limits = {
+            cls.domain: threading.BoundedSemaphore(
+                read_concurrency.get(cls.domain, cls.read_concurrency)
+            )
+            for cls in self.valid_classes
+        }
+        # The pairs whose source was read ahead, so copying them sends nothing to its site
+        self.read_results = set()
+        self.progress_lock = threading.Lock()
+        self.completed = 0
+
+    def report(self, kind, index, result):
+        if not self.on_progress:
+            return
+
+        # Callbacks come from the worker threads, but never run at the same time
+        with self.progress_lock:
+            if kind == ProgressEvent.FINISHED:
+                self.completed += 1
+
+            self.on_progress(ProgressEvent(kind, index, result, self.completed,
+                                           self.throttles))
+
+    def instantiate(self, post, mode='r'):
+        if isinstance(post, note_copy.BooruPost):
+            return post
+
+        return note_copy.instantiate_post(self.valid_classes, post, mode=mode)
+
+    def start_group(self, group, read_sources=False):
+        """
+        Create the posts of a group, reading its sources right away if asked to.
+
+        :param group: the index, source and destination of each pair
+        :type group: list[(int, str|BooruPost, str|BooruPost)]
+        :param read_sources: whether to read the notes and image size of the sources now
+            rather than when they are copied
+        :type read_sources: bool
+        :return: the group and the result of each pair, with an error for the pairs that
+            cannot be copied
+        :rtype: (list[(int, str|BooruPost, str|BooruPost)], list[note_copy.CopyResult])
+        """
+        results = []
+
+        for index, source, destination in group:
+            result = note_copy.CopyResult(source, destination)
+            results.append(result)
+            self.report(ProgressEvent.STARTED, index, result)
+
+        for result in results:
+            try:
+                result.source = self.instantiate(result.source)
+
+                if self.source_archive is not None:
+                    result.source = self.source_archive.get_post(result.source) or result.source
+
+                if read_sources:
+                    self.read_source(result)
+            except Exception as e:
+                result.error = e
+
+        try:
+            destination = self.instantiate(group[0][2], mode='w')
+
+            for name, value in self.destination_options.items():
+                setattr(destination, name, value)
+
+            if destination.domain in self.write_concurrency:
+                destination.write_concurrency = self.write_concurrency[destination.domain]
+
+            for result in results:
+                result.destination = destination
+        except Exception as e:
+            for result in results:
+                if result.ok:
+                    result.error = e
+
+        return group, results
+
+    def read_source(self, result):
+        source = result.source
+
+        # Archived posts are already on disk
+        if isinstance(source, archive.ArchivePost):
+            return
+
+        # A source read ahead is not covered by the turn of its pair on the site, so it takes
+        # a token from the site's rate limiter, which the writes to the site share
+        limiter = transport.get_rate_limiter(source.domain, 1 / source.cooldown,
+                                             source.write_burst)
+
+        with self.read_limits[source.domain]:
+            limiter.acquire()
+
+            with result.timed('read'):
+                source.dimensions
+
+                # Syncing only reads the notes that changed, which it does itself
+                if self.sync_state is None:
+                    source.notes
+                    self.read_results.add(result)
+
+    def copy_group(self, started_group):
+        """
+        Copy the notes of every source in a started group to their shared destination in one
+        session.
+
+        :param started_group: a group and its results, as returned by start_group
+        :type started_group: (list[(int, str|BooruPost, str|BooruPost)],
+            list[note_copy.CopyResult])
+        :return: the index and result of each pair
+        :rtype: list[(int, note_copy.CopyResult)]
+        """
+        group, results = started_group
+        copied_results = [result for result in results if result.ok]
+
+        if copied_results:
+            destination = copied_results[0].destination
+
+            try:
+                # Acquire in a fixed order so that two groups between the same sites cannot
+                # deadlock. Archived sources and sources read ahead need nothing from their site.
+                domains = {result.source.domain for result in copied_results
+                           if not isinstance(result.source, archive.ArchivePost) and
+                           result not in self.read_results}
+                domains.add(destination.domain)
+
+                with ExitStack() as stack:
+                    with profiling.scope('throttle'):
+                        for domain in sorted(domains):
+                            stack.enter_context(self.throttles[domain])
+
+                    self.copy_posts(destination, copied_results)
+            except Exception as e:
+                for result in copied_results:
+                    if result.ok:
+                        result.error = e
+
+        for (index, _, _), result in zip(group, results):
+            self.read_results.discard(result)
+            self.report(ProgressEvent.FINISHED, index, result)
+
+        return [(index, result) for (index, _, _), result in zip(group, results)]
+
+    def run_group(self, group):
+        return self.copy_group(self.start_group(group))
+
+    def read_ahead(self, groups, max_pairs):
+        """
+        Start groups and read their sources on other threads, ahead of their copy.
+
+        The groups are a bounded queue: once the started groups that are waiting to be copied
+        hold max_pairs pairs, no more are started until the oldest is taken, so a
+        slow site to write to cannot make the posts read for it pile up in memory. Groups are
+        taken from the iterable on a thread of their own, so a group is handed on as soon as it
+        is read, even while the next one is not there yet, as when groups come from a queue
+        that is still being filled.
+
+        :param groups: the index, source and destination of the pairs of each group
+        :type groups: iterable[list[(int, str|BooruPost, str|BooruPost)]]
+        :param max_pairs: the number of pairs that may be read and waiting
+        :type max_pairs: int
+        :return: the started groups, in the order they were given
+        :rtype: iterator[(list[(int, str|BooruPost, str|BooruPost)],
+            list[note_copy.CopyResult])]
+        """
+        started = queue.Queue()
+        condition = threading.Condition()
+        pending_pairs = 0
+        closed = False
+
+        def take_groups(executor):
+            nonlocal pending_pairs
+
+            try:
+                for group in groups:
+                    with condition:
+                        condition.wait_for(lambda: closed or pending_pairs < max_pairs)
+
+                        if closed:
+                            return
+
+                        pending_pairs += len(group)
+                        started.put((executor.submit(self.start_group, group, True),
+                                     len(group)))
+            except Exception as e:
+                started.put((e, 0))
+            finally:
+                started.put((None, 0))
+
+        with ThreadPoolExecutor(max_workers=max_pairs) as executor:
+            # The thread can be blocked on the groups when the batch is abandoned
+            thread = threading.Thread(target=take_groups, args=(executor,), daemon=True)
+            thread.start()
+
+            try:
+                while True:
+                    future, size = started.get()
+
+                    if future is None:
+                        return
+                    elif isinstance(future, Exception):
+                        raise future
+
+                    with condition:
+                        pending_pairs -= size
+                        condition.notify()
+
+                    yield future.result()
+            finally:
+                with condition:
+                    closed = True
+                    condition.notify()
+
+    def copy_posts(self, destination, results):
+        source_posts = [result.source for result in results]
+
+        if self.sync_state is not None:
+            sync.sync_notes_to_post(source_posts, destination, self.sync_state, results=results)
+        else:
+            destination.copy_notes_from_posts(source_posts, results=results)
+
+
+def group_by_destination(pairs):
+    """
+    Group consecutive pairs that share a destination, so their sources can be copied to it in
+    one session.
+
+    Only neighbouring pairs are grouped, so a batch file never has to be read ahead. Sorting
+    the file with dedup.prepare_pairs first brings all pairs of a destination together.
+
+    :param pairs: the source and destination of each pair
+    :type pairs: iterable[(str|BooruPost, str|BooruPost)]
+    :return: the index, source and destination of the pairs of each group
+    :rtype: iterator[list[(int, str|BooruPost, str|BooruPost)]]
+    """
+    indexed_pairs = ((index, source, destination)
+                     for index, (source, destination) in enumerate(pairs))
+    groups = itertools.groupby(indexed_pairs, key=lambda pair: post_string(pair[2]))
+
+    for _, group in groups:
+        yield list(group)
+
+
+def _index_groups(groups):
+    index = 0
+
+    for group in groups:
+        indexed_group = []
+
+        for source, destination in group:
+            indexed_group.append((index, source, destination))
+            index += 1
+
+        yield indexed_group
+
+
+def _run(groups, *, concurrency=1, prefetch=0, **options):
+    runner = _BatchRunner(**options)
+
+    if prefetch:
+        tasks = ((runner.copy_group, started_group)
+                 for started_group in runner.read_ahead(groups, prefetch))
+    else:
+        tasks = ((runner.run_group, group) for group in groups)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+
+        # Groups are taken as workers free up instead of all at once, so a batch read from a
+        # huge file never has more than a few pairs in memory, and a group taken from a queue
+        # is not claimed while it still has to wait for a worker.
+        while True:
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    yield from future.result()
+
+            try:
+                func, group = next(tasks)
+            except StopIteration:
+                break
+
+            pending.add(executor.submit(func, group))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                yield from future.result()
+
+
+def iter_copy_batch(pairs, **options):
+    """
+    Copy notes between many pairs of posts, yielding each result as soon as it is finished.
+
+    Takes the same arguments as copy_batch. Results are yielded in the order the pairs finish,
+    which is the order they were given when the concurrency is 1.
+
+    :rtype: iterator[note_copy.CopyResult]
+    """
+    for _, result in _run(group_by_destination(pairs), **options):
+        yield result
+
+
+def iter_copy_groups(groups, **options):
+    """
+    Copy notes for groups of pairs that were already grouped by destination.
+
+    Takes the same arguments as copy_batch, except that the pairs come in groups that share a
+    destination, and each group is copied in one session. The next group is only taken once
+    a worker is free, so the groups can come from a queue that is still being filled. The
+    index of each pair in the progress events counts the pairs of all groups.
+
+    :param groups: the source and destination of the pairs of each group
+    :type groups: iterable[list[(str|BooruPost, str|BooruPost)]]
+    :rtype: iterator[note_copy.CopyResult]
+    """
+    for _, result in _run(_index_groups(groups), **options):
+        yield result
+
+
+def copy_batch(pairs, *, concurrency=1, prefetch=0, on_progress=None, sync_state=None,
+               destination_options=None, source_archive=None, read_concurrency=None,
+               write_concurrency=None):
+    """
+    Copy notes between many pairs of posts.
+
+    A failure in one pair does not stop the others; the exception is stored in the result of
+    that pair instead.
+
+    :param pairs: the source and destination of each pair, either as post strings like
+        'd1234' or as BooruPost objects
+    :type pairs: iterable[(str|BooruPost, str|BooruPost)]
+    :param concurrency: the number of pairs worked on at the same time; pairs involving the
+        same site still wait for each other
+    :type concurrency: int
+    :param prefetch: the number of pairs whose sources may be read ahead while others are
+        being written, or 0 to read each source when its pair is copied
+    :type prefetch: int
+    :param on_progress: called with a ProgressEvent when each pair starts and finishes
+    :type on_progress: callable|None
+    :param sync_state: if given, only copy the notes changed since the last sync of each pair
+    :type sync_state: sync.SyncState|None
+    :param destination_options: attributes to set on every destination post, such as fit,
+        rounding or tag_editor
+    :type destination_options: dict|None
+    :param source_archive: if given, sources found in it are read from it instead of their
+        site
+    :type source_archive: archive.Archive|None
+    :param read_concurrency: the number of sources read ahead at the same time, by domain,
+        for the sites that should not use their default
+    :type read_concurrency: dict[str, int]|None
+    :param write_concurrency: the number of notes written at the same time, by domain, for the
+        sites that should not use their default
+    :type write_concurrency: dict[str, int]|None
+    :return: the result of each pair, in the order the pairs were given
+    :rtype: list[note_copy.CopyResult]
+    """
+    results = dict(_run(
+        group_by_destination(pairs),
+        concurrency=concurrency,
+        prefetch=prefetch,
+        on_progress=on_progress,
+        sync_state=sync_state,
+        destination_options=destination_options,
+        source_archive=source_archive,
+        read_concurrency=read_concurrency,
+        write_concurrency=write_concurrency,
+    ))
+    return [results[index] for index in sorted(results)]
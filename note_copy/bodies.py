@@ -0,0 +1,101 @@
+import html
+import re
+from functools import lru_cache
+
+
+class Rule:
+    """
+    A single rewrite of a note body.
+    """
+    def __call__(self, body):
+        raise NotImplementedError
+
+
+class RegexRule(Rule):
+    """
+    Replace every match of a pattern, which is compiled once when the rule is created.
+    """
+    def __init__(self, pattern, replacement, flags=0):
+        self.pattern = re.compile(pattern, flags)
+        self.replacement = replacement
+
+    def __call__(self, body):
+        return self.pattern.sub(self.replacement, body)
+
+
+class TruncateRule(Rule):
+    """
+    Shorten bodies that are longer than a site accepts.
+    """
+    def __init__(self, max_length, suffix='...'):
+        self.max_length = max_length
+        self.suffix = suffix
+
+    def __call__(self, body):
+        if len(body) <= self.max_length:
+            return body
+
+        return body[:self.max_length - len(self.suffix)] + self.suffix
+
+
+# Entities for these characters are kept, since unescaping them would change the markup or
+# turn invisible characters into ones that are hard to spot when editing notes.
+KEEP_ESCAPED = {'<', '>', '&', '"', "'", '\xa0'}
+
+
+def _unescape_entity(match):
+    character = html.unescape(match.group(0))
+    return match.group(0) if character in KEEP_ESCAPED else character
+
+
+# Note bodies on every supported site are a subset of HTML. Rules read bodies into a common
+# form, which uses newlines for line breaks like Danbooru does, and write them out in the form
+# used by the destination site.
+NORMALIZE_ENTITIES = RegexRule(r'&(?:#\d+|#x[0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);', _unescape_entity)
+BR_TO_NEWLINE = RegexRule(r'<br\s*/?>', '\n', re.IGNORECASE)
+# Gelbooru has no equivalent of Danbooru's translator's note tag
+TN_TO_ITALICS = RegexRule(r'<(/?)tn>', r'<\1i>', re.IGNORECASE)
+
+DANBOORU_READ_RULES = (NORMALIZE_ENTITIES,)
+DANBOORU_WRITE_RULES = ()
+GELBOORU_READ_RULES = (BR_TO_NEWLINE, NORMALIZE_ENTITIES)
+GELBOORU_WRITE_RULES = (TN_TO_ITALICS,)
+
+
+class Pipeline:
+    """
+    An ordered sequence of rules applied to note bodies.
+    """
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+
+    def __call__(self, body):
+        for rule in self.rules:
+            body = rule(body)
+
+        return body
+
+
+@lru_cache(maxsize=None)
+def get_pipeline(source_class, destination_class):
+    """
+    Build the pipeline for copying bodies from one site to another.
+
+    Pipelines are cached, so each pair of sites only assembles its rules once per process.
+
+    :param source_class: the site from which notes are copied
+    :type source_class: type
+    :param destination_class: the site to which notes are copied
+    :type destination_class: type
+    :rtype: Pipeline
+    """
+    rules = []
+
+    for rule in source_class.read_body_rules + destination_class.write_body_rules:
+        if rule not in rules:
+            rules.append(rule)
+
+    if destination_class.max_note_length:
+        rules.append(TruncateRule(destination_class.max_note_length))
+
+    return Pipeline(rules)
@@ -1,43 +1,366 @@
 import argparse
 import sys
-import time
+import threading
+from pathlib import Path
 
+from . import archive
+from . import batch
+from . import dedup
+from . import dimension_cache
+from . import geometry
 from . import note_copy
+from . import profiling
+from . import progress
+from . import recording
+from . import sync
+from . import transport
+from .utils import LazyModule
 
+# Only needed by the serve command
+server = LazyModule('note_copy.server')
 
-def main():
-    parser = argparse.ArgumentParser()
+
+def add_copy_arguments(parser):
+    parser.add_argument('--fit', action='store', choices=geometry.FIT_MODES, default='stretch',
+                        help='How to place notes when the destination image has a different '
+                             'aspect ratio')
+    parser.add_argument('--rounding', action='store', choices=sorted(geometry.ROUNDING_POLICIES),
+                        default='round',
+                        help='How scaled note positions are turned into whole pixels')
+    parser.add_argument('--add-tag', action='append', default=[], metavar='TAG',
+                        help='Tag to add to the destination, in addition to translated')
+    parser.add_argument('--remove-tag', action='append', default=[], metavar='TAG',
+                        help='Tag to remove from the destination, in addition to the ones '
+                             'requesting translation')
+    parser.add_argument('--alias-tag', action='append', nargs=2, default=[],
+                        metavar=('OLD', 'NEW'), help='Tag on the destination to replace')
+    parser.add_argument('-j', '--concurrency', action='store', type=int, default=1,
+                        help='Number of pairs to work on at the same time; pairs on the same '
+                             'site still wait for each other')
+    parser.add_argument('--prefetch', action='store', type=int, default=0, metavar='PAIRS',
+                        help='Number of pairs whose sources may be read ahead while others are '
+                             'being written')
+    parser.add_argument('--read-concurrency', action='append', default=[], metavar='SITE=N',
+                        help='Number of sources of a site to read ahead at the same time')
+    parser.add_argument('--write-concurrency', action='append', default=[], metavar='SITE=N',
+                        help='Number of notes to write to a site at the same time')
+    parser.add_argument('--dimension-cache', action='store', type=str, metavar='FILE',
+                        help='File keeping the image size of each post between runs, '
+                             'defaulting to dimensions.sqlite3 in the .note_copy directory')
+    parser.add_argument('--archive', action='store', type=str, metavar='FILE',
+                        help='Archive made by the export command to read source notes from, '
+                             'for the sources it contains')
+    parser.add_argument('--rate-limit-dir', action='store', type=str, metavar='DIR',
+                        help='Directory through which runs on this computer share the rate limit '
+                             'of each site, defaulting to rate_limits in the .note_copy directory')
+
+
+def parse_site_limits(values):
+    """
+    Read limits given for individual sites.
+
+    :param values: strings like 'd=4' or 'gelbooru.com=1'
+    :type values: list[str]
+    :return: the limit of each site, by domain
+    :rtype: dict[str, int]
+    """
+    sites = {}
+
+    for cls in note_copy.get_valid_classes():
+        sites[cls.short_code] = sites[cls.domain] = cls.domain
+
+    limits = {}
+
+    for value in values:
+        site, _, limit = value.partition('=')
+
+        if site.lower() not in sites or not limit.isdigit() or int(limit) < 1:
+            raise ValueError('invalid site limit: ' + value)
+
+        limits[sites[site.lower()]] = int(limit)
+
+    return limits
+
+
+def add_pair_arguments(parser):
     parser.add_argument('-s', '--source', action='store', type=str,
                         help='The post from which notes will be copied')
     parser.add_argument('-d', '--destination', action='store', type=str,
                         help='The post to which notes will be copied')
     parser.add_argument('-f', '--file', action='store', type=str,
                         help='File containing post pairs, separated by whitespace, one per line')
+    add_copy_arguments(parser)
+    parser.add_argument('--progress', action='store', choices=['lines', 'tty', 'json'],
+                        default='lines',
+                        help='Print a line for each pair, or instead keep a line with the '
+                             'speed and ETA of the batch up to date, or print them as JSON '
+                             'lines')
+    parser.add_argument('--progress-interval', action='store', type=float, metavar='SECONDS',
+                        help='Seconds between updates of the progress, defaulting to 0.5 for '
+                             'tty and 10 for json')
+    parser.add_argument('--dead-letter', action='store', type=str, metavar='FILE',
+                        help='File to append the pairs that failed to, which can be retried '
+                             'later with --file')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Skip duplicate pairs in the file and group the pairs by site, '
+                             'which changes the order they are copied in')
+    parser.add_argument('--memory-limit', action='store', type=int, default=64, metavar='MB',
+                        help='Approximate memory used by --dedup before it sorts pairs on disk')
+    parser.add_argument('--profile', action='store', type=str, metavar='OUT',
+                        help='Directory to write a profile of each phase of the batch to')
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument('--record', action='store', type=str, metavar='DIR',
+                           help='Directory to record all responses from the sites to')
+    recording.add_argument('--replay', action='store', type=str, metavar='DIR',
+                           help='Directory of recorded responses to use instead of the sites')
+
+
+def describe_post(post):
+    if isinstance(post, note_copy.BooruPost):
+        return '{0} #{1}'.format(post.site_name, post.post_id)
+
+    return post
+
+
+def report_problems(result):
+    """
+    Print the warnings of a finished pair, and its error if it failed.
+    """
+    for warning in result.warnings:
+        print('Warning: ' + warning, file=sys.stderr)
+
+    if not result.ok:
+        message = 'Failed to copy notes from {src} to {dest}: {error}'
+        print(message.format(
+            src=describe_post(result.source),
+            dest=describe_post(result.destination),
+            error=result.error,
+        ), file=sys.stderr)
+
+
+def report_progress(event):
+    if event.kind != batch.ProgressEvent.FINISHED:
+        return
+
+    result = event.result
+    source = describe_post(result.source)
+    destination = describe_post(result.destination)
+    report_problems(result)
+
+    if not result.ok:
+        return
+    elif result.notes_written or result.notes_skipped or result.notes_missing:
+        message = 'Notes successfully copied from {src} to {dest}'
+        print(message.format(src=source, dest=destination))
+    elif result.notes_updated or result.notes_deleted:
+        message = 'Copies of notes edited on {src} updated on {dest}'
+        print(message.format(src=source, dest=destination))
+    else:
+        print('No notes to copy from {src}'.format(src=source))
+
+
+def read_batch(args):
+    """
+    Read the pairs of the batch file, without the duplicates when --dedup is set.
+
+    :return: the source and destination post strings of each pair
+    :rtype: iterator[(str, str)]
+    """
+    pairs = batch.read_pairs(args.file)
+
+    if args.dedup:
+        pairs = dedup.prepare_pairs(pairs, memory_limit=args.memory_limit * 1024 * 1024)
+
+    return pairs
+
+
+def make_progress_reporter(args):
+    """
+    Create the reporter chosen with --progress, which only prints the problems of each pair.
+
+    :return: the reporter, or None to print a line for every pair
+    :rtype: progress.ProgressReporter|None
+    """
+    if args.progress == 'lines':
+        return None
+
+    # The batch is counted in a separate pass, so that it does not have to be held in memory.
+    # It is read the same way as for copying, so the totals only count the pairs that are copied
+    if args.source and args.destination:
+        totals = progress.count_pairs([(args.source, args.destination)])
+    else:
+        totals = progress.count_pairs(read_batch(args))
+
+    if args.progress == 'tty':
+        reporter = progress.TTYProgress(sys.stderr, totals=totals,
+                                        interval=args.progress_interval)
+    else:
+        reporter = progress.JSONProgress(sys.stdout, totals=totals,
+                                         interval=args.progress_interval)
+
+    reporter.start()
+    return reporter
+
+
+def export(args):
+    # Credentials belong to the site, so any of its posts can load them
+    auth = note_copy.DanbooruPost(0).auth
+    post_count, note_count = archive.export(args.tags, args.out, auth=auth)
+    print('Exported {notes} notes from {posts} posts to {out}'.format(
+        notes=note_count,
+        posts=post_count,
+        out=args.out,
+    ))
+
+
+def serve(args, batch_options):
+    queue = server.JobQueue(args.queue)
+    worker = server.Worker(queue, **batch_options)
+    http_server = server.make_server(worker, host=args.host, port=args.port,
+                                     socket_path=args.socket)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    print('Listening on ' + (args.socket or 'http://{0}:{1}'.format(args.host, args.port)))
+
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+        queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_pair_arguments(parser)
+    subparsers = parser.add_subparsers(dest='command')
+    sync_parser = subparsers.add_parser(
+        'sync',
+        help='Copy only the notes that changed since the last sync of each pair',
+    )
+    add_pair_arguments(sync_parser)
+    sync_parser.add_argument('--state', action='store', type=str,
+                             help='File recording when each pair was last synced')
+    serve_parser = subparsers.add_parser(
+        'serve',
+        help='Copy notes for pairs submitted over HTTP until stopped',
+    )
+    add_copy_arguments(serve_parser)
+    serve_parser.add_argument('--queue', action='store', type=str, metavar='FILE',
+                              help='Database of submitted jobs, defaulting to jobs.sqlite3 in '
+                                   'the .note_copy directory')
+    serve_parser.add_argument('--host', action='store', type=str, default='127.0.0.1',
+                              help='Address to listen on')
+    serve_parser.add_argument('--port', action='store', type=int, default=8080,
+                              help='Port to listen on')
+    serve_parser.add_argument('--socket', action='store', type=str, metavar='PATH',
+                              help='Unix socket to listen on instead of a port')
+    export_parser = subparsers.add_parser(
+        'export',
+        help='Save the notes of the Danbooru posts matching a tag search to an archive',
+    )
+    export_parser.add_argument('--tags', action='store', type=str, required=True,
+                               help='The tag search, such as "translated comic"')
+    export_parser.add_argument('out', help='The archive file to write')
     args = parser.parse_args()
-    valid_classes = note_copy.get_valid_classes()
+
+    try:
+        tag_editor = note_copy.TAG_EDITOR.extend(args.add_tag, args.remove_tag,
+                                                 dict(args.alias_tag))
+        read_concurrency = parse_site_limits(args.read_concurrency)
+        write_concurrency = parse_site_limits(args.write_concurrency)
+    except ValueError as e:
+        parser.error(str(e))
+
+    batch_options = {
+        'concurrency': args.concurrency,
+        'prefetch': args.prefetch,
+        'read_concurrency': read_concurrency,
+        'write_concurrency': write_concurrency,
+        'destination_options': {
+            'fit': args.fit,
+            'rounding': args.rounding,
+            'tag_editor': tag_editor,
+        },
+    }
+    dimension_cache.set_cache(dimension_cache.DimensionCache(args.dimension_cache))
+    transport.set_rate_limit_dir(
+        args.rate_limit_dir or Path.home() / '.note_copy' / 'rate_limits'
+    )
+
+    if args.command == 'export':
+        export(args)
+        return
+
+    if args.archive:
+        if not Path(args.archive).is_file():
+            parser.error('no archive found at ' + args.archive)
+
+        batch_options['source_archive'] = archive.Archive(args.archive)
+
+    if args.command == 'serve':
+        serve(args, batch_options)
+        return
 
     if args.source and args.destination:
-        source = note_copy.instantiate_post(valid_classes, args.source)
-        destination = note_copy.instantiate_post(valid_classes, args.destination, mode='w')
-        destination.copy_notes_from_post(source)
+        pairs = [(args.source, args.destination)]
     elif args.file:
-        cooldown = max(cls.cooldown for cls in valid_classes)
-        with open(args.file, 'r') as f:
-            for line in f:
-                line = line.strip()
-
-                # Ignore blank lines
-                if not line:
-                    continue
-
-                source_id, destination_id = line.split()
-                source = note_copy.instantiate_post(valid_classes, source_id)
-                destination = note_copy.instantiate_post(valid_classes, destination_id, mode='w')
-                destination.copy_notes_from_post(source)
-                time.sleep(cooldown)
+        pairs = read_batch(args)
     elif args.source or args.destination:
         print('Specify two post numbers', file=sys.stderr)
         sys.exit(1)
     else:
         print('No post numbers or file specified', file=sys.stderr)
         sys.exit(1)
+
+    if args.record:
+        transport.set_store(recording.ResponseStore(args.record, recording.RECORD))
+    elif args.replay:
+        try:
+            transport.set_store(recording.ResponseStore(args.replay, recording.REPLAY))
+        except FileNotFoundError:
+            parser.error('no recording found in ' + args.replay)
+
+    sync_state = sync.SyncState(args.state) if args.command == 'sync' else None
+    reporter = make_progress_reporter(args)
+
+    def on_progress(event):
+        if event.kind == batch.ProgressEvent.FINISHED and (
+                event.result.warnings or not event.result.ok):
+            with reporter.lock:
+                reporter.clear()
+                report_problems(event.result)
+
+        reporter(event)
+
+    results = batch.iter_copy_batch(
+        pairs,
+        on_progress=on_progress if reporter else report_progress,
+        sync_state=sync_state,
+        **batch_options
+    )
+    dead_letters = batch.DeadLetterFile(args.dead_letter) if args.dead_letter else None
+    failures = 0
+
+    if args.profile:
+        profiling.start()
+
+    try:
+        for result in results:
+            if result.ok:
+                continue
+
+            failures += 1
+
+            if dead_letters:
+                dead_letters.add(result)
+    finally:
+        if reporter:
+            reporter.close()
+
+        if args.profile:
+            profiling.stop(args.profile)
+
+    if failures:
+        sys.exit(1)
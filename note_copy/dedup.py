@@ -0,0 +1,130 @@
+import heapq
+import os
+import re
+import tempfile
+
+from . import note_copy
+
+# Rough size in bytes of a pair held in memory, not counting its strings
+PAIR_OVERHEAD = 200
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+def normalize_post_string(post_string, sites):
+    """
+    Write a post string with the short code of its site, so that the same post is always
+    written the same way.
+
+    Strings of unknown sites are left as they are; they fail when the pair is copied.
+
+    :param post_string: a post string like 'd1234' or 'danbooru.donmai.us1234'
+    :type post_string: str
+    :param sites: the short code of every site, by short code and domain
+    :type sites: dict[str, str]
+    :rtype: str
+    """
+    matches = re.fullmatch(note_copy.POST_PATTERN, post_string)
+
+    if not matches:
+        return post_string
+
+    site_identifier, post_id = matches.groups()
+    short_code = sites.get(site_identifier.lower())
+
+    if short_code is None:
+        return post_string
+
+    return short_code + str(int(post_id))
+
+
+def get_sort_key(pair):
+    """
+    Order pairs by the site of the destination, then by destination, so the pairs of a site are
+    together and the pairs sharing a destination can be copied to it in one session.
+    """
+    source, destination = pair
+    return destination.rstrip('0123456789'), destination, source
+
+
+def _spill(pairs, tmp_dir):
+    fd, path = tempfile.mkstemp(prefix='note_copy_pairs_', dir=tmp_dir)
+
+    with os.fdopen(fd, 'w') as f:
+        for source, destination in pairs:
+            f.write('{0}\t{1}\n'.format(source, destination))
+
+    return path
+
+
+def _read_run(path):
+    with open(path, 'r') as f:
+        for line in f:
+            source, destination = line.rstrip('\n').split('\t')
+            yield source, destination
+
+
+def prepare_pairs(pairs, *, memory_limit=DEFAULT_MEMORY_LIMIT, tmp_dir=None):
+    """
+    Remove duplicate pairs and group the rest, without holding more of them in memory than
+    the limit allows.
+
+    Pairs are collected until their estimated size reaches the memory limit, then sorted and
+    written to a temporary file. The sorted files are merged at the end, dropping the
+    duplicates that were in different files. A batch that fits in memory is never written to
+    disk.
+
+    :param pairs: the source and destination post strings of each pair
+    :type pairs: iterable[(str, str)]
+    :param memory_limit: the approximate number of bytes of pairs to keep in memory
+    :type memory_limit: int
+    :param tmp_dir: the directory for the temporary files, defaulting to the system's
+    :type tmp_dir: str|None
+    :return: each distinct pair once, ordered by get_sort_key
+    :rtype: iterator[(str, str)]
+    """
+    sites = {}
+
+    for cls in note_copy.get_valid_classes():
+        sites[cls.short_code] = sites[cls.domain] = cls.short_code
+
+    chunk = set()
+    chunk_size = 0
+    runs = []
+
+    try:
+        for source, destination in pairs:
+            pair = (normalize_post_string(source, sites), normalize_post_string(destination, sites))
+
+            if pair in chunk:
+                continue
+
+            chunk.add(pair)
+            chunk_size += PAIR_OVERHEAD + len(pair[0]) + len(pair[1])
+
+            if chunk_size >= memory_limit:
+                runs.append(_spill(sorted(chunk, key=get_sort_key), tmp_dir))
+                chunk = set()
+                chunk_size = 0
+
+        sorted_chunk = sorted(chunk, key=get_sort_key)
+        chunk = None
+
+        if not runs:
+            yield from sorted_chunk
+            return
+
+        merged = heapq.merge(
+            sorted_chunk,
+            *[_read_run(path) for path in runs],
+            key=get_sort_key
+        )
+        previous = None
+
+        for pair in merged:
+            if pair != previous:
+                yield pair
+
+            previous = pair
+    finally:
+        for path in runs:
+            os.remove(path)
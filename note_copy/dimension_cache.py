@@ -0,0 +1,93 @@
+import threading
+from pathlib import Path
+
+from .utils import LazyModule
+
+sqlite3 = LazyModule('sqlite3')
+
+_cache = None
+
+
+class DimensionCache:
+    """
+    The image size of each post, kept between runs.
+
+    The image of a post never changes, so its size only has to be fetched once. The database
+    is only opened when it is first used.
+    """
+    def __init__(self, path=None):
+        if not path:
+            path = Path.home() / '.note_copy' / 'dimensions.sqlite3'
+
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def _connect(self):
+        if self.connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # The connection is shared by the batch's threads, which take turns using the lock
+            self.connection = sqlite3.connect(str(self.path), timeout=30,
+                                              check_same_thread=False)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS dimensions ('
+                'domain TEXT NOT NULL, '
+                'post_id INTEGER NOT NULL, '
+                'width INTEGER NOT NULL, '
+                'height INTEGER NOT NULL, '
+                'PRIMARY KEY (domain, post_id))'
+            )
+
+        return self.connection
+
+    def get(self, domain, post_id):
+        """
+        :return: the width and height of the image of the post, if they were stored
+        :rtype: (int, int)|None
+        """
+        with self.lock:
+            row = self._connect().execute(
+                'SELECT width, height FROM dimensions WHERE domain = ? AND post_id = ?',
+                (domain, post_id),
+            ).fetchone()
+
+        return tuple(row) if row else None
+
+    def set(self, domain, post_id, dimensions):
+        """
+        Store the width and height of the image of the post.
+        """
+        width, height = dimensions
+
+        with self.lock:
+            connection = self._connect()
+
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO dimensions VALUES (?, ?, ?, ?)',
+                    (domain, post_id, width, height),
+                )
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def set_cache(cache):
+    """
+    Look up the image sizes of all posts in a cache before fetching them.
+
+    :param cache: the cache to use, or None to always fetch the sizes
+    :type cache: DimensionCache|None
+    """
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    """
+    :rtype: DimensionCache|None
+    """
+    return _cache
@@ -4,3 +4,19 @@ class NoSupportedSites(Exception):
 
 class UnsupportedSite(Exception):
     pass
+
+
+class SyncNotSupported(Exception):
+    pass
+
+
+class TagUpdateConflict(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class ResponseNotRecorded(Exception):
+    pass
@@ -0,0 +1,170 @@
+import math
+
+FIT_MODES = ('stretch', 'crop', 'letterbox')
+
+
+def round_half_up(value):
+    return math.floor(value + 0.5)
+
+
+def _round_edges(left, top, right, bottom):
+    return round_half_up(left), round_half_up(top), round_half_up(right), round_half_up(bottom)
+
+
+def _round_outward(left, top, right, bottom):
+    return math.floor(left), math.floor(top), math.ceil(right), math.ceil(bottom)
+
+
+def _truncate(left, top, right, bottom):
+    # Matches the behaviour of passing the scaled values straight to int()
+    x = int(left)
+    y = int(top)
+    return x, y, x + int(right - left), y + int(bottom - top)
+
+
+# Each policy turns the edges of a box into whole pixels. Rounding the edges instead of the
+# sizes keeps notes that touch in the source touching in the destination.
+ROUNDING_POLICIES = {
+    'round': _round_edges,
+    'outward': _round_outward,
+    'truncate': _truncate,
+}
+
+
+def aspect_ratios_match(source_dimensions, destination_dimensions):
+    """
+    Check whether one image could be a uniform resize of the other.
+
+    A resized image has its dimensions rounded to whole pixels, so the comparison allows the
+    destination to be off by a pixel in either direction.
+
+    :param source_dimensions: the width and height of the source image
+    :type source_dimensions: (int, int)
+    :param destination_dimensions: the width and height of the destination image
+    :type destination_dimensions: (int, int)
+    :rtype: bool
+    """
+    source_width, source_height = source_dimensions
+    width, height = destination_dimensions
+    expected_height = source_height * width / source_width
+    expected_width = source_width * height / source_height
+
+    return abs(expected_height - height) <= 1 or abs(expected_width - width) <= 1
+
+
+class Transform:
+    """
+    A mapping of note positions from one image onto another.
+
+    Coordinates are kept as floats through the whole mapping and are only turned into whole
+    pixels by the rounding policy when a note is applied.
+    """
+    def __init__(self, x_scale, y_scale, x_offset=0.0, y_offset=0.0, *, kind='resize',
+                 bounds=None):
+        self.x_scale = x_scale
+        self.y_scale = y_scale
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.kind = kind
+        self.bounds = bounds
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return 'note_copy.geometry.Transform({0}, {1}, {2}, {3}, kind={4!r})'.format(
+            self.x_scale,
+            self.y_scale,
+            self.x_offset,
+            self.y_offset,
+            self.kind,
+        )
+
+    def apply_to_box(self, x, y, width, height):
+        """
+        :return: the left, top, right and bottom edges of the transformed box, or None if the
+            box falls entirely outside of the destination image
+        :rtype: (float, float, float, float)|None
+        """
+        left = x * self.x_scale + self.x_offset
+        top = y * self.y_scale + self.y_offset
+        right = (x + width) * self.x_scale + self.x_offset
+        bottom = (y + height) * self.y_scale + self.y_offset
+
+        if self.bounds:
+            max_x, max_y = self.bounds
+            left, right = max(left, 0), min(right, max_x)
+            top, bottom = max(top, 0), min(bottom, max_y)
+
+            if left >= right or top >= bottom:
+                return None
+
+        return left, top, right, bottom
+
+    def apply(self, note, rounding='round'):
+        """
+        Create a copy of a note positioned on the destination image.
+
+        :param note: the note on the source image
+        :type note: Note
+        :param rounding: the name of the policy used to turn coordinates into whole pixels
+        :type rounding: str
+        :return: the transformed note, or None if it was cropped out of the destination
+        :rtype: Note|None
+        """
+        box = self.apply_to_box(note.x, note.y, note.width, note.height)
+
+        if box is None:
+            return None
+
+        left, top, right, bottom = ROUNDING_POLICIES[rounding](*box)
+        # Never let rounding collapse a note into something that cannot be seen or clicked
+        return type(note)(left, top, max(right - left, 1), max(bottom - top, 1), note.body)
+
+
+def get_transform(source_dimensions, destination_dimensions, fit='stretch'):
+    """
+    Compute the mapping of note positions between two versions of an image.
+
+    When the aspect ratios match, the destination is treated as a resize. Otherwise the
+    destination is either a crop or a letterboxed version of the source, which cannot be told
+    apart from the dimensions alone, so the fit mode decides how the notes are placed:
+        stretch: scale each axis independently, distorting the notes
+        crop: scale uniformly to cover the destination, centered, dropping notes cut off
+        letterbox: scale uniformly to fit inside the destination, centered
+
+    :param source_dimensions: the width and height of the source image
+    :type source_dimensions: (int, int)
+    :param destination_dimensions: the width and height of the destination image
+    :type destination_dimensions: (int, int)
+    :param fit: how to place notes when the aspect ratios differ
+    :type fit: str
+    :return: the transform for all notes between the two images
+    :rtype: Transform
+    """
+    if fit not in FIT_MODES:
+        raise ValueError("invalid fit mode: '{fit}'".format(fit=fit))
+
+    source_width, source_height = source_dimensions
+    width, height = destination_dimensions
+    x_scale = width / source_width
+    y_scale = height / source_height
+
+    if source_dimensions == destination_dimensions:
+        return Transform(1.0, 1.0, kind='identity')
+    elif aspect_ratios_match(source_dimensions, destination_dimensions):
+        return Transform(x_scale, y_scale, kind='resize')
+    elif fit == 'stretch':
+        return Transform(x_scale, y_scale, kind='stretch')
+
+    if fit == 'crop':
+        scale = max(x_scale, y_scale)
+        bounds = (width, height)
+    else:
+        scale = min(x_scale, y_scale)
+        bounds = None
+
+    x_offset = (width - source_width * scale) / 2
+    y_offset = (height - source_height * scale) / 2
+
+    return Transform(scale, scale, x_offset, y_offset, kind=fit, bounds=bounds)
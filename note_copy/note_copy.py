@@ -5,25 +5,37 @@ import sys
 import time
 from abc import ABCMeta
 from abc import abstractmethod
+from collections import Counter
+from contextlib import contextmanager
 from getpass import getpass
 from pathlib import Path
 from urllib.parse import quote
 
-import defusedxml.ElementTree as ET
-import requests
-from bs4 import BeautifulSoup
-from cached_property import cached_property
-
+from . import bodies
+from . import dimension_cache
+from . import geometry
+from . import profiling
+from . import tags
+from . import transport
+from . import writer
 from .exceptions import NoSupportedSites
+from .exceptions import TagUpdateConflict
 from .exceptions import UnsupportedSite
-from .utils import yes_no
+from .utils import LazyModule
+from .utils import cached_property
 from .utils import convert_xml_to_dict
+from .utils import yes_no
+
+ET = LazyModule('defusedxml.ElementTree')
+bs4 = LazyModule('bs4')
+requests = LazyModule('requests')
 
 TAGS_TO_REMOVE = [
     'translation_request',
     'partially_translated',
     'check_translation',
 ]
+TAG_EDITOR = tags.TagEditor(add=['translated'], remove=TAGS_TO_REMOVE)
 POST_PATTERN = re.compile(r'(\D+?)(\d+)')
 
 
@@ -65,10 +77,124 @@ class Note:
         return hash(repr(self))
 
 
+class NoteChange:
+    """
+    A note of a source post that was created, edited or deleted since a given time.
+    """
+    def __init__(self, note_id, note):
+        """
+        :param note_id: the ID of the note on its site
+        :type note_id: int
+        :param note: the note as it now is, or None if it was deleted
+        :type note: Note|None
+        """
+        self.note_id = note_id
+        self.note = note
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return 'note_copy.NoteChange({0}, {1!r})'.format(self.note_id, self.note)
+
+
+class CopyResult:
+    """
+    The outcome of copying notes from one post to another.
+    """
+    def __init__(self, source, destination):
+        """
+        :param source: the source post, or the string identifying it if it was never created
+        :type source: BooruPost|str
+        :param destination: the destination post, or the string identifying it
+        :type destination: BooruPost|str
+        """
+        self.source = source
+        self.destination = destination
+        self.notes_written = 0
+        # Notes that could not be placed on the destination image, or that another source
+        # copied to it at the same time already provides
+        self.notes_skipped = 0
+        # Notes that were sent but never showed up on the destination
+        self.notes_missing = 0
+        # Notes copied by an earlier sync that were edited or deleted to follow the source
+        self.notes_updated = 0
+        self.notes_deleted = 0
+        # Each source note that was written and the ID of its copy, if the destination says
+        self.copied_notes = []
+        self.warnings = []
+        self.error = None
+        # Seconds spent in each phase of the copy
+        self.timings = {}
+
+    def __repr__(self):
+        return '<CopyResult {src} -> {dest}: {outcome}>'.format(
+            src=self.source,
+            dest=self.destination,
+            outcome='ok' if self.ok else repr(self.error),
+        )
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def duration(self):
+        return sum(self.timings.values())
+
+    def timed(self, phase):
+        """
+        Add the time spent in the block to the total for the given phase.
+        """
+        return timed([self], phase)
+
+
+@contextmanager
+def timed(results, phase):
+    """
+    Add the time spent in the block to the given phase of several results that share it.
+
+    :type results: list[CopyResult]
+    """
+    start = time.monotonic()
+
+    try:
+        with profiling.scope(phase):
+            yield
+    finally:
+        elapsed = time.monotonic() - start
+
+        for result in results:
+            result.timings[phase] = result.timings.get(phase, 0) + elapsed
+
+
 class BooruPost(metaclass=ABCMeta):
     """
     A post on a booru-style imageboard.
     """
+    # How notes are placed when the destination is a crop or letterboxed version of the source
+    fit = 'stretch'
+    rounding = 'round'
+    # Rules converting note bodies from this site's markup and back
+    read_body_rules = ()
+    write_body_rules = ()
+    max_note_length = None
+    tag_editor = TAG_EDITOR
+    max_tag_update_attempts = 3
+    # Notes written in a burst before writes are spaced out by the cooldown, and how many
+    # writes may wait for a response at the same time
+    write_burst = 1
+    write_concurrency = 1
+    # How many of the site's posts may be read ahead of their copy at the same time
+    read_concurrency = 1
+    # Whether written notes are read back to find the ones the site did not save
+    verify_writes = True
+    # Whether notes can be edited and deleted, so synced notes can follow their source
+    edits_notes = False
+    max_write_attempts = 3
+    # Seconds to wait for a connection and for a response, so a hung socket cannot stall a batch
+    timeout = (10, 60)
+
     def __init__(self, post_id, *, mode='r', auth_dir=None):
         self.post_id = int(post_id)
         self.mode = mode
@@ -112,6 +238,22 @@ class BooruPost(metaclass=ABCMeta):
 
         return auth
 
+    def _request(self, method, url, raise_for_status=True, **kwargs):
+        """
+        Send a request to this post's site, retrying transient failures.
+
+        :param raise_for_status: whether to raise an exception for an error status
+        :type raise_for_status: bool
+        :rtype: requests.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        r = transport.request(self.domain, method, url, **kwargs)
+
+        if raise_for_status:
+            r.raise_for_status()
+
+        return r
+
     @abstractmethod
     def notes(self):
         """
@@ -125,59 +267,329 @@ class BooruPost(metaclass=ABCMeta):
         raise NotImplementedError
 
     @property
-    @abstractmethod
     def dimensions(self):
         """
-        :return: the x and y dimensions of the full-size image
+        The size is looked up in the dimension cache, if one is set, before fetching the
+        information of the post.
+
+        :return: the width and height of the full-size image
+        :rtype: (int, int)
+        """
+        cache = dimension_cache.get_cache()
+
+        if cache is None:
+            return self._get_dimensions()
+
+        dimensions = cache.get(self.domain, self.post_id)
+
+        if dimensions is None:
+            dimensions = self._get_dimensions()
+            cache.set(self.domain, self.post_id, dimensions)
+
+        return dimensions
+
+    @abstractmethod
+    def _get_dimensions(self):
+        """
+        Fetch the size of the image from the site.
+
         :rtype: (int, int)
         """
         raise NotImplementedError
 
+    def get_notes_updated_since(self, updated_at):
+        """
+        Fetch the notes that have been created, edited or deleted after the given time.
+
+        Sites that cannot filter notes by modification time do not override this.
+
+        :param updated_at: the timestamp of the last seen change, or None for all notes
+        :type updated_at: str|None
+        :return: the notes that changed and the timestamp of the latest change seen
+        :rtype: (list[NoteChange], str|None)
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def write_note(self, note):
         """
         Create a new note on this post that is a copy of the one provided.
         :param note: the note to be copied
         :type note: Note
+        :return: the ID of the new note, or None if the site does not tell it
+        :rtype: int|None
+        """
+        raise NotImplementedError
+
+    def update_note(self, note_id, note):
+        """
+        Replace a note of this post with the one provided.
+
+        Sites that cannot edit notes do not override this, and leave edits_notes unset.
+
+        :param note_id: the ID of the note to replace
+        :type note_id: int
+        :type note: Note
+        """
+        raise NotImplementedError
+
+    def delete_note(self, note_id):
+        """
+        Remove a note of this post.
+
+        :param note_id: the ID of the note to remove
+        :type note_id: int
         """
         raise NotImplementedError
 
+    @property
     @abstractmethod
+    def tag_string(self):
+        """
+        :return: the tags of the post as of when its information was last fetched
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def _submit_tags(self, tag_string, old_tag_string):
+        """
+        Replace the tags of the post, unless the post was edited after the old tags were read.
+
+        :param tag_string: the new tags
+        :type tag_string: str
+        :param old_tag_string: the tags that the new ones were derived from
+        :type old_tag_string: str
+        :return: the tags on the post after the edit
+        :rtype: str
+        """
+        raise NotImplementedError
+
     def update_tags(self):
         """
         Change the tags to indicate that the post is now translated.
+
+        Nothing is sent to the site when the tags are already correct. Edits are conditional on
+        the tags they were derived from, so when another edit happened in the meantime, the
+        rules are applied again to the current tags, up to a limited number of attempts. Each
+        edit takes its turn with the notes written to the site, under the same rate limit.
         """
-        raise NotImplementedError
+        tag_string = self.tag_string
+        limiter = transport.get_rate_limiter(self.domain, 1 / self.cooldown, self.write_burst)
+
+        for _ in range(self.max_tag_update_attempts):
+            diff = self.tag_editor.diff(tag_string)
+
+            if not diff:
+                return
+
+            limiter.acquire()
+            tag_string = self._submit_tags(diff.apply(tag_string), tag_string)
+
+        if self.tag_editor.diff(tag_string):
+            message = 'Tags of {post} kept changing during {attempts} attempts to update them'
+            raise TagUpdateConflict(message.format(
+                post=self,
+                attempts=self.max_tag_update_attempts,
+            ))
+
+    def _write_notes(self, notes, results):
+        """
+        Write the notes, then read back the notes of this post and write again the ones that
+        are missing.
+
+        The notes are read back once per attempt rather than once per note, so the check costs
+        a single request however many notes were written.
+
+        :param notes: the notes to write
+        :type notes: list[Note]
+        :param results: the results to record the time spent in
+        :type results: list[CopyResult]
+        :return: the notes that were still missing after the last attempt, and the ID of each
+            note that was written, if the site tells it
+        :rtype: (list[Note], list[int|None])
+        """
+        note_ids = [None] * len(notes)
+        # The positions of the notes left to write
+        missing = list(range(len(notes)))
+
+        for _ in range(self.max_write_attempts):
+            with timed(results, 'write'):
+                written_ids = writer.write_notes(self, [notes[i] for i in missing])
+
+            for i, note_id in zip(missing, written_ids):
+                note_ids[i] = note_id
+
+            if not self.verify_writes or not notes:
+                return [], note_ids
+
+            with timed(results, 'verify'):
+                # Invalidate the cached notes so the current ones are fetched
+                self.__dict__.pop('notes', None)
+                missing_notes = find_missing_notes([notes[i] for i in missing], self.notes)
+
+            missing_ids = {id(note) for note in missing_notes}
+            missing = [i for i in missing if id(notes[i]) in missing_ids]
 
-    def copy_notes_from_post(self, source_post):
+            if not missing:
+                break
+
+        for i in missing:
+            note_ids[i] = None
+
+        return [notes[i] for i in missing], note_ids
+
+    def _prepare_notes(self, source_post, notes, dimensions, result):
+        """
+        Place the notes of a source post on this post's image and convert their bodies.
+
+        :return: each note to write and the source note it was made from, without the ones
+            that fell outside of the image
+        :rtype: list[(Note, Note)]
+        """
+        with result.timed('read'):
+            if notes is None:
+                notes = source_post.notes
+
+            source_dimensions = source_post.dimensions
+
+        with result.timed('prepare'):
+            transform = geometry.get_transform(source_dimensions, dimensions, self.fit)
+            body_pipeline = bodies.get_pipeline(type(source_post), type(self))
+            prepared_notes = []
+
+            for source_note in notes:
+                note = transform.apply(source_note, self.rounding)
+
+                # Notes can fall outside of a cropped destination
+                if note is None:
+                    result.notes_skipped += 1
+                    continue
+
+                note.body = body_pipeline(note.body)
+                prepared_notes.append((note, source_note))
+
+        if transform.kind == 'stretch':
+            message = (
+                'the image on {dest} does not have the aspect ratio of {src}; it may be cropped '
+                'or letterboxed'
+            ).format(dest=self, src=source_post)
+
+            # A sync prepares the edited and the new notes of a source separately
+            if message not in result.warnings:
+                result.warnings.append(message)
+
+        return prepared_notes
+
+    def copy_notes_from_posts(self, source_posts, notes=None, results=None):
+        """
+        Write the notes of several source posts to this post in one session.
+
+        This post is only read once, the notes of all sources are written together, and the
+        tags are updated once at the end. A note that an earlier source already provides is
+        skipped. An error reading one source is stored in its result and the other sources
+        are still copied, while an error on this post is raised.
+
+        :param source_posts: the posts from which notes will be copied
+        :type source_posts: list[BooruPost]
+        :param notes: for each source, the subset of its notes to copy, or None for all of them
+        :type notes: list[list[Note]|None]|None
+        :param results: the results to record the copy from each source in
+        :type results: list[CopyResult]|None
+        :return: the outcome of the copy from each source
+        :rtype: list[CopyResult]
+        """
+        if notes is None:
+            notes = [None] * len(source_posts)
+
+        if results is None:
+            results = [CopyResult(source_post, self) for source_post in source_posts]
+
+        with timed(results, 'read'):
+            dimensions = self.dimensions
+
+        planned_notes = []
+
+        for source_post, source_notes, result in zip(source_posts, notes, results):
+            try:
+                prepared_notes = self._prepare_notes(source_post, source_notes, dimensions,
+                                                     result)
+            except Exception as e:
+                result.error = e
+                continue
+
+            planned = {note for note, _, _ in planned_notes}
+
+            for note, source_note in prepared_notes:
+                if note in planned:
+                    result.notes_skipped += 1
+                else:
+                    planned_notes.append((note, source_note, result))
+
+        copied_results = [result for result in results if result.ok]
+
+        if not copied_results:
+            return results
+
+        missing_notes, note_ids = self._write_notes([note for note, _, _ in planned_notes],
+                                                    copied_results)
+        missing_ids = {id(note) for note in missing_notes}
+
+        for (note, source_note, result), note_id in zip(planned_notes, note_ids):
+            if id(note) in missing_ids:
+                result.notes_missing += 1
+            else:
+                result.notes_written += 1
+                result.copied_notes.append((source_note, note_id))
+
+        for result in copied_results:
+            if result.notes_missing:
+                message = '{count} notes did not appear on {dest} after {attempts} attempts'
+                result.warnings.append(message.format(
+                    count=result.notes_missing,
+                    dest=self,
+                    attempts=self.max_write_attempts,
+                ))
+
+        if not self.verify_writes:
+            self.notes = [note for note, _, _ in planned_notes]
+
+        with timed(copied_results, 'tags'):
+            self.update_tags()
+
+        # Invalidate cached properties
+        del self.__dict__['post_info']
+
+        return results
+
+    def copy_notes_from_post(self, source_post, notes=None, result=None):
         """
         Write all notes in the source post to this post.
 
         By default, if the two posts have differently-sized images, it scales the notes
-        proportionally.
+        proportionally. The transform between the images is computed once for all notes and
+        placed according to the fit and rounding policies of this post. The bodies are
+        converted from the markup of the source site to the markup of this one. Afterwards the
+        notes of this post are read back, and the ones the site did not save are written again.
 
         :param source_post: the post from which notes will be copied
         :type source_post: BooruPost
+        :param notes: the subset of the source post's notes to copy, defaulting to all of them
+        :type notes: list[Note]|None
+        :param result: the result to record the copy in, if one was already started
+        :type result: CopyResult|None
+        :return: the number of notes copied and the time spent in each phase
+        :rtype: CopyResult
         """
-        copied_notes = []
-        for note in source_post.notes:
-            note = scale_note(note, source_post.dimensions, self.dimensions)
-            self.write_note(note)
-            copied_notes.append(note)
-            time.sleep(self.cooldown)
-
-        self.notes = copied_notes
-        self.update_tags()
-        message = 'Notes successfully copied from {src_site} #{src_id} to {dest_site} #{dest_id}'
-        print(message.format(
-            src_site=source_post.site_name,
-            src_id=source_post.post_id,
-            dest_site=self.site_name,
-            dest_id=self.post_id,
-        ))
+        if result is None:
+            result = CopyResult(source_post, self)
 
-        # Invalidate cached properties
-        del self.__dict__['post_info']
+        self.copy_notes_from_posts([source_post], notes=[notes], results=[result])
+
+        if result.error is not None:
+            raise result.error
+
+        return result
 
 
 class DanbooruPost(BooruPost):
@@ -187,8 +599,17 @@ class DanbooruPost(BooruPost):
     base_url = 'https://' + domain
     post_url = base_url + '/posts/{post_id}.json'
     note_url = base_url + '/notes.json'
+    edit_note_url = base_url + '/notes/{note_id}.json'
     uses_cookies = False
     cooldown = 1
+    # Danbooru lets members make a burst of ten API writes, then about one a second
+    write_burst = 10
+    write_concurrency = 4
+    read_body_rules = bodies.DANBOORU_READ_RULES
+    write_body_rules = bodies.DANBOORU_WRITE_RULES
+    edits_notes = True
+    # Without a limit, Danbooru only returns its default page of 20 notes
+    notes_per_page = 1000
 
     def get_auth_from_input(self):
         username = input('Username: ')
@@ -197,25 +618,79 @@ class DanbooruPost(BooruPost):
 
         return auth
 
-    @cached_property
-    def notes(self):
-        notes = []
+    @classmethod
+    def get_pages(cls, url, params, limit):
+        """
+        Page through a Danbooru index from the newest item to the oldest.
+
+        Pages are requested by the ID they start below rather than by number, so items added
+        in the meantime do not shift the pages and the last pages are as quick as the first.
+
+        :param limit: the number of items per page
+        :type limit: int
+        :rtype: iterator[list[dict]]
+        """
+        before = None
+
+        while True:
+            page_params = dict(params, limit=limit)
+
+            if before is not None:
+                page_params['page'] = 'b{0}'.format(before)
+
+            r = transport.request(cls.domain, 'get', url, params=page_params, timeout=cls.timeout)
+            r.raise_for_status()
+            items = r.json()
+
+            if items:
+                yield items
+
+            if len(items) < limit:
+                return
+
+            before = min(item['id'] for item in items)
+
+    def _get_api_notes(self, search):
         params = {'group_by': 'note', 'search[post_id]': self.post_id}
+        params.update(search)
         params.update(self.auth)
-        r = requests.get(self.note_url, params=params)
-        api_notes = r.json()
+        api_notes = []
+
+        for page in self.get_pages(self.note_url, params, self.notes_per_page):
+            api_notes.extend(page)
+
+        return api_notes
+
+    @cached_property
+    def notes(self):
+        api_notes = self._get_api_notes({'search[is_active]': 'true'})
+        return [Note(note['x'], note['y'], note['width'], note['height'], note['body'])
+                for note in api_notes]
+
+    def get_notes_updated_since(self, updated_at):
+        changes = []
+        search = {}
+
+        if updated_at:
+            search['search[updated_at]'] = '>' + updated_at
+
+        api_notes = self._get_api_notes(search)
+        latest_update = max((note['updated_at'] for note in api_notes), default=updated_at)
 
         for note in api_notes:
+            # Danbooru deletes a note by deactivating it
             if note['is_active']:
-                notes.append(Note(
+                changes.append(NoteChange(note['id'], Note(
                     note['x'],
                     note['y'],
                     note['width'],
                     note['height'],
                     note['body'],
-                ))
+                )))
+            else:
+                changes.append(NoteChange(note['id'], None))
 
-        return notes
+        return changes, latest_update
 
     @cached_property
     def post_info(self):
@@ -224,12 +699,11 @@ class DanbooruPost(BooruPost):
         :rtype: dict[str, str]
         """
         post_url = self.post_url.format(post_id=self.post_id)
-        r = requests.get(post_url, params=self.auth)
+        r = self._request('get', post_url, params=self.auth)
         return r.json()
 
-    @property
-    def dimensions(self):
-        return int(self.post_info['image_height']), int(self.post_info['image_width'])
+    def _get_dimensions(self):
+        return int(self.post_info['image_width']), int(self.post_info['image_height'])
 
     def write_note(self, note):
         payload = {
@@ -240,13 +714,47 @@ class DanbooruPost(BooruPost):
             'note[height]': note.height,
             'note[body]': note.body,
         }
-        requests.post(self.note_url, data=payload, params=self.auth)
+        r = self._request('post', self.note_url, data=payload, params=self.auth)
+        return r.json()['id']
 
-    def update_tags(self):
-        tag_string = change_tags(self.post_info['tag_string'])
-        payload = {'post[tag_string]': tag_string}
+    def update_note(self, note_id, note):
+        payload = {
+            'note[x]': note.x,
+            'note[y]': note.y,
+            'note[width]': note.width,
+            'note[height]': note.height,
+            'note[body]': note.body,
+        }
+        url = self.edit_note_url.format(note_id=note_id)
+        self._request('put', url, data=payload, params=self.auth)
+
+    def delete_note(self, note_id):
+        url = self.edit_note_url.format(note_id=note_id)
+        self._request('delete', url, params=self.auth)
+
+    @property
+    def tag_string(self):
+        return self.post_info['tag_string']
+
+    def _submit_tags(self, tag_string, old_tag_string):
+        # Given the old tags, Danbooru merges the difference into the current tags instead of
+        # overwriting edits made by others since they were read.
+        payload = {'post[tag_string]': tag_string, 'post[old_tag_string]': old_tag_string}
         post_url = self.post_url.format(post_id=self.post_id)
-        requests.put(post_url, data=payload, params=self.auth)
+        r = self._request('put', post_url, raise_for_status=False, data=payload,
+                          params=self.auth)
+
+        if r.ok:
+            return r.json()['tag_string']
+        elif r.status_code != 409:
+            # Only a conflict with another edit is worth another attempt
+            r.raise_for_status()
+
+        # Only the tags are needed to decide whether to try again
+        params = {'only': 'tag_string'}
+        params.update(self.auth)
+        r = self._request('get', post_url, params=params)
+        return r.json()['tag_string']
 
 
 class GelbooruPost(BooruPost):
@@ -262,6 +770,8 @@ class GelbooruPost(BooruPost):
     cooldown = 15  # Actual cooldown is 10 seconds, but give it a lot of wiggle room
     read_auth_keys = {'user_id', 'api_key'}
     write_auth_keys = {'user_id', 'pass_hash'}
+    read_body_rules = bodies.GELBOORU_READ_RULES
+    write_body_rules = bodies.GELBOORU_WRITE_RULES
 
     @property
     def read_auth(self):
@@ -288,7 +798,7 @@ class GelbooruPost(BooruPost):
     def _login(self, username, password):
         session = requests.session()
         payload = {'user': username, 'pass': password, 'submit': 'Log in'}
-        session.post(self.login_url, data=payload)
+        session.post(self.login_url, data=payload, timeout=self.timeout)
 
         return session
 
@@ -307,7 +817,7 @@ class GelbooruPost(BooruPost):
 
     def _get_post_info_from_api(self):
         post_url = self.api_post_url.format(post_id=self.post_id)
-        r = requests.get(post_url, params=self.read_auth)
+        r = self._request('get', post_url, params=self.read_auth)
         root = ET.fromstring(r.text)
         d = convert_xml_to_dict(root)
 
@@ -318,8 +828,11 @@ class GelbooruPost(BooruPost):
         # like a web browser. Part of this process involves using a CSRF token, which is only
         # provided in the HTML, so scraping the site is the only option.
         post_url = self.html_post_url.format(post_id=self.post_id)
-        r = requests.get(post_url, cookies=self.write_auth)
-        soup = BeautifulSoup(r.text, 'html.parser')
+        r = self._request('get', post_url, cookies=self.write_auth)
+        return self._parse_post_page(r.text, r.cookies['PHPSESSID'])
+
+    def _parse_post_page(self, html, session_id):
+        soup = bs4.BeautifulSoup(html, 'html.parser')
         names = ['title', 'source', 'uid', 'uname', 'csrf-token']
         post_info = {name: soup.find(attrs={'name': name}).attrs['value'] for name in names}
         rating = soup.find(attrs={'name': 'rating', 'checked': 'checked'}).attrs['value']
@@ -330,31 +843,29 @@ class GelbooruPost(BooruPost):
         img_attrs = soup.find('img', attrs={'id': 'image'}).attrs
         post_info['height'] = int(img_attrs['data-original-height'])
         post_info['width'] = int(img_attrs['data-original-width'])
-        post_info['PHPSESSID'] = r.cookies['PHPSESSID']
+        post_info['PHPSESSID'] = session_id
 
         return post_info
 
-    @property
-    def dimensions(self):
-        return self.post_info['height'], self.post_info['width']
+    def _get_dimensions(self):
+        return self.post_info['width'], self.post_info['height']
 
     @cached_property
     def notes(self):
         self.note_url = self.note_url.format(post_id=self.post_id)
         notes = []
-        r = requests.get(self.note_url, params=self.read_auth)
+        r = self._request('get', self.note_url, params=self.read_auth)
         root = ET.fromstring(r.text)
         d = convert_xml_to_dict(root)
         api_notes = d.get('notes', [])
 
         for note in api_notes:
-            body = note['body'].replace('<br />', '\n')
             notes.append(Note(
                 note['x'],
                 note['y'],
                 note['width'],
                 note['height'],
-                body,
+                note['body'],
             ))
 
         return notes
@@ -366,19 +877,24 @@ class GelbooruPost(BooruPost):
             'note[y]': note.y,
             'note[width]': note.width,
             'note[height]': note.height,
+            # The form is submitted the way the site's JavaScript sends it, percent-encoded
             'note[body]': quote(note.body),
             'note[post_id]': self.post_id,
         }
         url = self.base_url + '/public/note_save.php?id=-2'
-        requests.post(url, data=payload, cookies=self.write_auth)
+        self._request('post', url, data=payload, cookies=self.write_auth)
 
-    def update_tags(self):
+    @property
+    def tag_string(self):
+        return self.post_info['tags']
+
+    def _submit_tags(self, tag_string, old_tag_string):
         rating = self.post_info['rating']
         # None is an invalid value for Gelbooru, so make the title an empty string if not found
         title = self.post_info.get('title', '')
         source = self.post_info['source']
-        tag_string = change_tags(self.post_info['tags'])
         pconf = '1'
+        # Gelbooru refuses edits whose lupdated is older than the post's last change
         lupdated = self.post_info['change']
         submit = 'Save changes'
 
@@ -396,8 +912,18 @@ class GelbooruPost(BooruPost):
             'submit': submit,
         }
         url = self.base_url + '/public/edit_post.php'
-        cookies = {'PHPSESSID': self.post_info['PHPSESSID'], **self.write_auth}
-        requests.post(url, data=payload, cookies=cookies)
+        session_id = self.post_info['PHPSESSID']
+        cookies = {'PHPSESSID': session_id, **self.write_auth}
+        r = self._request('post', url, data=payload, cookies=cookies)
+
+        # The edit redirects back to the post, whose page holds both the current tags and the
+        # lupdated value needed for another attempt, so nothing else has to be fetched.
+        try:
+            self.post_info = self._parse_post_page(r.text, session_id)
+        except (AttributeError, KeyError):
+            self.post_info = self._get_post_info_from_html()
+
+        return self.tag_string
 
 
 def get_valid_classes():
@@ -448,23 +974,50 @@ def instantiate_post(valid_classes, post_string, mode='r'):
     raise UnsupportedSite('No supported site found for identifier: ' + site_identifier)
 
 
+def find_missing_notes(expected_notes, actual_notes):
+    """
+    Find the notes that are not on a post.
+
+    Notes are matched by position and size only, since sites may change the markup of a body
+    when saving it.
+
+    :param expected_notes: the notes that should be on the post
+    :type expected_notes: list[Note]
+    :param actual_notes: the notes that are on the post
+    :type actual_notes: list[Note]
+    :return: the expected notes without a matching note on the post
+    :rtype: list[Note]
+    """
+    def get_key(note):
+        return note.x, note.y, note.width, note.height
+
+    # Each note on the post can only account for one expected note
+    available = Counter(get_key(note) for note in actual_notes)
+    missing_notes = []
+
+    for note in expected_notes:
+        key = get_key(note)
+
+        if available[key]:
+            available[key] -= 1
+        else:
+            missing_notes.append(note)
+
+    return missing_notes
+
+
 def scale_note(source_note, source_dimensions, destination_dimensions):
     """
     Transforms a note to be proportional to the destination image.
 
+    When copying many notes between the same images, compute the transform once with
+    geometry.get_transform instead.
+
     :return: a new note
     :rtype: Note
     """
-    image_width, image_height = destination_dimensions
-    source_image_width, source_image_height = source_dimensions
-    x_ratio = image_width / source_image_width
-    y_ratio = image_height / source_image_height
-    scaled_width = source_note.width * x_ratio
-    scaled_height = source_note.height * y_ratio
-    scaled_x = source_note.x * x_ratio
-    scaled_y = source_note.y * y_ratio
-
-    return Note(scaled_x, scaled_y, scaled_width, scaled_height, source_note.body)
+    transform = geometry.get_transform(source_dimensions, destination_dimensions)
+    return transform.apply(source_note)
 
 
 def change_tags(tag_string):
@@ -476,8 +1029,4 @@ def change_tags(tag_string):
     :return: the modified tag string
     :rtype: str
     """
-    for tag in TAGS_TO_REMOVE:
-        tag_string = tag_string.replace(tag, '')
-
-    tag_string += ' translated'
-    return tag_string
+    return TAG_EDITOR.diff(tag_string).apply(tag_string)
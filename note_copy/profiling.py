@@ -0,0 +1,231 @@
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+from .utils import LazyModule
+
+cProfile = LazyModule('cProfile')
+pstats = LazyModule('pstats')
+
+SLEEP = 'sleep'
+NETWORK = 'network'
+
+_profiler = None
+
+
+class Profiler:
+    """
+    Profile the phases of a batch.
+
+    Each phase is run under cProfile, which counts the calls and time of every function. A
+    background thread also samples the stacks of the threads working on a phase, which gives
+    the whole stack needed for flame graphs. Samples taken while a thread sleeps or waits on
+    the network are marked as such, so that waiting is not mistaken for work.
+    """
+    def __init__(self, interval=0.005):
+        """
+        :param interval: the number of seconds between stack samples
+        :type interval: float
+        """
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.profiles = {}
+        self.stacks = Counter()
+        # The phase and the kind of wait each thread is in, by thread ID
+        self.phases = {}
+        self.waits = {}
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, name='note_copy-profiler',
+                                        daemon=True)
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    @contextmanager
+    def scope(self, phase):
+        thread_id = threading.get_ident()
+
+        # Scopes do not nest; the time belongs to the outermost phase
+        if thread_id in self.phases:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        self.phases[thread_id] = phase
+
+        try:
+            profile.enable()
+        except ValueError:
+            # Newer versions of Python only allow one active profile at a time, so concurrent
+            # phases are only sampled
+            profile = None
+
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+
+                with self.lock:
+                    self.profiles.setdefault(phase, []).append(profile)
+
+            del self.phases[thread_id]
+
+    @contextmanager
+    def waiting(self, kind):
+        thread_id = threading.get_ident()
+        self.waits[thread_id] = kind
+
+        try:
+            yield
+        finally:
+            self.waits.pop(thread_id, None)
+
+    def _sample(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+
+            for thread_id, phase in list(self.phases.items()):
+                frame = frames.get(thread_id)
+                stack = []
+
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{0} ({1})'.format(code.co_name,
+                                                    os.path.basename(code.co_filename)))
+                    frame = frame.f_back
+
+                stack.append(phase)
+                wait = self.waits.get(thread_id)
+
+                if wait:
+                    stack.insert(0, '[{0}]'.format(wait))
+
+                with self.lock:
+                    self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        """
+        Write the profile of each phase to a directory.
+
+        The directory gets a <phase>.pstats file for each phase, which can be read with the
+        pstats module or tools like snakeviz, a stacks.collapsed file that flamegraph.pl and
+        speedscope can draw, and a summary.txt of the time spent working and waiting in each
+        phase.
+
+        :param path: the directory to write to
+        :type path: str
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        for phase, profiles in sorted(self.profiles.items()):
+            stats = pstats.Stats(profiles[0])
+
+            for profile in profiles[1:]:
+                stats.add(profile)
+
+            stats.dump_stats(str(path / (phase + '.pstats')))
+
+        with (path / 'stacks.collapsed').open('w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{0} {1}\n'.format(stack, count))
+
+        samples = {}
+
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            kind = frames[-1][1:-1] if frames[-1].startswith('[') else 'cpu'
+            phase_samples = samples.setdefault(frames[0], Counter())
+            phase_samples[kind] += count
+
+        with (path / 'summary.txt').open('w') as f:
+            f.write('Seconds sampled in each phase\n')
+
+            for phase, counts in sorted(samples.items()):
+                f.write('{phase}: cpu {cpu:.2f}, sleep {sleep:.2f}, network {network:.2f}\n'.format(
+                    phase=phase,
+                    cpu=counts['cpu'] * self.interval,
+                    sleep=counts[SLEEP] * self.interval,
+                    network=counts[NETWORK] * self.interval,
+                ))
+
+
+def start(interval=0.005):
+    """
+    Start profiling every phase run from now on.
+
+    :rtype: Profiler
+    """
+    global _profiler
+    _profiler = Profiler(interval)
+    _profiler.start()
+    return _profiler
+
+
+def stop(path):
+    """
+    Stop profiling and write the profile to a directory.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    profiler.stop()
+    profiler.write(path)
+
+
+@contextmanager
+def scope(phase):
+    """
+    Attribute the time spent in the block to a phase, if profiling.
+    """
+    profiler = _profiler
+
+    if profiler is None:
+        yield
+    else:
+        with profiler.scope(phase):
+            yield
+
+
+@contextmanager
+def waiting(kind):
+    """
+    Mark the time spent in the block as waiting rather than working, if profiling.
+
+    :param kind: SLEEP or NETWORK
+    :type kind: str
+    """
+    profiler = _profiler
+
+    if profiler is None:
+        yield
+    else:
+        with profiler.waiting(kind):
+            yield
+
+
+def wrap(func):
+    """
+    Let a function run on another thread count towards the current thread's phase.
+
+    :type func: callable
+    :rtype: callable
+    """
+    profiler = _profiler
+    phase = profiler.phases.get(threading.get_ident()) if profiler else None
+
+    if phase is None:
+        return func
+
+    def wrapper(*args, **kwargs):
+        with profiler.scope(phase):
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,305 @@
+import json
+import re
+import threading
+import time
+from collections import Counter
+
+from . import batch
+from . import note_copy
+
+
+def count_pairs(pairs):
+    """
+    Count the pairs of a batch by the site of their destination, to know how much is left.
+
+    :param pairs: the source and destination post strings of each pair
+    :type pairs: iterable[(str, str)]
+    :return: the number of pairs of each site, by domain, with None for unknown sites
+    :rtype: Counter
+    """
+    domains = {}
+
+    for cls in note_copy.get_valid_classes():
+        domains[cls.short_code] = domains[cls.domain] = cls.domain
+
+    counts = Counter()
+
+    for _, destination in pairs:
+        matches = re.fullmatch(note_copy.POST_PATTERN, str(destination))
+        site_identifier = matches.group(1).lower() if matches else None
+        counts[domains.get(site_identifier)] += 1
+
+    return counts
+
+
+class SiteProgress:
+    """
+    The pairs and notes a batch has copied to one site.
+    """
+    def __init__(self, domain, total=None):
+        self.domain = domain
+        self.total = total
+        self.pairs = 0
+        self.notes = 0
+
+    def get_eta(self, elapsed, rate):
+        """
+        Estimate the time left from the notes of the remaining pairs.
+
+        The remaining pairs are assumed to have as many notes as the finished ones, and to be
+        written at the speed seen so far, but never faster than the site's rate.
+
+        :param elapsed: the seconds since the batch started
+        :type elapsed: float
+        :param rate: the number of notes the site accepts a second
+        :type rate: float
+        :return: the seconds left, or None if nothing is known yet
+        :rtype: float|None
+        """
+        if self.total is None:
+            return None
+
+        remaining = max(0, self.total - self.pairs)
+
+        if not remaining:
+            return 0
+        elif not self.pairs:
+            return None
+        elif not self.notes:
+            return remaining * elapsed / self.pairs
+
+        remaining_notes = remaining * self.notes / self.pairs
+        return remaining_notes / min(self.notes / elapsed, rate)
+
+
+class ProgressReporter:
+    """
+    Show how fast a batch is going and when it should end.
+
+    It is given to the batch as its progress callback. Each event only updates a few counters;
+    the figures are only computed and shown once the interval has passed since they were last
+    shown, so following the progress costs next to nothing per pair. Once started, a timer
+    also shows them between events, so cooldowns and the time left keep moving while a slow
+    site holds up the batch.
+    """
+    interval = 1
+
+    def __init__(self, stream, *, totals=None, interval=None):
+        """
+        :param stream: where to show the progress
+        :type stream: io.TextIOBase
+        :param totals: the number of pairs of each site, by domain, as counted by count_pairs
+        :type totals: Counter|None
+        :param interval: the least number of seconds between two updates
+        :type interval: float|None
+        """
+        self.stream = stream
+        self.totals = totals
+        self.total = sum(totals.values()) if totals is not None else None
+
+        if interval is not None:
+            self.interval = interval
+
+        self.rates = {cls.domain: 1 / cls.cooldown for cls in note_copy.get_valid_classes()}
+        self.sites = {}
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.shown_at = None
+        self.last_event = None
+        # Events and the timer come from different threads, and share the stream
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.timer = None
+
+    def start(self):
+        """
+        Show the progress every interval, whether or not pairs finish in the meantime.
+        """
+        # Without an interval, every event already shows the progress
+        if self.interval > 0:
+            self.timer = threading.Thread(target=self._run_timer, daemon=True)
+            self.timer.start()
+
+    def _run_timer(self):
+        while True:
+            with self.lock:
+                if self.shown_at is None:
+                    delay = 0
+                else:
+                    delay = self.shown_at + self.interval - time.monotonic()
+
+            if self.stopped.wait(max(delay, 0)):
+                return
+
+            with self.lock:
+                self.update()
+
+    def update(self):
+        """
+        Show the figures if the interval has passed since they were last shown.
+
+        The lock must be held.
+        """
+        now = time.monotonic()
+
+        if self.shown_at is None or now - self.shown_at >= self.interval:
+            self.shown_at = now
+            self.show(self.get_snapshot())
+
+    def get_site(self, domain):
+        if domain not in self.sites:
+            total = self.totals.get(domain, 0) if self.totals is not None else None
+            self.sites[domain] = SiteProgress(domain, total)
+
+        return self.sites[domain]
+
+    def __call__(self, event):
+        with self.lock:
+            self.last_event = event
+
+            if event.kind == batch.ProgressEvent.FINISHED:
+                result = event.result
+                self.completed = event.completed
+
+                if not result.ok:
+                    self.failed += 1
+
+                if isinstance(result.destination, note_copy.BooruPost):
+                    site = self.get_site(result.destination.domain)
+                    site.pairs += 1
+                    site.notes += result.notes_written
+
+            self.update()
+
+    def get_snapshot(self):
+        """
+        :return: the progress of the batch and of each site
+        :rtype: dict
+        """
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        status = self.last_event.get_site_status() if self.last_event else {}
+
+        if self.totals is not None:
+            for domain in self.totals:
+                if domain is not None:
+                    self.get_site(domain)
+
+        sites = {}
+        etas = []
+
+        for domain, site in sorted(self.sites.items()):
+            queued, cooldown = status.get(domain, (0, 0))
+            eta = site.get_eta(elapsed, self.rates.get(domain, float('inf')))
+            etas.append(eta)
+            sites[domain] = {
+                'pairs_done': site.pairs,
+                'pairs_total': site.total,
+                'notes': site.notes,
+                'notes_per_second': round(site.notes / elapsed, 2),
+                'queued': queued,
+                'cooldown': round(cooldown, 1),
+                'eta': _round(eta),
+            }
+
+        # Sites are worked on side by side, so the batch ends with its slowest site
+        eta = None
+
+        if self.total is not None and etas and None not in etas:
+            eta = max(etas)
+
+        return {
+            'elapsed': round(elapsed, 1),
+            'pairs_done': self.completed,
+            'pairs_total': self.total,
+            'pairs_failed': self.failed,
+            'pairs_per_second': round(self.completed / elapsed, 2),
+            'eta': _round(eta),
+            'sites': sites,
+        }
+
+    def show(self, snapshot):
+        raise NotImplementedError
+
+    def clear(self):
+        """
+        Make way for a message to be printed.
+
+        The lock must be held until the message is printed, so the timer does not draw over it.
+        """
+
+    def close(self):
+        """
+        Stop the timer and show the final figures.
+        """
+        self.stopped.set()
+
+        if self.timer is not None:
+            self.timer.join()
+
+        with self.lock:
+            self.show(self.get_snapshot())
+
+
+class TTYProgress(ProgressReporter):
+    """
+    Show the progress on a single line of a terminal that is redrawn in place.
+    """
+    interval = 0.5
+
+    def show(self, snapshot):
+        parts = ['{done}{total} pairs, {rate:.2f}/s, ETA {eta}'.format(
+            done=snapshot['pairs_done'],
+            total='/{0}'.format(snapshot['pairs_total']) if snapshot['pairs_total'] else '',
+            rate=snapshot['pairs_per_second'],
+            eta=format_duration(snapshot['eta']),
+        )]
+
+        if snapshot['pairs_failed']:
+            parts[0] += ', {0} failed'.format(snapshot['pairs_failed'])
+
+        for domain, site in snapshot['sites'].items():
+            parts.append('{domain} {rate:.2f} notes/s, {queued} queued, cooldown {cooldown}s'
+                         .format(domain=domain, rate=site['notes_per_second'], **site))
+
+        self.stream.write('\r' + ' | '.join(parts) + '\x1b[K')
+        self.stream.flush()
+
+    def clear(self):
+        self.stream.write('\r\x1b[K')
+        # Draw the line again below the message as soon as possible
+        self.shown_at = None
+
+    def close(self):
+        super().close()
+
+        with self.lock:
+            self.stream.write('\n')
+
+
+class JSONProgress(ProgressReporter):
+    """
+    Write the progress as a JSON object per line, for logs.
+    """
+    interval = 10
+
+    def show(self, snapshot):
+        self.stream.write(json.dumps(snapshot, sort_keys=True) + '\n')
+        self.stream.flush()
+
+
+def format_duration(seconds):
+    """
+    :return: the duration as hours, minutes and seconds, or -- if it is not known
+    :rtype: str
+    """
+    if seconds is None:
+        return '--'
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{0}:{1:02}:{2:02}'.format(hours, minutes, seconds)
+
+
+def _round(seconds):
+    return round(seconds, 1) if seconds is not None else None
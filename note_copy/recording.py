@@ -0,0 +1,174 @@
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
+
+from .exceptions import ResponseNotRecorded
+from .utils import LazyModule
+
+requests = LazyModule('requests')
+
+RECORD = 'record'
+REPLAY = 'replay'
+# Credentials are left out of recordings, so they can be shared and replayed with any account
+SECRET_FIELDS = {'login', 'api_key', 'user_id', 'pass_hash', 'password'}
+# Form tokens change with every session and are redacted from recorded pages, so a replayed
+# request sends the placeholder instead of the token it was recorded with
+KEY_IGNORED_FIELDS = SECRET_FIELDS | {'csrf-token'}
+# The body is stored decoded, so these no longer describe it, and cookies are kept apart
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'set-cookie'}
+# Stands in for session cookies and form tokens, which replaying only needs to be present
+PLACEHOLDER = 'REDACTED'
+# The tags of pages that hold a token for their forms, and the attribute with its value
+TOKEN_TAG = re.compile(rb'<[^>]*\bname=["\']csrf-token["\'][^>]*>')
+TOKEN_VALUE = re.compile(rb'\b(value|content)=(["\'])[^"\']*\2')
+
+
+def _without_secrets(items, ignored_fields=SECRET_FIELDS):
+    return sorted((str(k), str(v)) for k, v in items if k not in ignored_fields)
+
+
+def redact_url(url):
+    """
+    :return: the URL without credentials in its query string
+    :rtype: str
+    """
+    parts = urlsplit(url)
+    query = urlencode(_without_secrets(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit(parts._replace(query=query))
+
+
+def redact_body(content):
+    """
+    :return: the body of a response without the values of its CSRF tokens
+    :rtype: bytes
+    """
+    replacement = rb'\1=\2' + PLACEHOLDER.encode('ascii') + rb'\2'
+    return TOKEN_TAG.sub(lambda tag: TOKEN_VALUE.sub(replacement, tag.group(0)), content)
+
+
+def get_key(method, url, params=None, data=None):
+    """
+    Identify a request by everything that decides its response except the credentials.
+
+    Cookies are left out, since they only hold credentials and session IDs, and so are form
+    tokens.
+
+    :rtype: str
+    """
+    request = {
+        'method': method.upper(),
+        'url': redact_url(url),
+        'params': _without_secrets((params or {}).items(), KEY_IGNORED_FIELDS),
+        'data': _without_secrets((data or {}).items(), KEY_IGNORED_FIELDS),
+    }
+    encoded = json.dumps(request, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseStore:
+    """
+    A directory of recorded responses, which can stand in for the sites.
+
+    Responses are listed in index.jsonl in the order they were received, and their bodies are
+    kept in separate files. The same request can be recorded several times, such as the notes
+    of a post before and after writing to it; replaying serves the recordings in order, then
+    keeps serving the last one.
+    """
+    def __init__(self, path, mode):
+        """
+        :param path: the directory of the recording
+        :type path: str
+        :param mode: RECORD to add the responses received to the store, or REPLAY to answer
+            requests from it
+        :type mode: str
+        """
+        self.path = Path(path)
+        self.mode = mode
+        self.lock = threading.Lock()
+        # The recorded responses to each request, and how many of them were used so far
+        self.entries = {}
+        self.uses = {}
+
+        try:
+            with (self.path / 'index.jsonl').open('r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry['key'], []).append(entry)
+        except FileNotFoundError:
+            if mode == REPLAY:
+                raise
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def record(self, method, url, response, params=None, data=None, **kwargs):
+        """
+        Add a response to the store.
+
+        :type response: requests.Response
+        """
+        key = get_key(method, url, params, data)
+        headers = {
+            k: v for k, v in response.headers.items() if k.lower() not in DROPPED_HEADERS
+        }
+
+        with self.lock:
+            entries = self.entries.setdefault(key, [])
+            entry = {
+                'key': key,
+                'method': method.upper(),
+                'url': redact_url(response.url or url),
+                'status': response.status_code,
+                'reason': response.reason,
+                'headers': headers,
+                'cookies': {name: PLACEHOLDER for name in response.cookies.keys()},
+                'body': '{0}-{1}'.format(key, len(entries)),
+            }
+            entries.append(entry)
+            bodies = self.path / 'bodies'
+            bodies.mkdir(parents=True, exist_ok=True)
+
+            with (bodies / entry['body']).open('wb') as f:
+                f.write(redact_body(response.content))
+
+            with (self.path / 'index.jsonl').open('a') as f:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def replay(self, method, url, params=None, data=None, **kwargs):
+        """
+        Answer a request with the response recorded for it.
+
+        :rtype: requests.Response
+        """
+        key = get_key(method, url, params, data)
+
+        with self.lock:
+            entries = self.entries.get(key)
+
+            if not entries:
+                message = 'No response recorded for {0} {1}'.format(method.upper(), url)
+                raise ResponseNotRecorded(message)
+
+            use = self.uses.get(key, 0)
+            self.uses[key] = use + 1
+            entry = entries[min(use, len(entries) - 1)]
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.url = entry['url']
+        response.headers = requests.structures.CaseInsensitiveDict(entry['headers'])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.cookies = requests.cookies.cookiejar_from_dict(entry['cookies'])
+
+        with (self.path / 'bodies' / entry['body']).open('rb') as f:
+            response._content = f.read()
+
+        return response
@@ -0,0 +1,331 @@
+import json
+import re
+import socketserver
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from pathlib import Path
+
+from . import batch
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """
+    The pairs submitted to the server and their outcome, kept in an SQLite database so that
+    queued jobs survive a restart.
+    """
+    def __init__(self, path=None):
+        if not path:
+            path = Path.home() / '.note_copy' / 'jobs.sqlite3'
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        # The connection is shared by the request and worker threads, which take turns
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY, '
+                'source TEXT NOT NULL, '
+                'destination TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'notes_written INTEGER, '
+                'warnings TEXT, '
+                'error TEXT, '
+                'submitted_at REAL NOT NULL, '
+                'finished_at REAL)'
+            )
+            # Jobs that were running when the server stopped never finished
+            self.connection.execute(
+                'UPDATE jobs SET status = ? WHERE status = ?',
+                (QUEUED, RUNNING),
+            )
+
+    def submit(self, pairs):
+        """
+        Queue pairs of posts to copy notes between.
+
+        :param pairs: the source and destination post strings of each pair
+        :type pairs: list[(str, str)]
+        :return: the ID of the job of each pair
+        :rtype: list[int]
+        """
+        job_ids = []
+
+        with self.lock, self.connection:
+            for source, destination in pairs:
+                cursor = self.connection.execute(
+                    'INSERT INTO jobs (source, destination, status, submitted_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (source, destination, QUEUED, time.time()),
+                )
+                job_ids.append(cursor.lastrowid)
+
+        return job_ids
+
+    def claim_group(self):
+        """
+        Take the oldest queued job, along with every other queued job for its destination, so
+        they can be copied in one session.
+
+        :return: the ID, source and destination of each job, or nothing if none are queued
+        :rtype: list[(int, str, str)]
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT destination FROM jobs WHERE status = ? ORDER BY id LIMIT 1',
+                (QUEUED,),
+            ).fetchone()
+
+            if row is None:
+                return []
+
+            rows = self.connection.execute(
+                'SELECT id, source, destination FROM jobs '
+                'WHERE status = ? AND destination = ? ORDER BY id',
+                (QUEUED, row['destination']),
+            ).fetchall()
+            self.connection.executemany(
+                'UPDATE jobs SET status = ? WHERE id = ?',
+                [(RUNNING, r['id']) for r in rows],
+            )
+
+        return [(r['id'], r['source'], r['destination']) for r in rows]
+
+    def finish(self, job_id, result):
+        """
+        Record the outcome of a job.
+
+        :type job_id: int
+        :type result: note_copy.CopyResult
+        """
+        error = None
+
+        if not result.ok:
+            error = '{0}: {1}'.format(type(result.error).__name__, result.error)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'UPDATE jobs SET status = ?, notes_written = ?, warnings = ?, error = ?, '
+                'finished_at = ? WHERE id = ?',
+                (
+                    DONE if result.ok else FAILED,
+                    result.notes_written,
+                    json.dumps(result.warnings),
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id):
+        """
+        :return: the state of a job, or None if there is no such job
+        :rtype: dict|None
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM jobs WHERE id = ?',
+                                          (job_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['warnings'] = json.loads(job['warnings']) if job['warnings'] else []
+        return job
+
+    def count(self):
+        """
+        :return: the number of jobs in each status
+        :rtype: dict[str, int]
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status'
+            ).fetchall()
+
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class Worker:
+    """
+    Copy the notes of queued jobs until stopped.
+
+    All jobs go through one batch, so the process has a single throttle per site and keeps its
+    connections open between jobs.
+    """
+    def __init__(self, queue, *, poll_interval=5, **batch_options):
+        """
+        :param queue: the queue to take jobs from
+        :type queue: JobQueue
+        :param poll_interval: the longest time to wait before checking the queue again, in
+            case jobs were added to the database by something other than this worker
+        :type poll_interval: float
+        :param batch_options: the options of the batch the jobs are copied in, such as
+            concurrency or destination_options, as taken by batch.copy_batch
+        """
+        self.queue = queue
+        self.batch_options = batch_options
+        self.poll_interval = poll_interval
+        self.condition = threading.Condition()
+        self.stopped = False
+        # The job of each pair that was handed to the batch, by its index in the batch
+        self.job_ids = {}
+        self.next_index = 0
+
+    def submit(self, pairs):
+        """
+        Queue pairs and wake up the worker.
+
+        :rtype: list[int]
+        """
+        job_ids = self.queue.submit(pairs)
+
+        with self.condition:
+            self.condition.notify()
+
+        return job_ids
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def _groups(self):
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+
+                group = self.queue.claim_group()
+
+                if not group:
+                    self.condition.wait(self.poll_interval)
+                    continue
+
+            for job_id, _, _ in group:
+                self.job_ids[self.next_index] = job_id
+                self.next_index += 1
+
+            yield [(source, destination) for _, source, destination in group]
+
+    def _on_progress(self, event):
+        if event.kind == batch.ProgressEvent.FINISHED:
+            self.queue.finish(self.job_ids.pop(event.index), event.result)
+
+    def run(self):
+        """
+        Work on jobs until stop is called, then finish the jobs that were started.
+        """
+        results = batch.iter_copy_groups(self._groups(), on_progress=self._on_progress,
+                                         **self.batch_options)
+
+        for _ in results:
+            pass
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    The API of the server.
+
+    POST /jobs with {"pairs": [["d1234", "g5678"], ...]} queues pairs and returns the IDs of
+    their jobs, GET /jobs/<id> returns the state of a job, and GET /jobs returns the number of
+    jobs in each status.
+    """
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        worker = self.server.worker
+
+        if self.path == '/jobs':
+            self.send_json(200, worker.queue.count())
+            return
+
+        matches = re.fullmatch(r'/jobs/(\d+)', self.path)
+        job = worker.queue.get(int(matches.group(1))) if matches else None
+
+        if job is None:
+            self.send_json(404, {'error': 'not found'})
+        else:
+            self.send_json(200, job)
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self.send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+            pairs = [(str(source), str(destination)) for source, destination in body['pairs']]
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {'error': 'expected {"pairs": [[source, destination], ...]}'})
+            return
+
+        job_ids = self.server.worker.submit(pairs)
+        self.send_json(202, {'jobs': job_ids})
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+
+        return 'unix'
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(worker, *, host='127.0.0.1', port=8080, socket_path=None):
+    """
+    Create the HTTP server for the API, listening on a TCP port or on a Unix socket.
+
+    :param worker: the worker that jobs are submitted to
+    :type worker: Worker
+    :param socket_path: the path of a Unix socket to listen on instead of the port
+    :type socket_path: str|None
+    :rtype: socketserver.BaseServer
+    :raises FileExistsError: if something other than a socket is at the socket path
+    """
+    if socket_path:
+        path = Path(socket_path)
+
+        # A socket left behind by a server that was killed would stop this one from binding
+        if path.is_socket():
+            path.unlink()
+        elif path.exists():
+            raise FileExistsError('{0} exists and is not a socket'.format(socket_path))
+
+        http_server = ThreadingUnixHTTPServer(socket_path, RequestHandler)
+    else:
+        http_server = ThreadingHTTPServer((host, port), RequestHandler)
+
+    http_server.worker = worker
+    return http_server
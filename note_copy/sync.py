@@ -0,0 +1,257 @@
+import json
+import threading
+from pathlib import Path
+
+from . import transport
+from .exceptions import SyncNotSupported
+from .note_copy import CopyResult
+
+
+class SyncState:
+    """
+    The timestamp of the latest note change already copied for each pair of posts, and the
+    notes copied so far, so that their copies can follow later edits.
+    """
+    def __init__(self, path=None):
+        if not path:
+            path = Path.home() / '.note_copy' / 'sync_state.json'
+
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+        try:
+            with self.path.open('r') as f:
+                self.pairs = json.load(f)
+        except FileNotFoundError:
+            self.pairs = {}
+
+    @staticmethod
+    def get_key(source_post, destination_post):
+        """
+        :return: a key identifying the pair of posts, written as post strings
+        :rtype: str
+        """
+        return '{src.domain}{src.post_id} {dest.domain}{dest.post_id}'.format(
+            src=source_post,
+            dest=destination_post,
+        )
+
+    def _get_pair(self, source_post, destination_post):
+        pair = self.pairs.get(self.get_key(source_post, destination_post), {})
+
+        # Older states only kept the timestamp
+        if isinstance(pair, str):
+            pair = {'updated_at': pair}
+
+        return pair
+
+    def get(self, source_post, destination_post):
+        """
+        :return: the timestamp of the last note change copied between the posts, if any
+        :rtype: str|None
+        """
+        return self._get_pair(source_post, destination_post).get('updated_at')
+
+    def get_notes(self, source_post, destination_post):
+        """
+        :return: the ID of the copy of each note copied between the posts, by the ID of the
+            source note as a string, with None for copies whose ID the destination did not tell
+        :rtype: dict[str, int|None]
+        """
+        return dict(self._get_pair(source_post, destination_post).get('notes', {}))
+
+    def set(self, source_post, destination_post, updated_at, notes=None):
+        """
+        Record the timestamp of the last note change copied and persist the state.
+
+        The state is written after every pair so that an interrupted batch does not recopy
+        the pairs that had already been synced.
+
+        :param notes: the notes copied between the posts, as returned by get_notes, or None to
+            keep the recorded ones
+        :type notes: dict[str, int|None]|None
+        """
+        with self.lock:
+            pair = self._get_pair(source_post, destination_post)
+            pair['updated_at'] = updated_at
+
+            if notes is not None:
+                pair['notes'] = notes
+
+            self.pairs[self.get_key(source_post, destination_post)] = pair
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+            with self.path.open('w') as f:
+                json.dump(self.pairs, f, indent=2, sort_keys=True)
+
+
+def update_copied_notes(source_post, destination_post, changes, copied_notes, result):
+    """
+    Edit or delete the copies of notes that changed on the source since they were copied.
+
+    Copies are left alone with a warning when the destination cannot edit its notes or did
+    not tell their IDs, rather than being copied again next to the old ones.
+
+    :param changes: the changes to notes that were already copied
+    :type changes: list[NoteChange]
+    :param copied_notes: the notes copied between the posts, as returned by SyncState.get_notes,
+        which is updated as copies are deleted
+    :type copied_notes: dict[str, int|None]
+    :type result: CopyResult
+    """
+    refused = [change for change in changes
+               if not destination_post.edits_notes or copied_notes[str(change.note_id)] is None]
+    changes = [change for change in changes if change not in refused]
+
+    if refused:
+        message = (
+            '{count} notes edited or deleted on {src} were not changed on {dest}, which cannot '
+            'edit the notes copied to it'
+        )
+        result.warnings.append(message.format(
+            count=len(refused),
+            src=source_post,
+            dest=destination_post,
+        ))
+
+    if not changes:
+        return
+
+    edits = [change for change in changes if change.note is not None]
+    prepared_notes = {}
+
+    if edits:
+        with result.timed('read'):
+            dimensions = destination_post.dimensions
+
+        prepared = destination_post._prepare_notes(source_post, [c.note for c in edits],
+                                                   dimensions, result)
+        prepared_notes = {id(source_note): note for note, source_note in prepared}
+
+    limiter = transport.get_rate_limiter(destination_post.domain, 1 / destination_post.cooldown,
+                                         destination_post.write_burst)
+
+    with result.timed('write'):
+        for change in changes:
+            key = str(change.note_id)
+
+            if change.note is None:
+                limiter.acquire()
+                destination_post.delete_note(copied_notes.pop(key))
+                result.notes_deleted += 1
+            elif id(change.note) in prepared_notes:
+                limiter.acquire()
+                destination_post.update_note(copied_notes[key], prepared_notes[id(change.note)])
+                result.notes_updated += 1
+
+
+def sync_notes_to_post(source_posts, destination_post, state, results=None):
+    """
+    Copy only the notes of each source post that changed since the pair was last synced, in
+    one session on the destination.
+
+    Notes created on a source are copied, while the copies of notes that were edited or
+    deleted are edited or deleted along with them. An error with one source is stored in its
+    result and the other sources are still synced.
+
+    :param source_posts: the posts from which notes will be copied
+    :type source_posts: list[BooruPost]
+    :param destination_post: the post to which notes will be copied
+    :type destination_post: BooruPost
+    :param state: the record of previous syncs
+    :type state: SyncState
+    :param results: the results to record the sync from each source in
+    :type results: list[CopyResult]|None
+    :return: the outcome of the sync from each source
+    :rtype: list[CopyResult]
+    """
+    if results is None:
+        results = [CopyResult(source_post, destination_post) for source_post in source_posts]
+
+    syncs = []
+
+    for source_post, result in zip(source_posts, results):
+        last_update = state.get(source_post, destination_post)
+
+        with result.timed('read'):
+            try:
+                changes, latest_update = source_post.get_notes_updated_since(last_update)
+            except NotImplementedError:
+                message = '{0} does not support finding changed notes'
+                result.error = SyncNotSupported(message.format(source_post.site_name))
+                continue
+            except Exception as e:
+                result.error = e
+                continue
+
+        copied_notes = state.get_notes(source_post, destination_post)
+        # Notes deleted before they were ever copied need nothing
+        new_changes = [change for change in changes
+                       if str(change.note_id) not in copied_notes and change.note is not None]
+        copied_changes = [change for change in changes if str(change.note_id) in copied_notes]
+
+        try:
+            update_copied_notes(source_post, destination_post, copied_changes, copied_notes,
+                                result)
+        except Exception as e:
+            result.error = e
+            continue
+
+        syncs.append((source_post, new_changes, result, last_update, latest_update,
+                      copied_notes))
+
+    changed = [sync for sync in syncs if sync[1]]
+
+    if changed:
+        destination_post.copy_notes_from_posts(
+            [sync[0] for sync in changed],
+            notes=[[change.note for change in sync[1]] for sync in changed],
+            results=[sync[2] for sync in changed],
+        )
+
+    for source_post, new_changes, result, last_update, latest_update, copied_notes in syncs:
+        if not result.ok:
+            continue
+
+        note_ids = {id(change.note): str(change.note_id) for change in new_changes}
+
+        for source_note, note_id in result.copied_notes:
+            copied_notes[note_ids[id(source_note)]] = note_id
+
+        # Notes that never showed up on the destination are found again by the next sync, while
+        # the ones that did are recorded so that they are not copied twice
+        if result.notes_missing:
+            state.set(source_post, destination_post, last_update, copied_notes)
+        elif latest_update and latest_update != last_update:
+            state.set(source_post, destination_post, latest_update, copied_notes)
+
+    return results
+
+
+def sync_notes(source_post, destination_post, state, result=None):
+    """
+    Copy only the notes of the source post that changed since the pair was last synced.
+
+    The first sync of a pair copies every note. Later syncs copy the new notes of the source,
+    and edit or delete the copies of the notes that were edited or deleted on it.
+
+    :param source_post: the post from which notes will be copied
+    :type source_post: BooruPost
+    :param destination_post: the post to which notes will be copied
+    :type destination_post: BooruPost
+    :param state: the record of previous syncs
+    :type state: SyncState
+    :param result: the result to record the sync in, if one was already started
+    :type result: CopyResult|None
+    :return: the number of notes copied and the time spent in each phase
+    :rtype: CopyResult
+    """
+    if result is None:
+        result = CopyResult(source_post, destination_post)
+
+    sync_notes_to_post([source_post], destination_post, state, results=[result])
+
+    if result.error is not None:
+        raise result.error
+
+    return result
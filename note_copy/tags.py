@@ -0,0 +1,106 @@
+class TagDiff:
+    """
+    The tags to add to and remove from a post.
+    """
+    def __init__(self, added=(), removed=()):
+        self.added = tuple(added)
+        self.removed = tuple(removed)
+
+    def __bool__(self):
+        return bool(self.added or self.removed)
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return 'note_copy.tags.TagDiff(added={0!r}, removed={1!r})'.format(
+            self.added,
+            self.removed,
+        )
+
+    def __str__(self):
+        return ' '.join(list(self.added) + ['-' + tag for tag in self.removed])
+
+    def apply(self, tag_string):
+        """
+        :param tag_string: space-delimited list of tags
+        :type tag_string: str
+        :return: the tags with the diff applied, keeping the original order of existing tags
+        :rtype: str
+        """
+        removed = set(self.removed)
+        tags = [tag for tag in tag_string.split() if tag not in removed]
+        present = set(tags)
+        tags.extend(tag for tag in self.added if tag not in present)
+
+        return ' '.join(tags)
+
+
+class TagEditor:
+    """
+    A set of rules for changing the tags of a post, matched against whole tags.
+    """
+    def __init__(self, add=(), remove=(), aliases=None):
+        """
+        :param add: tags that every post should have
+        :type add: iterable[str]
+        :param remove: tags that no post should have
+        :type remove: iterable[str]
+        :param aliases: tags that should be replaced, mapped to their replacements
+        :type aliases: dict[str, str]|None
+        """
+        self.add = tuple(add)
+        self.remove = frozenset(remove)
+        self.aliases = dict(aliases or {})
+        conflicts = self.remove.intersection(list(self.add) + list(self.aliases.values()))
+
+        if conflicts:
+            message = 'tags cannot be both added and removed: {0}'
+            raise ValueError(message.format(' '.join(sorted(conflicts))))
+
+    def extend(self, add=(), remove=(), aliases=None):
+        """
+        Create an editor with additional rules, which take precedence over the existing ones.
+
+        :rtype: TagEditor
+        """
+        add = list(add)
+        remove = list(remove)
+        aliases = aliases or {}
+        combined_aliases = {k: v for k, v in self.aliases.items() if v not in remove}
+        combined_aliases.update(aliases)
+
+        return TagEditor(
+            add=[tag for tag in self.add if tag not in remove] + add,
+            remove=self.remove.difference(add, aliases.values()).union(remove),
+            aliases=combined_aliases,
+        )
+
+    def diff(self, tag_string):
+        """
+        Find the smallest change that brings a post's tags in line with the rules.
+
+        :param tag_string: space-delimited list of tags
+        :type tag_string: str
+        :rtype: TagDiff
+        """
+        tags = tag_string.split()
+        present = set(tags)
+        removed = []
+        replacements = []
+
+        for tag in tags:
+            if tag in self.remove:
+                removed.append(tag)
+            elif tag in self.aliases:
+                removed.append(tag)
+                replacements.append(self.aliases[tag])
+
+        added = []
+
+        for tag in replacements + list(self.add):
+            if tag not in present:
+                added.append(tag)
+                present.add(tag)
+
+        return TagDiff(added, removed)
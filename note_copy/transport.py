@@ -0,0 +1,349 @@
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+from pathlib import Path
+
+from . import profiling
+from .exceptions import CircuitOpen
+from .utils import LazyModule
+
+try:
+    import fcntl
+except ImportError:
+    # Without file locks, such as on Windows, rate limiters are only shared within a process
+    fcntl = None
+
+requests = LazyModule('requests')
+
+# Methods that can be sent again without the risk of doing the same thing twice
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryPolicy:
+    """
+    How many times to send a request that failed for a transient reason, and how long to wait.
+    """
+    def __init__(self, max_attempts=3, base_delay=1, max_delay=30):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt):
+        """
+        Use exponential backoff with full jitter, so that workers that failed together do not
+        all retry at the same moment.
+
+        :param attempt: the number of attempts that have already failed
+        :type attempt: int
+        :return: the number of seconds to wait before the next attempt
+        :rtype: float
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def is_retryable(self, method, error=None, response=None):
+        """
+        Decide whether a failed request may be sent again.
+
+        Requests that might have reached the site are only repeated when the method is
+        idempotent, since repeating a note creation would create a duplicate note.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        if response is not None:
+            return response.status_code == 429 or (
+                idempotent and response.status_code in RETRYABLE_STATUSES
+            )
+        elif isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        elif isinstance(error, (requests.exceptions.ConnectionError,
+                                requests.exceptions.Timeout)):
+            return idempotent
+
+        return False
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests to a site that keeps failing, so a batch does not spend its time
+    waiting on a site that is down.
+
+    After enough consecutive failures the circuit opens and requests fail immediately. Once
+    the reset timeout passes, requests are let through again; a success closes the circuit,
+    while another failure opens it for another timeout.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=60):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self.lock:
+            if self.opened_at is None:
+                return False
+
+            return time.monotonic() - self.opened_at < self.reset_timeout
+
+    def check(self, domain):
+        if self.is_open:
+            message = 'Too many failed requests to {0}; not trying again yet'.format(domain)
+            raise CircuitOpen(message)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """
+    Limit how often something is done, allowing short bursts.
+
+    The bucket holds up to `burst` tokens and gains `rate` tokens a second. Each use takes a
+    token, waiting for one when the bucket is empty.
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        now = time.monotonic()
+        # The clock starts over when the host restarts, which a shared bucket may have outlived
+        elapsed = max(0, now - self.updated_at)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        # A negative balance is the time owed to the tokens already promised to others
+        return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.
+
+        :return: the number of seconds spent waiting
+        :rtype: float
+        """
+        with self.lock:
+            wait = self._take()
+
+        if wait and not is_replaying():
+            with profiling.waiting(profiling.SLEEP):
+                time.sleep(wait)
+
+        return wait
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A token bucket shared by every process on the host that uses the same file.
+
+    The number of tokens and the time they were counted are kept in a memory-mapped file,
+    which is locked while a token is taken, so processes running at the same time spend one
+    budget between them. The times come from the monotonic clock, which every process on the
+    host shares.
+    """
+    STATE = struct.Struct('=dd')
+
+    def __init__(self, path, rate, burst=1):
+        """
+        :param path: the file holding the bucket, which is created if needed
+        :type path: str|Path
+        """
+        super().__init__(rate, burst)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+        try:
+            if os.fstat(self.file.fileno()).st_size < self.STATE.size:
+                self.file.write(self.STATE.pack(self.tokens, self.updated_at))
+                self.file.flush()
+
+            self.map = mmap.mmap(self.file.fileno(), self.STATE.size)
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+
+    def _take(self):
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+
+        try:
+            self.tokens, self.updated_at = self.STATE.unpack_from(self.map)
+            wait = super()._take()
+            self.STATE.pack_into(self.map, 0, self.tokens, self.updated_at)
+        finally:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+
+        return wait
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+RETRY_POLICY = RetryPolicy()
+_breakers = {}
+_rate_limiters = {}
+_rate_limit_dir = None
+_store = None
+_breakers_lock = threading.Lock()
+_local = threading.local()
+
+
+def set_store(store):
+    """
+    Record all responses to a store, or answer all requests from one instead of the sites.
+
+    :param store: the store to use, or None to go back to only using the sites
+    :type store: recording.ResponseStore|None
+    """
+    global _store
+    _store = store
+
+
+def is_replaying():
+    """
+    :return: whether requests are answered from recorded responses, so there is no need to wait
+        between them
+    :rtype: bool
+    """
+    return _store is not None and _store.replaying
+
+
+def get_breaker(domain):
+    with _breakers_lock:
+        if domain not in _breakers:
+            _breakers[domain] = CircuitBreaker()
+
+        return _breakers[domain]
+
+
+def set_rate_limit_dir(path):
+    """
+    Share the rate limiter of each site with the other processes on the host that use the same
+    directory, so that together they stay within the site's limits.
+
+    :param path: the directory holding a file for each site, or None to only limit the
+        requests of this process
+    :type path: str|Path|None
+    """
+    global _rate_limit_dir
+
+    with _breakers_lock:
+        _rate_limit_dir = path
+
+        for limiter in _rate_limiters.values():
+            if isinstance(limiter, SharedTokenBucket):
+                limiter.close()
+
+        _rate_limiters.clear()
+
+
+def get_rate_limiter(domain, rate, burst=1):
+    """
+    Get the limiter shared by everything writing to a site.
+
+    The rate and burst are only used the first time the limiter of a site is requested. When a
+    directory was given to set_rate_limit_dir, the limiter is also shared with other processes.
+
+    :rtype: TokenBucket
+    """
+    with _breakers_lock:
+        if domain not in _rate_limiters:
+            if _rate_limit_dir is not None and fcntl is not None:
+                path = Path(_rate_limit_dir) / (domain + '.bucket')
+                _rate_limiters[domain] = SharedTokenBucket(path, rate, burst)
+            else:
+                _rate_limiters[domain] = TokenBucket(rate, burst)
+
+        return _rate_limiters[domain]
+
+
+def get_session(domain):
+    """
+    Get the session for a site, which keeps connections open between requests.
+
+    Sessions are not shared between threads.
+
+    :rtype: requests.Session
+    """
+    sessions = _local.__dict__.setdefault('sessions', {})
+
+    if domain not in sessions:
+        sessions[domain] = requests.Session()
+
+    return sessions[domain]
+
+
+def request(domain, method, url, *, retry_policy=None, **kwargs):
+    """
+    Send a request to a site, retrying transient failures.
+
+    When a store was set, the response is recorded, or when replaying, the recorded response
+    is returned without contacting the site.
+
+    :param domain: the site the request is for, which decides the session and circuit breaker
+    :type domain: str
+    :param method: the HTTP method
+    :type method: str
+    :param url: the URL to request
+    :type url: str
+    :param retry_policy: the policy to use instead of the default one
+    :type retry_policy: RetryPolicy|None
+    :param kwargs: the arguments passed on to requests, which should include a timeout
+    :return: the response, which may still have an error status if it was not retryable
+    :rtype: requests.Response
+    """
+    if is_replaying():
+        return _store.replay(method, url, **kwargs)
+
+    retry_policy = retry_policy or RETRY_POLICY
+    breaker = get_breaker(domain)
+
+    for attempt in range(1, retry_policy.max_attempts + 1):
+        breaker.check(domain)
+        session = get_session(domain)
+        last_attempt = attempt == retry_policy.max_attempts
+
+        try:
+            with profiling.waiting(profiling.NETWORK):
+                r = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            breaker.record_failure()
+
+            if last_attempt or not retry_policy.is_retryable(method, error=e):
+                raise
+        else:
+            if r.status_code in RETRYABLE_STATUSES:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if last_attempt or not retry_policy.is_retryable(method, response=r):
+                if _store is not None:
+                    _store.record(method, url, r, **kwargs)
+
+                return r
+        finally:
+            # Each request passes the cookies it needs, and posts must not pick up each other's
+            # sessions, so nothing is kept in the session's cookie jar
+            session.cookies.clear()
+
+        with profiling.waiting(profiling.SLEEP):
+            time.sleep(retry_policy.get_delay(attempt))
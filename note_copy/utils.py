@@ -1,3 +1,43 @@
+import importlib
+
+
+class cached_property:
+    """
+    A property that is computed once per instance and then stored as an ordinary attribute.
+
+    Deleting the attribute makes the next access compute it again.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+
+        value = obj.__dict__[self.func.__name__] = self.func(obj)
+        return value
+
+
+class LazyModule:
+    """
+    A stand-in for a module that is only imported when one of its attributes is first used.
+
+    Parsing and HTTP libraries take longer to import than most runs of the program take to
+    parse their arguments, so they are not imported until something actually needs them.
+    """
+    def __init__(self, name):
+        self.__name__ = name
+
+    def __getattr__(self, attr):
+        # Only called for attributes not set on the stand-in itself, which allows them to be
+        # mocked without importing the module
+        return getattr(importlib.import_module(self.__name__), attr)
+
+    def __repr__(self):
+        return '<lazy module {0!r}>'.format(self.__name__)
+
+
 def yes_no(prompt):
     """
     Prompt the user with a yes/no question until an answer is received
@@ -36,7 +76,7 @@ def convert_xml_to_dict(root_node):
         except ValueError:
             new_dict[key] = value
 
-    children = root_node.getchildren()
+    children = list(root_node)
 
     if children:
         new_dict[root_node.tag] = [convert_xml_to_dict(child) for child in children]
@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from . import profiling
+from . import transport
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def overlaps(note, other):
+    """
+    :return: whether the two notes cover any of the same pixels
+    :rtype: bool
+    """
+    return (
+        note.x < other.x + other.width and other.x < note.x + note.width and
+        note.y < other.y + other.height and other.y < note.y + note.height
+    )
+
+
+def get_executor(domain, max_workers):
+    """
+    Get the threads writing notes to a site.
+
+    The threads are kept between posts, so the connections of their sessions are reused.
+
+    :rtype: ThreadPoolExecutor
+    """
+    with _executors_lock:
+        if domain not in _executors:
+            _executors[domain] = ThreadPoolExecutor(max_workers=max_workers)
+
+        return _executors[domain]
+
+
+def write_notes(post, notes):
+    """
+    Write notes to a post, sending as many at once as the site allows.
+
+    Writes are spaced out by the site's rate limiter rather than by waiting for each response
+    first. Sites stack notes in the order they were created, so a note is only sent once every
+    earlier note it overlaps has been written; notes that do not overlap can be written in any
+    order.
+
+    :param post: the post to write to
+    :type post: note_copy.BooruPost
+    :param notes: the notes to write, from the bottom of the stack to the top
+    :type notes: list[Note]
+    :return: the ID of each new note, as returned by the post's write_note
+    :rtype: list[int|None]
+    """
+    limiter = transport.get_rate_limiter(post.domain, 1 / post.cooldown, post.write_burst)
+
+    if post.write_concurrency == 1:
+        note_ids = []
+
+        for note in notes:
+            limiter.acquire()
+            note_ids.append(post.write_note(note))
+
+        return note_ids
+
+    executor = get_executor(post.domain, post.write_concurrency)
+    futures = []
+
+    try:
+        for note in notes:
+            in_flight = [f for f in futures if not f.done()]
+
+            if len(in_flight) >= post.write_concurrency:
+                wait(in_flight, return_when=FIRST_COMPLETED)
+
+            wait([f for n, f in zip(notes, futures) if overlaps(note, n)])
+
+            # Stop sending notes once one of them failed
+            for future in futures:
+                if future.done():
+                    future.result()
+
+            limiter.acquire()
+            futures.append(executor.submit(profiling.wrap(post.write_note), note))
+    finally:
+        wait(futures)
+
+    return [future.result() for future in futures]
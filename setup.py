@@ -9,7 +9,6 @@ with open(str(readme_file), 'r') as f:
 
 requires = [
     'beautifulsoup4',
-    'cached_property',
     'defusedxml',
     'requests',
 ]
@@ -0,0 +1,99 @@
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+
+from note_copy import archive
+from note_copy import note_copy
+
+NOTES = [
+    note_copy.Note(10, 20, 30, 40, 'Hello'),
+    note_copy.Note(50, 60, 70, 80, 'こんにちは'),
+]
+
+
+def make_response(items):
+    response = mock.Mock()
+    response.json.return_value = items
+    return response
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = Path(self.tmp_dir) / 'archive.sqlite3'
+        self.archive = archive.Archive(self.path)
+
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_persists(self):
+        self.archive.add([(1, (1000, 800), NOTES), (2, (500, 500), [])])
+        self.archive.close()
+        self.archive = archive.Archive(self.path, domain='gelbooru.com')
+        self.assertEqual('danbooru.donmai.us', self.archive.domain)
+        self.assertEqual(2, len(self.archive))
+        self.assertEqual(((1000, 800), NOTES), self.archive.get(1))
+        self.assertEqual(((500, 500), []), self.archive.get(2))
+        self.assertIsNone(self.archive.get(3))
+
+    @mock.patch('note_copy.transport.request')
+    def test_get_post(self, mock_request):
+        self.archive.add([(1, (1000, 800), NOTES)])
+        post = self.archive.get_post(note_copy.DanbooruPost(1))
+        self.assertIsInstance(post, archive.ArchivePost)
+        self.assertEqual(note_copy.DanbooruPost(1), post)
+        self.assertEqual(NOTES, post.notes)
+        self.assertEqual((1000, 800), post.dimensions)
+        mock_request.assert_not_called()
+
+        with self.assertRaises(NotImplementedError):
+            post.get_notes_updated_since(None)
+
+        self.assertIsNone(self.archive.get_post(note_copy.DanbooruPost(2)))
+        self.assertIsNone(self.archive.get_post(note_copy.GelbooruPost(1)))
+
+
+@mock.patch('note_copy.archive.POSTS_PER_PAGE', 2)
+@mock.patch('note_copy.archive.NOTES_PER_PAGE', 2)
+@mock.patch('note_copy.transport.request')
+class TestExport(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = Path(self.tmp_dir) / 'archive.sqlite3'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_export(self, mock_request):
+        def api_note(note_id, post_id, note):
+            return {'id': note_id, 'post_id': post_id, 'x': note.x, 'y': note.y,
+                    'width': note.width, 'height': note.height, 'body': note.body}
+
+        mock_request.side_effect = [
+            make_response([
+                {'id': 5, 'image_width': 1000, 'image_height': 800},
+                {'id': 4, 'image_width': 500, 'image_height': 400},
+            ]),
+            make_response([api_note(12, 5, NOTES[0]), api_note(11, 4, NOTES[0])]),
+            make_response([api_note(10, 5, NOTES[1])]),
+            make_response([{'id': 3, 'image_width': 300, 'image_height': 200}]),
+            make_response([]),
+        ]
+        result = archive.export('translated', self.path, auth={'api_key': 'key'})
+        self.assertEqual((3, 3), result)
+
+        params = [c[1]['params'] for c in mock_request.call_args_list]
+        self.assertEqual('translated', params[0]['tags'])
+        self.assertEqual('key', params[0]['api_key'])
+        self.assertEqual('5,4', params[1]['search[post_id]'])
+        self.assertEqual('b11', params[2]['page'])
+        self.assertEqual('b4', params[3]['page'])
+
+        source_archive = archive.Archive(self.path)
+        self.assertEqual(((1000, 800), NOTES), source_archive.get(5))
+        self.assertEqual(((500, 400), NOTES[:1]), source_archive.get(4))
+        self.assertEqual(((300, 200), []), source_archive.get(3))
+        source_archive.close()
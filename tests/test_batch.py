@@ -0,0 +1,281 @@
+import shutil
+import threading
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+
+from note_copy import archive
+from note_copy import batch
+from note_copy import note_copy
+from note_copy import transport
+
+
+def copy_notes(source_posts, results):
+    for source_post, result in zip(source_posts, results):
+        result.notes_written = source_post.post_id
+
+    return results
+
+
+@mock.patch('note_copy.batch.time.sleep')
+@mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts', side_effect=copy_notes)
+class TestCopyBatch(TestCase):
+    def test_results_in_order(self, mock_copy_notes, mock_sleep):
+        pairs = [('d1', 'g10'), ('g2', 'd20'), ('d3', 'd30')]
+        results = batch.copy_batch(pairs, concurrency=3)
+        self.assertEqual([1, 2, 3], [r.notes_written for r in results])
+        self.assertEqual(note_copy.DanbooruPost(1), results[0].source)
+        self.assertEqual(note_copy.GelbooruPost(10), results[0].destination)
+        self.assertEqual('w', results[0].destination.mode)
+
+    def test_post_objects(self, mock_copy_notes, mock_sleep):
+        source = note_copy.DanbooruPost(1)
+        destination = note_copy.GelbooruPost(10, mode='w')
+        results = batch.copy_batch([(source, destination)])
+        self.assertIs(source, results[0].source)
+        self.assertIs(destination, results[0].destination)
+
+    def test_error_does_not_stop_batch(self, mock_copy_notes, mock_sleep):
+        pairs = [('x1', 'g10'), ('d2', 'g20')]
+        results = batch.copy_batch(pairs)
+        self.assertFalse(results[0].ok)
+        self.assertEqual('x1', results[0].source)
+        self.assertTrue(results[1].ok)
+        self.assertEqual(2, results[1].notes_written)
+
+    def test_destination_options(self, mock_copy_notes, mock_sleep):
+        results = batch.copy_batch([('d1', 'g10')], destination_options={'fit': 'crop'})
+        self.assertEqual('crop', results[0].destination.fit)
+        self.assertEqual('stretch', results[0].source.fit)
+
+    def test_coalesces_destination(self, mock_copy_notes, mock_sleep):
+        pairs = [('d1', 'g10'), ('d2', 'g10'), ('x3', 'g10'), ('d4', 'g20'), ('d5', 'g10')]
+        results = batch.copy_batch(pairs)
+        self.assertEqual(3, mock_copy_notes.call_count)
+        source_posts = mock_copy_notes.call_args_list[0][0][0]
+        self.assertEqual([note_copy.DanbooruPost(1), note_copy.DanbooruPost(2)], source_posts)
+        self.assertIs(results[0].destination, results[1].destination)
+        self.assertIsNot(results[0].destination, results[4].destination)
+        self.assertFalse(results[2].ok)
+        self.assertEqual([1, 2, 0, 4, 5], [r.notes_written for r in results])
+
+    def test_progress(self, mock_copy_notes, mock_sleep):
+        events = []
+        batch.copy_batch([('d1', 'g10'), ('d2', 'g20')], on_progress=events.append)
+        kinds = [(e.kind, e.index, e.completed) for e in events]
+        expected_kinds = [
+            ('started', 0, 0),
+            ('finished', 0, 1),
+            ('started', 1, 1),
+            ('finished', 1, 2),
+        ]
+        self.assertEqual(expected_kinds, kinds)
+        self.assertEqual(2, events[-1].result.notes_written)
+
+    def test_iter_copy_batch(self, mock_copy_notes, mock_sleep):
+        pairs = iter([('d1', 'g10'), ('d2', 'g20')])
+        results = batch.iter_copy_batch(pairs)
+        self.assertEqual(1, next(results).notes_written)
+        self.assertEqual(2, next(results).notes_written)
+
+    def test_iter_copy_groups(self, mock_copy_notes, mock_sleep):
+        events = []
+        groups = iter([[('d1', 'g10'), ('d2', 'g10')], [('d3', 'g20')]])
+        results = list(batch.iter_copy_groups(groups, on_progress=events.append))
+        self.assertEqual(2, mock_copy_notes.call_count)
+        self.assertEqual([1, 2, 3], [r.notes_written for r in results])
+        self.assertEqual([0, 1, 2], [e.index for e in events if e.kind == 'finished'])
+
+    def test_source_archive(self, mock_copy_notes, mock_sleep):
+        archived_post = archive.ArchivePost(note_copy.DanbooruPost(1), (1000, 800), [])
+        source_archive = mock.Mock()
+        source_archive.get_post.side_effect = [archived_post, None]
+        results = batch.copy_batch([('d1', 'g10'), ('d2', 'g20')], source_archive=source_archive)
+        self.assertIs(archived_post, results[0].source)
+        self.assertEqual(note_copy.DanbooruPost(2), results[1].source)
+        self.assertNotIsInstance(results[1].source, archive.ArchivePost)
+
+    def test_write_concurrency(self, mock_copy_notes, mock_sleep):
+        pairs = [('d1', 'g10'), ('g2', 'd20')]
+        results = batch.copy_batch(pairs, write_concurrency={'gelbooru.com': 3})
+        self.assertEqual(3, results[0].destination.write_concurrency)
+        self.assertEqual(4, results[1].destination.write_concurrency)
+
+    @mock.patch('note_copy.note_copy.DanbooruPost.dimensions', new_callable=mock.PropertyMock)
+    @mock.patch('note_copy.note_copy.DanbooruPost.notes', new_callable=mock.PropertyMock)
+    def test_prefetch(self, mock_notes, mock_dimensions, mock_copy_notes, mock_sleep):
+        reads_before_copy = []
+
+        def copy_notes_after_reads(source_posts, results):
+            reads_before_copy.append(mock_notes.call_count)
+            return copy_notes(source_posts, results)
+
+        mock_copy_notes.side_effect = copy_notes_after_reads
+        mock_notes.side_effect = [[], KeyError('notes')] + [[]] * 8
+        pairs = [('d{0}'.format(i), 'g{0}'.format(i + 100)) for i in range(10)]
+        results = batch.copy_batch(pairs, prefetch=2)
+        self.assertEqual(10, mock_notes.call_count)
+        self.assertEqual(10, mock_dimensions.call_count)
+        self.assertIsInstance(results[1].error, KeyError)
+        self.assertEqual(9, mock_copy_notes.call_count)
+
+        # Two groups wait in the queue and one waits for a worker while one is copied
+        for copied, reads in enumerate(reads_before_copy):
+            self.assertLessEqual(reads, copied + 5)
+
+    @mock.patch('note_copy.sync.sync_notes_to_post')
+    def test_sync_state(self, mock_sync_notes, mock_copy_notes, mock_sleep):
+        state = mock.Mock()
+        results = batch.copy_batch([('d1', 'g10')], sync_state=state)
+        mock_sync_notes.assert_called_once_with(
+            [results[0].source],
+            results[0].destination,
+            state,
+            results=results,
+        )
+        mock_copy_notes.assert_not_called()
+
+
+@mock.patch('note_copy.note_copy.DanbooruPost.dimensions', new_callable=mock.PropertyMock)
+@mock.patch('note_copy.note_copy.DanbooruPost.notes', new_callable=mock.PropertyMock)
+class TestReadAhead(TestCase):
+    def setUp(self):
+        self.runner = batch._BatchRunner()
+        transport.set_rate_limit_dir(None)
+
+    def tearDown(self):
+        transport.set_rate_limit_dir(None)
+
+    def test_hands_on_read_groups(self, mock_notes, mock_dimensions):
+        more_groups = threading.Event()
+        exhausted = threading.Event()
+
+        def groups():
+            yield [(0, 'd1', 'g10')]
+            # Like a queue that is still empty
+            more_groups.wait(5)
+            exhausted.set()
+
+        started_groups = self.runner.read_ahead(groups(), 2)
+        group, results = next(started_groups)
+        self.assertFalse(exhausted.is_set())
+        self.assertEqual([(0, 'd1', 'g10')], group)
+        self.assertTrue(results[0].ok)
+        more_groups.set()
+        self.assertEqual([], list(started_groups))
+
+    @mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts')
+    def test_source_throttle_skipped(self, mock_copy_notes, mock_notes, mock_dimensions):
+        self.runner.throttles['danbooru.donmai.us'] = mock.MagicMock()
+        self.runner.throttles['gelbooru.com'] = mock.MagicMock()
+        started_group = self.runner.start_group([(0, 'd1', 'g10')], read_sources=True)
+        self.runner.copy_group(started_group)
+        mock_copy_notes.assert_called_once_with([started_group[1][0].source],
+                                                results=started_group[1])
+        self.runner.throttles['danbooru.donmai.us'].__enter__.assert_not_called()
+        self.assertEqual(1, self.runner.throttles['gelbooru.com'].__enter__.call_count)
+
+
+@mock.patch('note_copy.transport.time.sleep')
+@mock.patch('note_copy.note_copy.GelbooruPost.dimensions', new_callable=mock.PropertyMock)
+@mock.patch('note_copy.note_copy.GelbooruPost.notes', new_callable=mock.PropertyMock)
+class TestReadSource(TestCase):
+    def setUp(self):
+        # Start from a full bucket
+        transport.set_rate_limit_dir(None)
+
+    def tearDown(self):
+        transport.set_rate_limit_dir(None)
+
+    def test_follows_site_rate(self, mock_notes, mock_dimensions, mock_sleep):
+        pairs = [(0, 'g1', 'd10'), (1, 'g2', 'd20')]
+        started_groups = list(batch._BatchRunner().read_ahead([[pair] for pair in pairs], 2))
+        self.assertEqual(2, len(started_groups))
+        self.assertEqual(2, mock_notes.call_count)
+        # Gelbooru takes a write every fifteen seconds, and reads go at the same pace
+        mock_sleep.assert_called_once_with(mock.ANY)
+        self.assertGreater(mock_sleep.call_args[0][0], 14)
+
+
+class TestGroupByDestination(TestCase):
+    def test_consecutive_pairs(self):
+        pairs = [('d1', 'g10'), ('d2', 'g10'), ('d3', 'g20'), ('d4', 'g10')]
+        result = list(batch.group_by_destination(pairs))
+        expected_result = [
+            [(0, 'd1', 'g10'), (1, 'd2', 'g10')],
+            [(2, 'd3', 'g20')],
+            [(3, 'd4', 'g10')],
+        ]
+        self.assertEqual(expected_result, result)
+
+
+class TestSiteThrottle(TestCase):
+    @mock.patch('note_copy.batch.time.sleep')
+    def test_first_use_does_not_wait(self, mock_sleep):
+        with batch.SiteThrottle(10):
+            pass
+
+        mock_sleep.assert_not_called()
+
+    @mock.patch('note_copy.batch.time.sleep')
+    def test_waits_for_cooldown(self, mock_sleep):
+        throttle = batch.SiteThrottle(10)
+
+        with throttle:
+            pass
+
+        with throttle:
+            pass
+
+        self.assertGreater(mock_sleep.call_args[0][0], 9)
+
+
+class TestReadPairs(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_pairs(self):
+        path = Path(self.tmp_dir) / 'ids'
+
+        with path.open('w') as f:
+            f.write('d1437880\t g1904252\n\n\nd12345    g12345   \n')
+
+        result = list(batch.read_pairs(str(path)))
+        self.assertEqual([('d1437880', 'g1904252'), ('d12345', 'g12345')], result)
+
+    def test_comments(self):
+        path = Path(self.tmp_dir) / 'ids'
+
+        with path.open('w') as f:
+            f.write("# Failed pairs\nd1437880 g1904252  # KeyError: 'csrf-token'\n")
+
+        result = list(batch.read_pairs(str(path)))
+        self.assertEqual([('d1437880', 'g1904252')], result)
+
+
+class TestDeadLetterFile(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = str(Path(self.tmp_dir) / 'failed')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replayable(self):
+        dead_letters = batch.DeadLetterFile(self.path)
+        result = note_copy.CopyResult(note_copy.DanbooruPost(1), note_copy.GelbooruPost(10))
+        result.error = ValueError('first line\nsecond line')
+        dead_letters.add(result)
+        result = note_copy.CopyResult('x2', 'g20')
+        result.error = KeyError('x')
+        dead_letters.add(result)
+
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual('d1 g10  # ValueError: first line second line', lines[0])
+        self.assertEqual([('d1', 'g10'), ('x2', 'g20')], list(batch.read_pairs(self.path)))
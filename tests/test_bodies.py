@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from note_copy import bodies
+from note_copy import note_copy
+
+
+class TestRegexRule(TestCase):
+    def test_replace(self):
+        rule = bodies.RegexRule(r'\s+', ' ')
+        self.assertEqual('a b c', rule('a  b\tc'))
+
+
+class TestTruncateRule(TestCase):
+    def test_short_body(self):
+        rule = bodies.TruncateRule(10)
+        self.assertEqual('0123456789', rule('0123456789'))
+
+    def test_long_body(self):
+        rule = bodies.TruncateRule(10)
+        self.assertEqual('0123456...', rule('0123456789a'))
+
+
+class TestRules(TestCase):
+    def test_normalize_entities(self):
+        body = '&quot;Caf&eacute;&#8230;&quot; &amp; &lt;b&gt;&#x2665;&nbsp;'
+        expected_result = '&quot;Café…&quot; &amp; &lt;b&gt;♥&nbsp;'
+        self.assertEqual(expected_result, bodies.NORMALIZE_ENTITIES(body))
+
+    def test_br_to_newline(self):
+        body = 'one<br />two<br/>three<BR>four'
+        self.assertEqual('one\ntwo\nthree\nfour', bodies.BR_TO_NEWLINE(body))
+
+    def test_tn_to_italics(self):
+        body = 'Hello<tn>A greeting</tn>'
+        self.assertEqual('Hello<i>A greeting</i>', bodies.TN_TO_ITALICS(body))
+
+
+class TestGetPipeline(TestCase):
+    def test_danbooru_to_gelbooru(self):
+        pipeline = bodies.get_pipeline(note_copy.DanbooruPost, note_copy.GelbooruPost)
+        body = 'Hirasawa U&amp;I&#8230;\n<tn>Pun</tn>'
+        self.assertEqual('Hirasawa U&amp;I…\n<i>Pun</i>', pipeline(body))
+
+    def test_gelbooru_to_danbooru(self):
+        pipeline = bodies.get_pipeline(note_copy.GelbooruPost, note_copy.DanbooruPost)
+        body = 'Hirasawa<br />U&amp;I'
+        self.assertEqual('Hirasawa\nU&amp;I', pipeline(body))
+
+    def test_rules_are_not_repeated(self):
+        pipeline = bodies.get_pipeline(note_copy.GelbooruPost, note_copy.GelbooruPost)
+        expected_result = (
+            bodies.BR_TO_NEWLINE,
+            bodies.NORMALIZE_ENTITIES,
+            bodies.TN_TO_ITALICS,
+        )
+        self.assertEqual(expected_result, pipeline.rules)
+
+    def test_cached(self):
+        pipeline = bodies.get_pipeline(note_copy.DanbooruPost, note_copy.DanbooruPost)
+        result = bodies.get_pipeline(note_copy.DanbooruPost, note_copy.DanbooruPost)
+        self.assertIs(pipeline, result)
+
+    def test_max_note_length(self):
+        class ShortNotePost(note_copy.DanbooruPost):
+            max_note_length = 5
+
+        pipeline = bodies.get_pipeline(note_copy.DanbooruPost, ShortNotePost)
+        self.assertEqual('ab...', pipeline('abcdefgh'))
@@ -1,41 +1,60 @@
+import json
 import sys
 from io import StringIO
 from unittest import TestCase
 from unittest import mock
 
+from note_copy import dimension_cache
 from note_copy import note_copy
+from note_copy import transport
 from note_copy.cli import main
 
 
 class TestMain(TestCase):
     def setUp(self):
+        self.original_stdout = sys.stdout
+        sys.stdout = StringIO()
         self.original_stderr = sys.stderr
         sys.stderr = StringIO()
         self.original_argv = sys.argv
 
     def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.original_stdout
         sys.stderr.close()
         sys.stderr = self.original_stderr
         sys.argv = self.original_argv
+        dimension_cache.set_cache(None)
+        transport.set_rate_limit_dir(None)
 
     @mock.patch('note_copy.cli.note_copy.instantiate_post')
-    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
     def test_source_and_destination(self, mock_copy_notes, mock_instantiate_post):
         posts = [
             note_copy.DanbooruPost(1437880),
             note_copy.GelbooruPost(1904252),
         ]
         mock_instantiate_post.side_effect = posts
+
+        def copy_notes(source_posts, results):
+            results[0].notes_written = 2
+            return results
+
+        mock_copy_notes.side_effect = copy_notes
         sys.argv = ['', '--source', 'd1437880', '--destination', 'g1904252']
         main()
-        c = mock.call(posts[0])
+        c = mock.call([posts[0]], results=mock.ANY)
         mock_copy_notes.assert_has_calls([c])
+        self.assertEqual(
+            sys.stdout.getvalue(),
+            'Notes successfully copied from Danbooru #1437880 to Gelbooru #1904252\n',
+        )
 
-    @mock.patch('note_copy.cli.time')
+    @mock.patch('note_copy.batch.time.sleep')
     @mock.patch('builtins.open')
     @mock.patch('note_copy.cli.note_copy.instantiate_post')
-    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_post')
-    def test_file(self, mock_copy_notes, mock_instantiate_post, mock_open, mock_time):
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_file(self, mock_copy_notes, mock_instantiate_post, mock_open, mock_sleep):
         # TODO: Get more interesting post numbers for the second set
         posts = [
             note_copy.DanbooruPost(1437880),
@@ -48,11 +67,285 @@ class TestMain(TestCase):
         mock_open.return_value = StringIO(ids)
         sys.argv = ['', '--file', '/tmp/mock_file']
         main()
-        copy_notes_calls = [mock.call(p) for p in posts if type(p) is note_copy.DanbooruPost]
-        cooldown = note_copy.GelbooruPost.cooldown
-        sleep_calls = [mock.call(cooldown), mock.call(cooldown)]
+        copy_notes_calls = [
+            mock.call([p], results=mock.ANY) for p in posts if type(p) is note_copy.DanbooruPost
+        ]
         mock_copy_notes.assert_has_calls(copy_notes_calls)
-        mock_time.sleep.assert_has_calls(sleep_calls)
+        # The second pair waits out the rest of the cooldown of both sites
+        waits = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertEqual(2, len(waits))
+        self.assertLessEqual(max(waits), note_copy.GelbooruPost.cooldown)
+        self.assertGreater(max(waits), note_copy.GelbooruPost.cooldown - 1)
+
+    @mock.patch('note_copy.cli.dedup.prepare_pairs', return_value=[])
+    @mock.patch('note_copy.cli.batch.read_pairs')
+    def test_dedup(self, mock_read_pairs, mock_prepare_pairs):
+        sys.argv = ['', '--file', '/tmp/mock_file', '--dedup', '--memory-limit', '2']
+        main()
+        mock_read_pairs.assert_called_once_with('/tmp/mock_file')
+        mock_prepare_pairs.assert_called_once_with(
+            mock_read_pairs.return_value,
+            memory_limit=2 * 1024 * 1024,
+        )
+
+    @mock.patch('note_copy.cli.batch.iter_copy_batch', return_value=[])
+    @mock.patch('note_copy.cli.batch.read_pairs')
+    def test_dedup_progress_totals(self, mock_read_pairs, mock_iter_copy_batch):
+        # Duplicates, including the ones written differently, are counted once
+        mock_read_pairs.side_effect = lambda path: iter([
+            ('d1', 'g2'), ('danbooru.donmai.us1', 'gelbooru.com2'), ('d1', 'g3'),
+        ])
+        sys.argv = ['', '--file', '/tmp/mock_file', '--dedup', '--progress', 'json']
+        main()
+        snapshot = json.loads(sys.stdout.getvalue().splitlines()[-1])
+        self.assertEqual(2, snapshot['sites']['gelbooru.com']['pairs_total'])
+
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_failed_pair(self, mock_copy_notes, mock_instantiate_post):
+        mock_instantiate_post.side_effect = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        mock_copy_notes.side_effect = KeyError('csrf-token')
+        sys.argv = ['', '--source', 'd1437880', '--destination', 'g1904252']
+
+        with self.assertRaises(SystemExit) as e:
+            main()
+
+        self.assertEqual(e.exception.code, 1)
+        self.assertEqual(
+            sys.stderr.getvalue(),
+            "Failed to copy notes from Danbooru #1437880 to Gelbooru #1904252: 'csrf-token'\n",
+        )
+
+    @mock.patch('note_copy.batch.open', new_callable=mock.mock_open)
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_dead_letter(self, mock_copy_notes, mock_instantiate_post, mock_open):
+        mock_instantiate_post.side_effect = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        mock_copy_notes.side_effect = KeyError('csrf-token')
+        sys.argv = ['', '-s', 'd1437880', '-d', 'g1904252', '--dead-letter', '/tmp/failed']
+
+        with self.assertRaises(SystemExit):
+            main()
+
+        mock_open.assert_called_once_with('/tmp/failed', 'a')
+        mock_open().write.assert_called_once_with("d1437880 g1904252  # KeyError: 'csrf-token'\n")
+
+    @mock.patch('note_copy.cli.transport.set_store')
+    @mock.patch('note_copy.cli.recording.ResponseStore')
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_replay(self, mock_copy_notes, mock_instantiate_post, mock_store, mock_set_store):
+        mock_instantiate_post.side_effect = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        sys.argv = ['', '-s', 'd1437880', '-d', 'g1904252', '--replay', '/tmp/recording']
+        main()
+        mock_store.assert_called_once_with('/tmp/recording', 'replay')
+        mock_set_store.assert_called_once_with(mock_store.return_value)
+
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_dimension_cache(self, mock_copy_notes, mock_instantiate_post):
+        mock_instantiate_post.side_effect = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        sys.argv = ['', '-s', 'd1437880', '-d', 'g1904252', '--dimension-cache', '/tmp/dims']
+        main()
+        self.assertEqual('/tmp/dims', str(dimension_cache.get_cache().path))
+
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    @mock.patch('note_copy.cli.transport.set_rate_limit_dir')
+    def test_rate_limit_dir(self, mock_set_rate_limit_dir, mock_copy_notes,
+                            mock_instantiate_post):
+        mock_instantiate_post.side_effect = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        sys.argv = ['', '-s', 'd1437880', '-d', 'g1904252', '--rate-limit-dir', '/tmp/limits']
+        main()
+        mock_set_rate_limit_dir.assert_called_once_with('/tmp/limits')
+
+    @mock.patch('note_copy.cli.profiling.stop')
+    @mock.patch('note_copy.cli.profiling.start')
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_profile(self, mock_copy_notes, mock_instantiate_post, mock_start, mock_stop):
+        mock_instantiate_post.side_effect = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        mock_copy_notes.side_effect = KeyError('csrf-token')
+        sys.argv = ['', '-s', 'd1437880', '-d', 'g1904252', '--profile', '/tmp/profile']
+
+        with self.assertRaises(SystemExit):
+            main()
+
+        mock_start.assert_called_once_with()
+        mock_stop.assert_called_once_with('/tmp/profile')
+
+    def test_record_and_replay(self):
+        sys.argv = ['', '-s', 'd1', '-d', 'g2', '--record', '/tmp/a', '--replay', '/tmp/b']
+
+        with self.assertRaises(SystemExit) as e:
+            main()
+
+        self.assertEqual(e.exception.code, 2)
+
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_tag_options(self, mock_copy_notes, mock_instantiate_post):
+        posts = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        mock_instantiate_post.side_effect = posts
+        sys.argv = [
+            '', '-s', 'd1437880', '-d', 'g1904252',
+            '--add-tag', 'commentary', '--alias-tag', 'check_translation', 'partially_translated',
+        ]
+        main()
+        tag_editor = posts[1].tag_editor
+        self.assertEqual(('translated', 'commentary'), tag_editor.add)
+        self.assertEqual({'check_translation': 'partially_translated'}, tag_editor.aliases)
+
+    def test_conflicting_tag_options(self):
+        sys.argv = ['', '-s', 'd1437880', '-d', 'g1904252', '--alias-tag', 'a', 'translated',
+                    '--remove-tag', 'translated']
+
+        with self.assertRaises(SystemExit) as e:
+            main()
+
+        self.assertEqual(e.exception.code, 2)
+
+    @mock.patch('note_copy.cli.sync.sync_notes_to_post')
+    @mock.patch('note_copy.cli.sync.SyncState')
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    def test_sync(self, mock_instantiate_post, mock_sync_state, mock_sync_notes):
+        posts = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        mock_instantiate_post.side_effect = posts
+        sys.argv = ['', 'sync', '-s', 'd1437880', '-d', 'g1904252', '--state', '/tmp/state']
+        main()
+        mock_sync_state.assert_called_once_with('/tmp/state')
+        mock_sync_notes.assert_called_once_with(
+            [posts[0]],
+            posts[1],
+            mock_sync_state.return_value,
+            results=mock.ANY,
+        )
+
+    @mock.patch('note_copy.cli.sync.SyncState')
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    def test_sync_unsupported_source(self, mock_instantiate_post, mock_sync_state):
+        mock_instantiate_post.side_effect = [
+            note_copy.GelbooruPost(1904252),
+            note_copy.DanbooruPost(1437880),
+        ]
+        sys.argv = ['', 'sync', '-s', 'g1904252', '-d', 'd1437880']
+
+        with self.assertRaises(SystemExit) as e:
+            main()
+
+        self.assertEqual(e.exception.code, 1)
+        self.assertEqual(
+            sys.stderr.getvalue(),
+            'Failed to copy notes from Gelbooru #1904252 to Danbooru #1437880: Gelbooru does '
+            'not support finding changed notes\n',
+        )
+
+    @mock.patch('note_copy.cli.threading.Thread')
+    @mock.patch('note_copy.server.make_server')
+    @mock.patch('note_copy.server.Worker')
+    @mock.patch('note_copy.server.JobQueue')
+    def test_serve(self, mock_queue, mock_worker, mock_make_server, mock_thread):
+        mock_worker.return_value.run.side_effect = KeyboardInterrupt
+        sys.argv = ['', 'serve', '--queue', '/tmp/jobs', '--socket', '/tmp/socket', '-j', '2',
+                    '--fit', 'crop']
+        main()
+        mock_queue.assert_called_once_with('/tmp/jobs')
+        self.assertEqual(2, mock_worker.call_args[1]['concurrency'])
+        self.assertEqual('crop', mock_worker.call_args[1]['destination_options']['fit'])
+        mock_make_server.assert_called_once_with(mock_worker.return_value, host='127.0.0.1',
+                                                 port=8080, socket_path='/tmp/socket')
+        mock_make_server.return_value.shutdown.assert_called_once_with()
+        mock_queue.return_value.close.assert_called_once_with()
+        self.assertEqual('Listening on /tmp/socket\n', sys.stdout.getvalue())
+
+    @mock.patch('note_copy.cli.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    @mock.patch('note_copy.cli.archive.export', return_value=(2, 5))
+    def test_export(self, mock_export, mock_auth):
+        mock_auth.return_value = {'login': 'user', 'api_key': 'key'}
+        sys.argv = ['', 'export', '--tags', 'translated comic', '/tmp/archive']
+        main()
+        mock_export.assert_called_once_with('translated comic', '/tmp/archive',
+                                            auth={'login': 'user', 'api_key': 'key'})
+        self.assertEqual('Exported 5 notes from 2 posts to /tmp/archive\n',
+                         sys.stdout.getvalue())
+
+    def test_missing_archive(self):
+        sys.argv = ['', '-s', 'd1', '-d', 'g2', '--archive', '/nonexistent/archive']
+
+        with self.assertRaises(SystemExit) as e:
+            main()
+
+        self.assertEqual(e.exception.code, 2)
+
+    @mock.patch('note_copy.cli.batch.iter_copy_batch', return_value=[])
+    def test_concurrency_options(self, mock_iter_copy_batch):
+        sys.argv = ['', '-s', 'd1', '-d', 'g2', '-j', '2', '--prefetch', '10',
+                    '--read-concurrency', 'd=3', '--write-concurrency', 'gelbooru.com=2',
+                    '--write-concurrency', 'D=8']
+        main()
+        options = mock_iter_copy_batch.call_args[1]
+        self.assertEqual(2, options['concurrency'])
+        self.assertEqual(10, options['prefetch'])
+        self.assertEqual({'danbooru.donmai.us': 3}, options['read_concurrency'])
+        self.assertEqual({'gelbooru.com': 2, 'danbooru.donmai.us': 8},
+                         options['write_concurrency'])
+
+    def test_invalid_site_limit(self):
+        for value in ['x=1', 'd', 'd=0', 'd=many']:
+            sys.argv = ['', '-s', 'd1', '-d', 'g2', '--read-concurrency', value]
+
+            with self.assertRaises(SystemExit) as e:
+                main()
+
+            self.assertEqual(e.exception.code, 2)
+
+    @mock.patch('note_copy.cli.note_copy.instantiate_post')
+    @mock.patch('note_copy.cli.note_copy.BooruPost.copy_notes_from_posts')
+    def test_json_progress(self, mock_copy_notes, mock_instantiate_post):
+        mock_instantiate_post.side_effect = [
+            note_copy.DanbooruPost(1437880),
+            note_copy.GelbooruPost(1904252),
+        ]
+        mock_copy_notes.side_effect = KeyError('csrf-token')
+        sys.argv = ['', '-s', 'd1437880', '-d', 'g1904252', '--progress', 'json']
+
+        with self.assertRaises(SystemExit):
+            main()
+
+        lines = sys.stdout.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        snapshot = json.loads(lines[-1])
+        self.assertEqual(1, snapshot['pairs_done'])
+        self.assertEqual(1, snapshot['pairs_failed'])
+        self.assertEqual(1, snapshot['sites']['gelbooru.com']['pairs_total'])
+        self.assertEqual(
+            "Failed to copy notes from Danbooru #1437880 to Gelbooru #1904252: 'csrf-token'\n",
+            sys.stderr.getvalue(),
+        )
 
     def test_only_source(self):
         sys.argv = ['', '--source', 'd1437880']
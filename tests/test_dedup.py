@@ -0,0 +1,60 @@
+import os
+import shutil
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+
+from note_copy import dedup
+
+
+class TestNormalizePostString(TestCase):
+    def setUp(self):
+        self.sites = {'d': 'd', 'danbooru.donmai.us': 'd'}
+
+    def test_domain(self):
+        result = dedup.normalize_post_string('Danbooru.donmai.us0123', self.sites)
+        self.assertEqual('d123', result)
+
+    def test_unknown_site(self):
+        self.assertEqual('x123', dedup.normalize_post_string('x123', self.sites))
+
+    def test_invalid(self):
+        self.assertEqual('d', dedup.normalize_post_string('d', self.sites))
+
+
+class TestPreparePairs(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.pairs = [
+            ('d2', 'g20'),
+            ('d1', 'd10'),
+            ('danbooru.donmai.us2', 'g20'),
+            ('d1', 'g10'),
+            ('d2', 'g21'),
+            ('d1', 'd10'),
+            ('d3', 'g10'),
+        ]
+        self.expected_pairs = [
+            ('d1', 'd10'),
+            ('d1', 'g10'),
+            ('d3', 'g10'),
+            ('d2', 'g20'),
+            ('d2', 'g21'),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_in_memory(self):
+        result = list(dedup.prepare_pairs(self.pairs, tmp_dir=self.tmp_dir))
+        self.assertEqual(self.expected_pairs, result)
+        self.assertEqual([], os.listdir(self.tmp_dir))
+
+    @mock.patch('note_copy.dedup._spill', wraps=dedup._spill)
+    def test_spills_to_disk(self, mock_spill):
+        memory_limit = 2 * dedup.PAIR_OVERHEAD
+        pairs = dedup.prepare_pairs(self.pairs, memory_limit=memory_limit, tmp_dir=self.tmp_dir)
+        self.assertEqual(self.expected_pairs, list(pairs))
+        self.assertEqual(3, mock_spill.call_count)
+        # The temporary files are removed once the pairs are used up
+        self.assertEqual([], os.listdir(self.tmp_dir))
@@ -0,0 +1,64 @@
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+
+from note_copy import dimension_cache
+from note_copy import note_copy
+
+
+class TestDimensionCache(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = Path(self.tmp_dir) / 'cache' / 'dimensions.sqlite3'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_not_opened_until_used(self):
+        dimension_cache.DimensionCache(self.path)
+        self.assertFalse(self.path.exists())
+
+    @mock.patch('note_copy.dimension_cache.Path.home')
+    def test_default_path(self, mock_home):
+        mock_home.return_value = Path(self.tmp_dir)
+        cache = dimension_cache.DimensionCache()
+        self.assertEqual(Path(self.tmp_dir) / '.note_copy' / 'dimensions.sqlite3', cache.path)
+
+    def test_persists(self):
+        cache = dimension_cache.DimensionCache(self.path)
+        self.assertIsNone(cache.get('danbooru.donmai.us', 1))
+        cache.set('danbooru.donmai.us', 1, (1000, 800))
+        cache.close()
+        cache = dimension_cache.DimensionCache(self.path)
+        self.assertEqual((1000, 800), cache.get('danbooru.donmai.us', 1))
+        self.assertIsNone(cache.get('gelbooru.com', 1))
+        cache.close()
+
+
+@mock.patch('note_copy.note_copy.DanbooruPost.post_info', new_callable=mock.PropertyMock)
+class TestCachedDimensions(TestCase):
+    def setUp(self):
+        self.cache = mock.Mock()
+        dimension_cache.set_cache(self.cache)
+
+    def tearDown(self):
+        dimension_cache.set_cache(None)
+
+    def test_hit(self, mock_post_info):
+        self.cache.get.return_value = (1000, 800)
+        self.assertEqual((1000, 800), note_copy.DanbooruPost(1).dimensions)
+        self.cache.get.assert_called_once_with('danbooru.donmai.us', 1)
+        mock_post_info.assert_not_called()
+
+    def test_miss(self, mock_post_info):
+        self.cache.get.return_value = None
+        mock_post_info.return_value = {'image_width': '1000', 'image_height': '800'}
+        self.assertEqual((1000, 800), note_copy.DanbooruPost(1).dimensions)
+        self.cache.set.assert_called_once_with('danbooru.donmai.us', 1, (1000, 800))
+
+    def test_no_cache(self, mock_post_info):
+        dimension_cache.set_cache(None)
+        mock_post_info.return_value = {'image_width': '1000', 'image_height': '800'}
+        self.assertEqual((1000, 800), note_copy.DanbooruPost(1).dimensions)
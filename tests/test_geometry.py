@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+from note_copy import geometry
+from note_copy.note_copy import Note
+
+
+class TestAspectRatiosMatch(TestCase):
+    def test_same_ratio(self):
+        self.assertTrue(geometry.aspect_ratios_match((1064, 1192), (532, 596)))
+
+    def test_rounded_resize(self):
+        # 1192 * 850 / 1064 = 952.2, which a resizer would round to 952
+        self.assertTrue(geometry.aspect_ratios_match((1064, 1192), (850, 952)))
+
+    def test_different_ratio(self):
+        self.assertFalse(geometry.aspect_ratios_match((1064, 1192), (1064, 1000)))
+
+
+class TestGetTransform(TestCase):
+    def test_identity(self):
+        result = geometry.get_transform((100, 200), (100, 200))
+        self.assertEqual(geometry.Transform(1.0, 1.0, kind='identity'), result)
+
+    def test_resize(self):
+        result = geometry.get_transform((100, 200), (50, 100), fit='crop')
+        self.assertEqual(geometry.Transform(0.5, 0.5, kind='resize'), result)
+
+    def test_stretch(self):
+        result = geometry.get_transform((100, 200), (300, 400))
+        self.assertEqual(geometry.Transform(3.0, 2.0, kind='stretch'), result)
+
+    def test_crop(self):
+        result = geometry.get_transform((200, 100), (100, 100), fit='crop')
+        expected_result = geometry.Transform(1.0, 1.0, -50.0, 0.0, kind='crop', bounds=(100, 100))
+        self.assertEqual(expected_result, result)
+
+    def test_letterbox(self):
+        result = geometry.get_transform((100, 100), (200, 100), fit='letterbox')
+        expected_result = geometry.Transform(1.0, 1.0, 50.0, 0.0, kind='letterbox')
+        self.assertEqual(expected_result, result)
+
+    def test_invalid_fit(self):
+        with self.assertRaises(ValueError):
+            geometry.get_transform((100, 100), (200, 100), fit='zoom')
+
+
+class TestTransform(TestCase):
+    def setUp(self):
+        self.note = Note(10, 10, 15, 15, 'test')
+        self.transform = geometry.Transform(1.5, 1.5)
+
+    def test_round(self):
+        result = self.transform.apply(self.note)
+        self.assertEqual(Note(15, 15, 23, 23, 'test'), result)
+
+    def test_truncate(self):
+        result = self.transform.apply(self.note, rounding='truncate')
+        self.assertEqual(Note(15, 15, 22, 22, 'test'), result)
+
+    def test_outward(self):
+        transform = geometry.Transform(1.3, 1.3)
+        result = transform.apply(self.note, rounding='outward')
+        self.assertEqual(Note(13, 13, 20, 20, 'test'), result)
+
+    def test_adjacent_notes_stay_adjacent(self):
+        transform = geometry.Transform(1 / 3, 1 / 3)
+        left = transform.apply(Note(0, 0, 5, 5, 'left'))
+        right = transform.apply(Note(5, 0, 5, 5, 'right'))
+        self.assertEqual(left.x + left.width, right.x)
+
+    def test_minimum_size(self):
+        transform = geometry.Transform(0.1, 0.1)
+        result = transform.apply(Note(0, 0, 2, 2, 'test'))
+        self.assertEqual(Note(0, 0, 1, 1, 'test'), result)
+
+    def test_crop_clips_note(self):
+        transform = geometry.Transform(1.0, 1.0, -50.0, 0.0, kind='crop', bounds=(100, 100))
+        result = transform.apply(Note(40, 10, 20, 20, 'test'))
+        self.assertEqual(Note(0, 10, 10, 20, 'test'), result)
+
+    def test_crop_drops_note(self):
+        transform = geometry.Transform(1.0, 1.0, -50.0, 0.0, kind='crop', bounds=(100, 100))
+        result = transform.apply(Note(10, 10, 20, 20, 'test'))
+        self.assertIsNone(result)
@@ -21,6 +21,35 @@ GELBOORU_TEST_AUTH = {
     'api_key': 'FAKE_API_KEY_FOR_NOTE_COPY_TESTS',
 }
 
+# Parameters that the Danbooru cassettes were recorded without, which the MockRequests tests
+# cover instead
+PAGING_PARAMS = {'limit', 'page', 'search[is_active]'}
+
+
+def query_without_paging(r1, r2):
+    def get_query(request):
+        return [(k, v) for k, v in request.query if k not in PAGING_PARAMS]
+
+    assert get_query(r1) == get_query(r2)
+
+
+unpaged_vcr = vcr.VCR(match_on=['method', 'scheme', 'host', 'port', 'path', 'unpaged_query'])
+unpaged_vcr.register_matcher('unpaged_query', query_without_paging)
+
+
+class MockRequests:
+    """
+    Stand in for the transport, routing each request to a mock for its HTTP method.
+    """
+    def __init__(self):
+        self.get = mock.Mock()
+        self.put = mock.Mock()
+        self.post = mock.Mock()
+        self.delete = mock.Mock()
+
+    def __call__(self, domain, method, url, **kwargs):
+        return getattr(self, method)(url, **kwargs)
+
 
 class TestNote(TestCase):
     def test_int_params(self):
@@ -65,6 +94,12 @@ class TestScaleNote(TestCase):
         expected_result = note_copy.Note(3, 4, 90, 80, 'test')
         self.assertEqual(expected_result, result)
 
+    def test_scale_note_rounds(self):
+        note = note_copy.Note(10, 10, 15, 15, 'test')
+        result = note_copy.scale_note(note, (100, 100), (150, 150))
+        expected_result = note_copy.Note(15, 15, 23, 23, 'test')
+        self.assertEqual(expected_result, result)
+
 
 class TestBooruPost(TestCase):
     def test_equality_does_match(self):
@@ -153,7 +188,7 @@ class TestDanbooruPost(TestCase):
 
     # When using VCR tapes, be VERY careful to not commit sensitive information like API keys,
     # session cookies, password hashes, etc.
-    @vcr.use_cassette('fixtures/vcr_cassettes/test_danbooru_post/test_notes_property.yaml')
+    @unpaged_vcr.use_cassette('fixtures/vcr_cassettes/test_danbooru_post/test_notes_property.yaml')
     @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
     def test_notes_property(self, mock_auth):
         mock_auth.return_value = DANBOORU_TEST_AUTH
@@ -164,6 +199,103 @@ class TestDanbooruPost(TestCase):
         result = self.post.notes
         self.assertEqual(expected_result, result)
 
+    @unpaged_vcr.use_cassette('fixtures/vcr_cassettes/test_danbooru_post/test_notes_property.yaml')
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_get_notes_updated_since_none(self, mock_auth):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        expected_result = (
+            [
+                note_copy.NoteChange(902123, note_copy.Note(187, 879, 40, 95, 'Tights')),
+                note_copy.NoteChange(902122, note_copy.Note(223, 17, 217, 55, 'Hirasawa U&I')),
+            ],
+            '2013-06-08T21:39:37.142-04:00',
+        )
+        result = self.post.get_notes_updated_since(None)
+        self.assertEqual(expected_result, result)
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_get_notes_updated_since(self, mock_auth, mock_requests):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_get = mock_requests.get
+        mock_get.return_value.json.return_value = [
+            {
+                'id': 7, 'x': 1, 'y': 2, 'width': 3, 'height': 4, 'body': 'deleted',
+                'is_active': False, 'updated_at': '2013-06-09T10:00:00.000-04:00',
+            },
+        ]
+        result = self.post.get_notes_updated_since('2013-06-08T21:39:37.142-04:00')
+        expected_result = ([note_copy.NoteChange(7, None)], '2013-06-09T10:00:00.000-04:00')
+        self.assertEqual(expected_result, result)
+        params = mock_get.call_args[1]['params']
+        self.assertEqual('>2013-06-08T21:39:37.142-04:00', params['search[updated_at]'])
+        self.assertEqual(note_copy.DanbooruPost.notes_per_page, params['limit'])
+        # Deleted notes are changes too
+        self.assertNotIn('search[is_active]', params)
+
+    @mock.patch('note_copy.note_copy.DanbooruPost.notes_per_page', 2)
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_notes_property_pages(self, mock_auth, mock_requests):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_get = mock_requests.get
+        pages = [
+            [
+                {'id': 12, 'x': 1, 'y': 1, 'width': 1, 'height': 1, 'body': 'c'},
+                {'id': 11, 'x': 2, 'y': 2, 'width': 2, 'height': 2, 'body': 'b'},
+            ],
+            [
+                {'id': 10, 'x': 3, 'y': 3, 'width': 3, 'height': 3, 'body': 'a'},
+            ],
+        ]
+        mock_get.return_value.json.side_effect = pages
+        expected_result = [
+            note_copy.Note(1, 1, 1, 1, 'c'),
+            note_copy.Note(2, 2, 2, 2, 'b'),
+            note_copy.Note(3, 3, 3, 3, 'a'),
+        ]
+        result = self.post.notes
+        self.assertEqual(expected_result, result)
+        first_params = mock_get.call_args_list[0][1]['params']
+        second_params = mock_get.call_args_list[1][1]['params']
+        self.assertEqual(2, first_params['limit'])
+        self.assertEqual('true', first_params['search[is_active]'])
+        self.assertNotIn('page', first_params)
+        self.assertEqual('b11', second_params['page'])
+        self.assertEqual(2, mock_get.call_count)
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_get_notes_updated_since_no_changes(self, mock_auth, mock_requests):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_get = mock_requests.get
+        mock_get.return_value.json.return_value = []
+        result = self.post.get_notes_updated_since('2013-06-08T21:39:37.142-04:00')
+        self.assertEqual(([], '2013-06-08T21:39:37.142-04:00'), result)
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_write_note_returns_id(self, mock_auth, mock_requests):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_requests.post.return_value.json.return_value = {'id': 902124}
+        result = self.post.write_note(note_copy.Note(1, 2, 3, 4, 'test'))
+        self.assertEqual(902124, result)
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_update_and_delete_note(self, mock_auth, mock_requests):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        self.post.update_note(902123, note_copy.Note(1, 2, 3, 4, 'test'))
+        self.post.delete_note(902122)
+        url, kwargs = mock_requests.put.call_args
+        self.assertEqual(('https://danbooru.donmai.us/notes/902123.json',), url)
+        self.assertEqual('test', kwargs['data']['note[body]'])
+        mock_requests.delete.assert_called_once_with(
+            'https://danbooru.donmai.us/notes/902122.json',
+            params=DANBOORU_TEST_AUTH,
+            timeout=note_copy.DanbooruPost.timeout,
+        )
+
     @vcr.use_cassette('fixtures/vcr_cassettes/test_danbooru_post/test_post_info_property.yaml')
     @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
     def test_post_info_property(self, mock_auth):
@@ -177,7 +309,7 @@ class TestDanbooruPost(TestCase):
     @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
     def test_dimensions(self, mock_auth):
         mock_auth.return_value = DANBOORU_TEST_AUTH
-        expected_result = (1192, 1064)
+        expected_result = (1064, 1192)
         result = self.post.dimensions
         self.assertEqual(expected_result, result)
 
@@ -256,7 +388,7 @@ class TestGelbooruPost(TestCase):
     @mock.patch('note_copy.note_copy.GelbooruPost.auth', new_callable=mock.PropertyMock)
     def test_dimensions_read(self, mock_auth):
         mock_auth.return_value = GELBOORU_TEST_AUTH
-        expected_result = (1192, 1064)
+        expected_result = (1064, 1192)
         result = self.post.dimensions
         self.assertEqual(expected_result, result)
 
@@ -265,7 +397,7 @@ class TestGelbooruPost(TestCase):
     def test_dimensions_write(self, mock_auth):
         mock_auth.return_value = GELBOORU_TEST_AUTH
         post = note_copy.GelbooruPost(1904252, mode='w')
-        expected_result = (1192, 1064)
+        expected_result = (1064, 1192)
         result = post.dimensions
         self.assertEqual(expected_result, result)
 
@@ -309,7 +441,7 @@ class TestInstantiatePost(TestCase):
 class TestChangeTags(TestCase):
     def test_empty(self):
         result = note_copy.change_tags('')
-        self.assertEqual(' translated', result)
+        self.assertEqual('translated', result)
 
     def test_no_tags_to_remove(self):
         tag_string = '1girl absurdres apron bag bench'
@@ -319,9 +451,8 @@ class TestChangeTags(TestCase):
 
     def test_only_tags_to_remove(self):
         tag_string = ' '.join(note_copy.TAGS_TO_REMOVE)
-        expected_result = ' ' * (len(note_copy.TAGS_TO_REMOVE) - 1) + ' translated'
         result = note_copy.change_tags(tag_string)
-        self.assertEqual(expected_result, result)
+        self.assertEqual('translated', result)
 
     def test_normal_string(self):
         tag_string = (
@@ -330,24 +461,257 @@ class TestChangeTags(TestCase):
             'school_bag solo'
         )
         expected_result = (
-            '1girl absurdres apron bag bench  brown_eyes brown_hair goto_p guitar_case highres ' +
+            '1girl absurdres apron bag bench brown_eyes brown_hair goto_p guitar_case highres ' +
             'hirasawa_ui huge_filesize instrument_case k-on! ladle ponytail school_bag solo ' +
             'translated'
         )
         result = note_copy.change_tags(tag_string)
         self.assertEqual(expected_result, result)
 
+    def test_already_translated(self):
+        tag_string = '1girl translated solo'
+        result = note_copy.change_tags(tag_string)
+        self.assertEqual(tag_string, result)
+
+    def test_tags_containing_tags_to_remove(self):
+        tag_string = 'check_translation_(artist) translation_request'
+        result = note_copy.change_tags(tag_string)
+        self.assertEqual('check_translation_(artist) translated', result)
+
+
+@mock.patch('note_copy.transport.time.sleep')
+class TestUpdateTags(TestCase):
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    def test_danbooru_unchanged(self, mock_requests, mock_sleep):
+        mock_put = mock_requests.put
+        post = note_copy.DanbooruPost(1437880, mode='w')
+        post.post_info = {'tag_string': '1girl solo translated'}
+        post.update_tags()
+        mock_put.assert_not_called()
+
+    @mock.patch('note_copy.note_copy.transport.get_rate_limiter')
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_rate_limited(self, mock_auth, mock_requests, mock_get_rate_limiter, mock_sleep):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_requests.put.return_value.json.return_value = {'tag_string': 'translated'}
+        post = note_copy.DanbooruPost(1437880, mode='w')
+        post.post_info = {'tag_string': 'translation_request'}
+        post.update_tags()
+        mock_get_rate_limiter.assert_called_once_with('danbooru.donmai.us', 1, 10)
+        mock_get_rate_limiter.return_value.acquire.assert_called_once_with()
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_danbooru_changed(self, mock_auth, mock_requests, mock_sleep):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_put = mock_requests.put
+        mock_put.return_value.json.return_value = {'tag_string': '1girl solo translated'}
+        post = note_copy.DanbooruPost(1437880, mode='w')
+        post.post_info = {'tag_string': '1girl translation_request solo'}
+        post.update_tags()
+        payload = mock_put.call_args[1]['data']
+        expected_payload = {
+            'post[tag_string]': '1girl solo translated',
+            'post[old_tag_string]': '1girl translation_request solo',
+        }
+        self.assertEqual(expected_payload, payload)
+        mock_put.assert_called_once()
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_danbooru_retries_rejected_edit(self, mock_auth, mock_requests, mock_sleep):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_put = mock_requests.put
+        mock_get = mock_requests.get
+        rejected = mock.Mock(ok=False, status_code=409)
+        accepted = mock.Mock(ok=True)
+        accepted.json.return_value = {'tag_string': '1girl highres solo translated'}
+        mock_put.side_effect = [rejected, accepted]
+        mock_get.return_value.json.return_value = {
+            'tag_string': '1girl highres solo translation_request',
+        }
+        post = note_copy.DanbooruPost(1437880, mode='w')
+        post.post_info = {'tag_string': '1girl translation_request solo'}
+        post.update_tags()
+        self.assertEqual('tag_string', mock_get.call_args[1]['params']['only'])
+        second_payload = mock_put.call_args_list[1][1]['data']
+        expected_payload = {
+            'post[tag_string]': '1girl highres solo translated',
+            'post[old_tag_string]': '1girl highres solo translation_request',
+        }
+        self.assertEqual(expected_payload, second_payload)
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_danbooru_gives_up(self, mock_auth, mock_requests, mock_sleep):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_put = mock_requests.put
+        mock_get = mock_requests.get
+        mock_put.return_value.ok = False
+        mock_put.return_value.status_code = 409
+        mock_get.return_value.json.return_value = {'tag_string': 'translation_request'}
+        post = note_copy.DanbooruPost(1437880, mode='w')
+        post.post_info = {'tag_string': 'translation_request'}
+
+        with self.assertRaises(exceptions.TagUpdateConflict):
+            post.update_tags()
+
+        self.assertEqual(note_copy.DanbooruPost.max_tag_update_attempts, mock_put.call_count)
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
+    def test_danbooru_error(self, mock_auth, mock_requests, mock_sleep):
+        mock_auth.return_value = DANBOORU_TEST_AUTH
+        mock_put = mock_requests.put
+        mock_put.return_value.ok = False
+        mock_put.return_value.status_code = 403
+        mock_put.return_value.raise_for_status.side_effect = requests.HTTPError('403 Forbidden')
+        post = note_copy.DanbooruPost(1437880, mode='w')
+        post.post_info = {'tag_string': 'translation_request'}
+
+        with self.assertRaises(requests.HTTPError):
+            post.update_tags()
+
+        mock_put.assert_called_once()
+        mock_requests.get.assert_not_called()
+
+    @mock.patch('note_copy.note_copy.GelbooruPost._get_post_info_from_html')
+    @mock.patch('note_copy.note_copy.GelbooruPost._parse_post_page')
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    def test_gelbooru_stale_edit(self, mock_requests, mock_parse, mock_get_post_info, mock_sleep):
+        mock_post = mock_requests.post
+        post_info = {
+            'rating': 's',
+            'source': '',
+            'uid': '1648',
+            'uname': 'fake_user_for_note_copy_tests',
+            'csrf-token': 'token',
+            'PHPSESSID': 'session',
+        }
+        mock_parse.side_effect = [
+            dict(post_info, tags='highres translation_request', change='2'),
+            dict(post_info, tags='highres translated', change='3'),
+        ]
+        post = note_copy.GelbooruPost(1904252, mode='w')
+        post.post_info = dict(post_info, tags='translation_request', change='1')
+
+        with mock.patch.object(note_copy.GelbooruPost, 'write_auth', {}):
+            post.update_tags()
+
+        payloads = [c[1]['data'] for c in mock_post.call_args_list]
+        self.assertEqual(['translated', 'highres translated'], [p['tags'] for p in payloads])
+        self.assertEqual(['1', '2'], [p['lupdated'] for p in payloads])
+        mock_get_post_info.assert_not_called()
+
+    @mock.patch('note_copy.note_copy.transport.request', new_callable=MockRequests)
+    def test_gelbooru_unchanged(self, mock_requests, mock_sleep):
+        mock_post = mock_requests.post
+        post = note_copy.GelbooruPost(1904252, mode='w')
+        post.post_info = {'tags': '1girl solo translated'}
+        post.update_tags()
+        mock_post.assert_not_called()
+
+
+class TestFindMissingNotes(TestCase):
+    def test_matches_position_and_size(self):
+        expected_notes = [
+            note_copy.Note(10, 20, 30, 40, 'a<br>b'),
+            note_copy.Note(10, 20, 30, 41, 'c'),
+        ]
+        actual_notes = [note_copy.Note(10, 20, 30, 40, 'a<br />b')]
+        result = note_copy.find_missing_notes(expected_notes, actual_notes)
+        self.assertEqual([expected_notes[1]], result)
+
+    def test_duplicates(self):
+        expected_notes = [note_copy.Note(10, 20, 30, 40, 'a'), note_copy.Note(10, 20, 30, 40, 'a')]
+        actual_notes = [note_copy.Note(10, 20, 30, 40, 'a')]
+        result = note_copy.find_missing_notes(expected_notes, actual_notes)
+        self.assertEqual([expected_notes[1]], result)
+
+
+@mock.patch('note_copy.transport.time.sleep')
+@mock.patch('note_copy.note_copy.GelbooruPost.write_note')
+@mock.patch('note_copy.note_copy.GelbooruPost.notes', new_callable=mock.PropertyMock)
+class TestVerifyNotes(TestCase):
+    def setUp(self):
+        self.source_notes = [
+            note_copy.Note(10, 20, 30, 40, 'First'),
+            note_copy.Note(50, 60, 70, 80, 'Second'),
+        ]
+        self.source = note_copy.DanbooruPost(1437880)
+        self.source.notes = self.source_notes
+        self.source.post_info = {'image_width': 1000, 'image_height': 1000}
+        self.destination = note_copy.GelbooruPost(1904252, mode='w')
+        self.destination.post_info = {'width': 1000, 'height': 1000, 'tags': 'translated'}
+
+    def test_all_written(self, mock_notes, mock_write_note, mock_sleep):
+        mock_notes.return_value = self.source_notes
+        result = self.destination.copy_notes_from_post(self.source)
+        self.assertEqual(2, mock_write_note.call_count)
+        self.assertEqual(1, mock_notes.call_count)
+        self.assertEqual(2, result.notes_written)
+        self.assertEqual([], result.warnings)
+
+    def test_rewrites_missing(self, mock_notes, mock_write_note, mock_sleep):
+        mock_notes.side_effect = [self.source_notes[:1], self.source_notes]
+        result = self.destination.copy_notes_from_post(self.source)
+        written_notes = [c[0][0] for c in mock_write_note.call_args_list]
+        self.assertEqual(self.source_notes + self.source_notes[1:], written_notes)
+        self.assertEqual(2, result.notes_written)
+        self.assertEqual(0, result.notes_missing)
+
+    def test_gives_up(self, mock_notes, mock_write_note, mock_sleep):
+        mock_notes.return_value = self.source_notes[:1]
+        result = self.destination.copy_notes_from_post(self.source)
+        attempts = note_copy.GelbooruPost.max_write_attempts
+        self.assertEqual(1 + attempts, mock_write_note.call_count)
+        self.assertEqual(1, result.notes_written)
+        self.assertEqual(1, result.notes_missing)
+        self.assertEqual(1, len(result.warnings))
+
+    @mock.patch('note_copy.note_copy.GelbooruPost.update_tags')
+    def test_several_sources(self, mock_update_tags, mock_notes, mock_write_note, mock_sleep):
+        other_source = note_copy.DanbooruPost(1)
+        other_source.notes = [
+            note_copy.Note(10, 20, 30, 40, 'First'),
+            note_copy.Note(90, 90, 10, 10, 'Third'),
+        ]
+        other_source.post_info = {'image_width': 1000, 'image_height': 1000}
+        broken_source = note_copy.DanbooruPost(2)
+        broken_source.post_info = {}
+        broken_source.notes = []
+        mock_notes.return_value = self.source_notes + other_source.notes[1:]
+        sources = [self.source, broken_source, other_source]
+        results = self.destination.copy_notes_from_posts(sources)
+        self.assertEqual(3, mock_write_note.call_count)
+        mock_update_tags.assert_called_once_with()
+        self.assertEqual([2, 0, 1], [r.notes_written for r in results])
+        self.assertEqual([0, 0, 1], [r.notes_skipped for r in results])
+        self.assertIsInstance(results[1].error, KeyError)
+
+    def test_disabled(self, mock_notes, mock_write_note, mock_sleep):
+        self.destination.verify_writes = False
+        result = self.destination.copy_notes_from_post(self.source)
+        self.assertEqual(2, result.notes_written)
+        mock_notes.assert_called_once_with(self.source_notes)
+
 
 class TestIntegration(TestCase):
-    @vcr.use_cassette('fixtures/vcr_cassettes/test_copy_notes/test_copy_notes_from_d_to_g.yaml')
+    @unpaged_vcr.use_cassette(
+        'fixtures/vcr_cassettes/test_copy_notes/test_copy_notes_from_d_to_g.yaml')
     @mock.patch('note_copy.note_copy.GelbooruPost.auth', new_callable=mock.PropertyMock)
     @mock.patch('note_copy.note_copy.DanbooruPost.auth', new_callable=mock.PropertyMock)
-    @mock.patch('note_copy.note_copy.time.sleep')
+    @mock.patch('note_copy.transport.time.sleep')
     def test_copy_notes_from_d_to_g(self, mock_sleep, mock_danbooru_auth, mock_gelbooru_auth):
         mock_danbooru_auth.return_value = DANBOORU_TEST_AUTH
         mock_gelbooru_auth.return_value = GELBOORU_TEST_AUTH
         # If a new integration test needs to be recorded, unmock sleep and auth calls
         danbooru_post = note_copy.DanbooruPost(284392)
         gelbooru_post = note_copy.GelbooruPost(302738, mode='w')
-        gelbooru_post.copy_notes_from_post(danbooru_post)
+        # The cassette was recorded before written notes were read back
+        gelbooru_post.verify_writes = False
+        result = gelbooru_post.copy_notes_from_post(danbooru_post)
         self.assertEqual(set(danbooru_post.notes), set(gelbooru_post.notes))
+        self.assertEqual(len(danbooru_post.notes), result.notes_written)
+        self.assertEqual(0, result.notes_skipped)
@@ -0,0 +1,81 @@
+import pstats
+import shutil
+import threading
+import time
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from note_copy import profiling
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+
+    while time.monotonic() < end:
+        pass
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+
+    def tearDown(self):
+        if profiling._profiler is not None:
+            profiling.stop(self.tmp_dir)
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_disabled(self):
+        with profiling.scope('write'), profiling.waiting(profiling.SLEEP):
+            pass
+
+        self.assertIs(busy, profiling.wrap(busy))
+
+    def test_phases(self):
+        profiler = profiling.start(interval=0.001)
+
+        with profiling.scope('read'):
+            busy(0.05)
+
+            with profiling.waiting(profiling.SLEEP):
+                time.sleep(0.05)
+
+        with profiling.scope('write'):
+            with profiling.waiting(profiling.NETWORK):
+                time.sleep(0.05)
+
+        profiling.stop(self.tmp_dir)
+        stacks = list(profiler.stacks)
+        self.assertTrue(any(s.startswith('read;') and 'busy (test_profiling.py)' in s
+                            for s in stacks))
+        self.assertTrue(any(s.startswith('read;') and s.endswith(';[sleep]') for s in stacks))
+        self.assertTrue(any(s.startswith('write;') and s.endswith(';[network]') for s in stacks))
+
+        path = Path(self.tmp_dir)
+        stats = pstats.Stats(str(path / 'read.pstats'))
+        self.assertTrue(any(func[2] == 'busy' for func in stats.stats))
+        self.assertTrue((path / 'write.pstats').exists())
+
+        with (path / 'stacks.collapsed').open() as f:
+            line = f.readline()
+            self.assertRegex(line, r'^\w+;.* \d+\n$')
+
+        with (path / 'summary.txt').open() as f:
+            summary = f.read()
+            self.assertIn('read: cpu ', summary)
+            self.assertIn('write: cpu ', summary)
+
+    def test_wrap(self):
+        profiler = profiling.start(interval=0.001)
+        phases = []
+
+        def record_phase():
+            phases.append(profiler.phases.get(threading.get_ident()))
+
+        with profiling.scope('write'):
+            thread = threading.Thread(target=profiling.wrap(record_phase))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(['write'], phases)
@@ -0,0 +1,130 @@
+import json
+import threading
+from collections import Counter
+from io import StringIO
+from unittest import TestCase
+from unittest import mock
+
+from note_copy import batch
+from note_copy import note_copy
+from note_copy import progress
+
+
+def finished(completed, destination, notes_written=0, error=None):
+    result = note_copy.CopyResult('d1', destination)
+    result.notes_written = notes_written
+    result.error = error
+    throttles = {'gelbooru.com': mock.Mock(**{'get_status.return_value': (3, 12.34)})}
+    return batch.ProgressEvent(batch.ProgressEvent.FINISHED, completed - 1, result, completed,
+                               throttles)
+
+
+class TestCountPairs(TestCase):
+    def test_by_destination_site(self):
+        pairs = [('d1', 'g2'), ('g3', 'D4'), ('d5', 'gelbooru.com6'), ('d7', 'x8')]
+        expected_result = Counter({'gelbooru.com': 2, 'danbooru.donmai.us': 1, None: 1})
+        self.assertEqual(expected_result, progress.count_pairs(pairs))
+
+
+class TestSiteProgress(TestCase):
+    def test_eta(self):
+        site = progress.SiteProgress('gelbooru.com', total=10)
+        self.assertIsNone(site.get_eta(100, 1))
+        site.pairs = 5
+        site.notes = 50
+        # Half the batch took 100 seconds
+        self.assertEqual(100, site.get_eta(100, 1))
+        # but the site cannot take notes that fast for long
+        self.assertEqual(500, site.get_eta(10, 0.1))
+        site.notes = 0
+        self.assertEqual(100, site.get_eta(100, 1))
+        site.pairs = 10
+        self.assertEqual(0, site.get_eta(100, 1))
+
+    def test_no_total(self):
+        site = progress.SiteProgress('gelbooru.com')
+        site.pairs = 5
+        self.assertIsNone(site.get_eta(100, 1))
+
+
+@mock.patch('note_copy.progress.time.monotonic', return_value=100)
+class TestProgressReporter(TestCase):
+    def test_json(self, mock_monotonic):
+        stream = StringIO()
+        totals = Counter({'gelbooru.com': 4, 'danbooru.donmai.us': 1})
+        reporter = progress.JSONProgress(stream, totals=totals)
+        mock_monotonic.return_value = 110
+        reporter(finished(1, note_copy.GelbooruPost(1), notes_written=10))
+        mock_monotonic.return_value = 115
+        # Too soon after the last update to show anything
+        reporter(finished(2, note_copy.GelbooruPost(2), error=KeyError('x')))
+        mock_monotonic.return_value = 120
+        reporter(finished(3, 'x3'))
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        snapshot = json.loads(lines[1])
+        self.assertEqual(20, snapshot['elapsed'])
+        self.assertEqual(3, snapshot['pairs_done'])
+        self.assertEqual(5, snapshot['pairs_total'])
+        self.assertEqual(1, snapshot['pairs_failed'])
+        self.assertEqual(0.15, snapshot['pairs_per_second'])
+        # Danbooru has not finished a pair yet, so its time left is unknown
+        self.assertIsNone(snapshot['eta'])
+        expected_site = {
+            'pairs_done': 2,
+            'pairs_total': 4,
+            'notes': 10,
+            'notes_per_second': 0.5,
+            'queued': 3,
+            'cooldown': 12.3,
+            # Ten notes left, at Gelbooru's pace of one every fifteen seconds
+            'eta': 150,
+        }
+        self.assertEqual(expected_site, snapshot['sites']['gelbooru.com'])
+        self.assertEqual(0, snapshot['sites']['danbooru.donmai.us']['pairs_done'])
+
+        reporter(finished(4, note_copy.DanbooruPost(4)))
+        reporter.close()
+        snapshot = json.loads(stream.getvalue().splitlines()[-1])
+        self.assertEqual(150, snapshot['eta'])
+
+    def test_tty(self, mock_monotonic):
+        stream = StringIO()
+        reporter = progress.TTYProgress(stream, totals=Counter({'gelbooru.com': 2}))
+        mock_monotonic.return_value = 110
+        reporter(finished(1, note_copy.GelbooruPost(1), notes_written=10))
+        self.assertEqual(
+            '\r1/2 pairs, 0.10/s, ETA 0:02:30 | gelbooru.com 1.00 notes/s, 3 queued, '
+            'cooldown 12.3s\x1b[K',
+            stream.getvalue(),
+        )
+        reporter.clear()
+        reporter.close()
+        self.assertTrue(stream.getvalue().endswith('\x1b[K\n'))
+
+
+class TestTimer(TestCase):
+    def test_shows_between_events(self):
+        shown = threading.Event()
+
+        class Reporter(progress.ProgressReporter):
+            def show(self, snapshot):
+                self.snapshot = snapshot
+                shown.set()
+
+        reporter = Reporter(StringIO(), interval=0.01)
+        reporter.start()
+        self.assertTrue(shown.wait(5))
+        shown.clear()
+        # Later figures come without any event
+        self.assertTrue(shown.wait(5))
+        reporter.close()
+        self.assertFalse(reporter.timer.is_alive())
+        self.assertEqual(0, reporter.snapshot['pairs_done'])
+
+
+class TestFormatDuration(TestCase):
+    def test_format_duration(self):
+        self.assertEqual('--', progress.format_duration(None))
+        self.assertEqual('0:00:05', progress.format_duration(5.9))
+        self.assertEqual('10:02:03', progress.format_duration(36123))
@@ -0,0 +1,208 @@
+import json
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+
+import requests
+
+from note_copy import exceptions
+from note_copy import note_copy
+from note_copy import recording
+from note_copy import transport
+
+
+def make_response(url, body, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = 'OK'
+    response.url = url
+    response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    response.headers['Content-Encoding'] = 'gzip'
+    response.cookies.set('PHPSESSID', 'abc')
+    response._content = body
+    return response
+
+
+POST_PAGE = '''<html><body><form>
+<input name="title" value=""><input name="source" value="">
+<input name="uid" value="1648"><input name="uname" value="fake_user_for_note_copy_tests">
+<input type="hidden" name="csrf-token" value="{token}">
+<input name="rating" value="s" checked="checked"><input name="lupdated" value="{change}">
+<textarea id="tags">{tags}</textarea></form>
+<img id="image" data-original-width="1000" data-original-height="800">
+</body></html>'''
+
+
+def make_post_page(token, change, tags):
+    response = make_response('https://gelbooru.com/index.php?page=post&s=view&id=1', b'')
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    response._content = POST_PAGE.format(token=token, change=change, tags=tags).encode('utf-8')
+    return response
+
+
+class TestGetKey(TestCase):
+    def test_ignores_credentials(self):
+        url = 'https://danbooru.donmai.us/posts/1.json'
+        key = recording.get_key('get', url, params={'login': 'a', 'api_key': 'b'})
+        self.assertEqual(recording.get_key('GET', url, params={'login': 'c'}), key)
+
+    def test_data(self):
+        url = 'https://gelbooru.com/public/note_save.php?id=-2'
+        key = recording.get_key('post', url, data={'note[x]': 1})
+        self.assertNotEqual(recording.get_key('post', url, data={'note[x]': 2}), key)
+
+    def test_ignores_form_tokens(self):
+        url = 'https://gelbooru.com/public/edit_post.php'
+        key = recording.get_key('post', url, data={'csrf-token': 'abc123', 'tags': 'a'})
+        replayed_key = recording.get_key('post', url, data={'csrf-token': 'REDACTED', 'tags': 'a'})
+        self.assertEqual(key, replayed_key)
+
+    def test_redact_url(self):
+        result = recording.redact_url('https://gelbooru.com/index.php?user_id=1&id=5&api_key=x')
+        self.assertEqual('https://gelbooru.com/index.php?id=5', result)
+
+
+class TestResponseStore(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.url = 'https://danbooru.donmai.us/notes.json'
+        self.params = {'search[post_id]': 1, 'login': 'user', 'api_key': 'secret'}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        store = recording.ResponseStore(self.tmp_dir, recording.RECORD)
+        response = make_response(self.url + '?login=user&api_key=secret', b'[1]')
+        store.record('get', self.url, response, params=self.params, timeout=1)
+        store = recording.ResponseStore(self.tmp_dir, recording.REPLAY)
+        self.assertTrue(store.replaying)
+        result = store.replay('get', self.url, params={'search[post_id]': 1}, timeout=1)
+        self.assertEqual(200, result.status_code)
+        self.assertEqual([1], result.json())
+        self.assertEqual(recording.PLACEHOLDER, result.cookies['PHPSESSID'])
+        self.assertEqual(self.url, result.url)
+        self.assertNotIn('Content-Encoding', result.headers)
+
+        with (Path(self.tmp_dir) / 'index.jsonl').open('r') as f:
+            self.assertNotIn('secret', f.read())
+
+    def test_session_secrets(self):
+        store = recording.ResponseStore(self.tmp_dir, recording.RECORD)
+        body = (
+            b'<form><input type="hidden" name="csrf-token" value="token123">'
+            b'<input value="token456" name=\'csrf-token\'><input name="title" value="kept">'
+            b'</form>'
+        )
+        response = make_response(self.url, body)
+        response.headers['Set-Cookie'] = 'PHPSESSID=abc; path=/'
+        store.record('get', self.url, response)
+
+        with (Path(self.tmp_dir) / 'index.jsonl').open('r') as f:
+            entry = json.loads(f.readline())
+
+        self.assertNotIn('abc', json.dumps(entry))
+        self.assertNotIn('Set-Cookie', entry['headers'])
+
+        with (Path(self.tmp_dir) / 'bodies' / entry['body']).open('rb') as f:
+            recorded_body = f.read()
+
+        self.assertNotIn(b'token123', recorded_body)
+        self.assertNotIn(b'token456', recorded_body)
+        self.assertIn(b'name="csrf-token" value="REDACTED"', recorded_body)
+        self.assertIn(b'value="kept"', recorded_body)
+
+    def test_repeated_request(self):
+        store = recording.ResponseStore(self.tmp_dir, recording.RECORD)
+        store.record('get', self.url, make_response(self.url, b'[]'), params=self.params)
+        store.record('get', self.url, make_response(self.url, b'[1]'), params=self.params)
+        store = recording.ResponseStore(self.tmp_dir, recording.REPLAY)
+        bodies = [store.replay('get', self.url, params=self.params).json() for _ in range(3)]
+        self.assertEqual([[], [1], [1]], bodies)
+
+    def test_index(self):
+        store = recording.ResponseStore(self.tmp_dir, recording.RECORD)
+        store.record('get', self.url, make_response(self.url, b'{}'))
+
+        with (Path(self.tmp_dir) / 'index.jsonl').open('r') as f:
+            entry = json.loads(f.readline())
+
+        self.assertEqual('GET', entry['method'])
+        self.assertTrue((Path(self.tmp_dir) / 'bodies' / entry['body']).exists())
+
+    def test_not_recorded(self):
+        store = recording.ResponseStore(self.tmp_dir, recording.RECORD)
+        store.record('get', self.url, make_response(self.url, b'[]'))
+        store = recording.ResponseStore(self.tmp_dir, recording.REPLAY)
+
+        with self.assertRaises(exceptions.ResponseNotRecorded):
+            store.replay('get', self.url, params={'search[post_id]': 2})
+
+    def test_missing_recording(self):
+        with self.assertRaises(FileNotFoundError):
+            recording.ResponseStore(self.tmp_dir, recording.REPLAY)
+
+
+class TestTransport(TestCase):
+    def setUp(self):
+        self.store = mock.Mock()
+
+    def tearDown(self):
+        transport.set_store(None)
+
+    @mock.patch('note_copy.transport.get_session')
+    def test_replay(self, mock_get_session):
+        self.store.replaying = True
+        transport.set_store(self.store)
+        result = transport.request('example.com', 'get', 'https://example.com', timeout=1)
+        self.assertIs(self.store.replay.return_value, result)
+        self.store.replay.assert_called_once_with('get', 'https://example.com', timeout=1)
+        mock_get_session.assert_not_called()
+
+    @mock.patch('note_copy.transport.get_session')
+    def test_record(self, mock_get_session):
+        self.store.replaying = False
+        transport.set_store(self.store)
+        response = mock_get_session.return_value.request.return_value
+        response.status_code = 200
+        result = transport.request('example.com', 'get', 'https://example.com', timeout=1)
+        self.assertIs(response, result)
+        self.store.record.assert_called_once_with(
+            'get', 'https://example.com', response, timeout=1,
+        )
+
+    @mock.patch('note_copy.transport.time.sleep')
+    def test_no_waiting_when_replaying(self, mock_sleep):
+        self.store.replaying = True
+        transport.set_store(self.store)
+        bucket = transport.TokenBucket(rate=1, burst=1)
+        bucket.acquire()
+        bucket.acquire()
+        mock_sleep.assert_not_called()
+
+    @mock.patch('note_copy.transport.time.sleep')
+    @mock.patch('note_copy.transport.get_session')
+    def test_replay_tag_edit(self, mock_get_session, mock_sleep):
+        tmp_dir = mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        mock_get_session.return_value.request.side_effect = [
+            make_post_page('token123', '1', 'translation_request'),
+            make_post_page('token456', '2', 'translated'),
+        ]
+
+        def update_tags():
+            post = note_copy.GelbooruPost(1, mode='w')
+
+            with mock.patch.object(note_copy.GelbooruPost, 'write_auth', {}):
+                post.update_tags()
+
+            return post
+
+        transport.set_store(recording.ResponseStore(tmp_dir, recording.RECORD))
+        update_tags()
+        transport.set_store(recording.ResponseStore(tmp_dir, recording.REPLAY))
+        post = update_tags()
+        self.assertEqual('translated', post.tag_string)
+        self.assertEqual(2, mock_get_session.return_value.request.call_count)
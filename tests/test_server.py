@@ -0,0 +1,177 @@
+import json
+import shutil
+import threading
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+from urllib import request
+from urllib.error import HTTPError
+
+from note_copy import note_copy
+from note_copy import server
+
+
+def copy_notes(source_posts, results):
+    for source_post, result in zip(source_posts, results):
+        if source_post.post_id == 3:
+            result.error = ValueError('no notes')
+        else:
+            result.notes_written = source_post.post_id
+
+    return results
+
+
+class TestJobQueue(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = Path(self.tmp_dir) / 'jobs.sqlite3'
+        self.queue = server.JobQueue(self.path)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_claim_group(self):
+        self.queue.submit([('d1', 'g10'), ('d2', 'g20'), ('d3', 'g10')])
+        self.assertEqual([(1, 'd1', 'g10'), (3, 'd3', 'g10')], self.queue.claim_group())
+        self.assertEqual([(2, 'd2', 'g20')], self.queue.claim_group())
+        self.assertEqual([], self.queue.claim_group())
+        self.assertEqual({'queued': 0, 'running': 3, 'done': 0, 'failed': 0}, self.queue.count())
+
+    def test_finish(self):
+        job_id, = self.queue.submit([('d1', 'g10')])
+        self.queue.claim_group()
+        result = note_copy.CopyResult('d1', 'g10')
+        result.error = KeyError('csrf-token')
+        result.warnings.append('stretched')
+        self.queue.finish(job_id, result)
+        job = self.queue.get(job_id)
+        self.assertEqual('failed', job['status'])
+        self.assertEqual("KeyError: 'csrf-token'", job['error'])
+        self.assertEqual(['stretched'], job['warnings'])
+        self.assertIsNone(self.queue.get(job_id + 1))
+
+    def test_requeues_running_jobs(self):
+        job_id, = self.queue.submit([('d1', 'g10')])
+        self.queue.claim_group()
+        self.queue.close()
+        self.queue = server.JobQueue(self.path)
+        self.assertEqual('queued', self.queue.get(job_id)['status'])
+
+
+@mock.patch('note_copy.batch.time.sleep')
+@mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts', side_effect=copy_notes)
+class TestServer(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.queue = server.JobQueue(Path(self.tmp_dir) / 'jobs.sqlite3')
+        self.worker = server.Worker(self.queue, destination_options={'fit': 'crop'})
+        self.http_server = server.make_server(self.worker, port=0)
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        host, port = self.http_server.server_address
+        self.url = 'http://{0}:{1}/jobs'.format(host, port)
+
+    def tearDown(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.queue.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def open(self, url, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+
+        with request.urlopen(url, data) as response:
+            return response.status, json.loads(response.read().decode('utf-8'))
+
+    def test_jobs(self, mock_copy_notes, mock_sleep):
+        status, body = self.open(self.url, {'pairs': [['d1', 'g10'], ['d3', 'g10'], ['d2', 'g20']]})
+        self.assertEqual(202, status)
+        self.assertEqual([1, 2, 3], body['jobs'])
+
+        _, counts = self.open(self.url)
+        self.assertEqual({'queued': 3, 'running': 0, 'done': 0, 'failed': 0}, counts)
+
+        original_finish = self.queue.finish
+
+        def finish(job_id, result):
+            original_finish(job_id, result)
+            counts = self.queue.count()
+
+            if counts['done'] + counts['failed'] == 3:
+                self.worker.stop()
+
+        with mock.patch.object(self.queue, 'finish', side_effect=finish):
+            self.worker.run()
+
+        self.assertEqual(2, mock_copy_notes.call_count)
+        _, job = self.open(self.url + '/1')
+        self.assertEqual('done', job['status'])
+        self.assertEqual(1, job['notes_written'])
+        _, job = self.open(self.url + '/2')
+        self.assertEqual('failed', job['status'])
+        self.assertEqual('ValueError: no notes', job['error'])
+
+    def test_claims_group_when_worker_is_free(self, mock_copy_notes, mock_sleep):
+        self.worker.submit([('d1', 'g10'), ('d2', 'g20')])
+        statuses = []
+
+        def copy_notes_and_check(source_posts, results):
+            # Give the worker time to take the next group too early
+            threading.Event().wait(0.1)
+            statuses.append(self.queue.get(2)['status'])
+            return copy_notes(source_posts, results)
+
+        mock_copy_notes.side_effect = copy_notes_and_check
+        original_finish = self.queue.finish
+
+        def finish(job_id, result):
+            original_finish(job_id, result)
+
+            if job_id == 2:
+                self.worker.stop()
+
+        with mock.patch.object(self.queue, 'finish', side_effect=finish):
+            self.worker.run()
+
+        # The second group waits in the queue while the only worker copies the first
+        self.assertEqual(['queued', 'running'], statuses)
+
+    def test_bad_request(self, mock_copy_notes, mock_sleep):
+        with self.assertRaises(HTTPError) as e:
+            self.open(self.url, {'pairs': 'd1 g10'})
+
+        self.assertEqual(400, e.exception.code)
+        e.exception.close()
+
+        with self.assertRaises(HTTPError) as e:
+            self.open(self.url + '/1')
+
+        self.assertEqual(404, e.exception.code)
+        e.exception.close()
+
+
+class TestMakeServer(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.socket_path = Path(self.tmp_dir) / 'note_copy.sock'
+        self.worker = mock.Mock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replaces_stale_socket(self):
+        http_server = server.make_server(self.worker, socket_path=str(self.socket_path))
+        # Like a server that was killed before it could clean up
+        http_server.socket.close()
+        self.assertTrue(self.socket_path.is_socket())
+        http_server = server.make_server(self.worker, socket_path=str(self.socket_path))
+        http_server.server_close()
+
+    def test_keeps_other_files(self):
+        self.socket_path.write_text('not a socket')
+
+        with self.assertRaises(FileExistsError):
+            server.make_server(self.worker, socket_path=str(self.socket_path))
+
+        self.assertEqual('not a socket', self.socket_path.read_text())
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+# Modules that are only needed once a site is actually contacted
+HEAVY_MODULES = ['asyncio', 'bs4', 'defusedxml', 'requests']
+# The CLI imported in about 30 ms when this was written, compared to over 150 ms when the
+# heavy modules were imported eagerly, so this leaves room for slower machines.
+IMPORT_TIME_BUDGET = 100000
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime requires Python 3.7')
+class TestStartup(TestCase):
+    def get_import_times(self, *args):
+        """
+        :return: the cumulative import time in microseconds of every module that was imported
+        :rtype: dict[str, int]
+        """
+        command = [sys.executable, '-X', 'importtime'] + list(args)
+        result = subprocess.run(
+            command,
+            cwd=str(PROJECT_DIR),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        import_times = {}
+
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or line.endswith('imported package'):
+                continue
+
+            _, cumulative, module = line.split('|')
+            import_times[module.strip()] = int(cumulative)
+
+        return import_times
+
+    def is_imported(self, package, import_times):
+        return any(m == package or m.startswith(package + '.') for m in import_times)
+
+    def test_import_cli(self):
+        import_times = self.get_import_times('-c', 'import note_copy.cli')
+
+        for module in HEAVY_MODULES:
+            self.assertFalse(self.is_imported(module, import_times), module)
+
+        self.assertLess(import_times['note_copy.cli'], IMPORT_TIME_BUDGET)
+
+    def test_help(self):
+        import_times = self.get_import_times('-m', 'note_copy', '--help')
+
+        for module in HEAVY_MODULES:
+            self.assertFalse(self.is_imported(module, import_times), module)
+
+    def test_parser_imported_when_used(self):
+        statement = (
+            'from note_copy import note_copy; '
+            "note_copy.bs4.BeautifulSoup('', 'html.parser')"
+        )
+        import_times = self.get_import_times('-c', statement)
+        self.assertTrue(self.is_imported('bs4', import_times))
+        self.assertFalse(self.is_imported('requests', import_times))
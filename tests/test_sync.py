@@ -0,0 +1,221 @@
+import json
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+
+from note_copy import exceptions
+from note_copy import note_copy
+from note_copy import sync
+
+
+class TestSyncState(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = Path(self.tmp_dir) / 'state' / 'sync_state.json'
+        self.source = note_copy.DanbooruPost(1437880)
+        self.destination = note_copy.GelbooruPost(1904252, mode='w')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_missing_file(self):
+        state = sync.SyncState(self.path)
+        self.assertIsNone(state.get(self.source, self.destination))
+
+    @mock.patch('note_copy.sync.Path.home')
+    def test_default_path(self, mock_home):
+        mock_home.return_value = Path(self.tmp_dir)
+        state = sync.SyncState()
+        self.assertEqual(Path(self.tmp_dir) / '.note_copy' / 'sync_state.json', state.path)
+
+    def test_get_key(self):
+        result = sync.SyncState.get_key(self.source, self.destination)
+        self.assertEqual('danbooru.donmai.us1437880 gelbooru.com1904252', result)
+
+    def test_set_persists(self):
+        state = sync.SyncState(self.path)
+        state.set(self.source, self.destination, '2013-06-08T21:39:37.142-04:00')
+
+        with self.path.open('r') as f:
+            expected_result = {
+                'danbooru.donmai.us1437880 gelbooru.com1904252': {
+                    'updated_at': '2013-06-08T21:39:37.142-04:00',
+                },
+            }
+            self.assertEqual(expected_result, json.load(f))
+
+        reloaded_state = sync.SyncState(self.path)
+        result = reloaded_state.get(self.source, self.destination)
+        self.assertEqual('2013-06-08T21:39:37.142-04:00', result)
+
+    def test_set_notes(self):
+        state = sync.SyncState(self.path)
+        state.set(self.source, self.destination, '2013-06-08T21:39:20.012-04:00', {'1': 5})
+        state.set(self.source, self.destination, '2013-06-08T21:39:37.142-04:00')
+        reloaded_state = sync.SyncState(self.path)
+        result = reloaded_state.get_notes(self.source, self.destination)
+        self.assertEqual({'1': 5}, result)
+
+    def test_timestamp_only(self):
+        self.path.parent.mkdir(parents=True)
+
+        with self.path.open('w') as f:
+            json.dump({
+                'danbooru.donmai.us1437880 gelbooru.com1904252': '2013-06-08T21:39:37.142-04:00',
+            }, f)
+
+        state = sync.SyncState(self.path)
+        self.assertEqual('2013-06-08T21:39:37.142-04:00', state.get(self.source, self.destination))
+        self.assertEqual({}, state.get_notes(self.source, self.destination))
+
+
+class TestSyncNotes(TestCase):
+    def setUp(self):
+        self.source = note_copy.DanbooruPost(1437880)
+        self.destination = note_copy.GelbooruPost(1904252, mode='w')
+        self.state = mock.Mock()
+        self.state.get.return_value = '2013-06-08T21:39:20.012-04:00'
+        self.state.get_notes.return_value = {}
+
+    @mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts')
+    @mock.patch('note_copy.note_copy.DanbooruPost.get_notes_updated_since')
+    def test_changed_notes(self, mock_get_notes, mock_copy_notes):
+        notes = [note_copy.Note(187, 879, 40, 95, 'Tights')]
+
+        def copy_notes(source_posts, notes, results):
+            results[0].copied_notes.append((notes[0][0], None))
+
+        mock_copy_notes.side_effect = copy_notes
+        mock_get_notes.return_value = (
+            [note_copy.NoteChange(902123, notes[0]), note_copy.NoteChange(902124, None)],
+            '2013-06-08T21:39:37.142-04:00',
+        )
+        result = sync.sync_notes(self.source, self.destination, self.state)
+        self.assertTrue(result.ok)
+        mock_get_notes.assert_called_once_with('2013-06-08T21:39:20.012-04:00')
+        mock_copy_notes.assert_called_once_with([self.source], notes=[notes], results=[result])
+        self.state.set.assert_called_once_with(
+            self.source,
+            self.destination,
+            '2013-06-08T21:39:37.142-04:00',
+            {'902123': None},
+        )
+
+    @mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts')
+    @mock.patch('note_copy.note_copy.DanbooruPost.get_notes_updated_since')
+    def test_missing_notes_retried(self, mock_get_notes, mock_copy_notes):
+        notes = [note_copy.Note(187, 879, 40, 95, 'Tights'), note_copy.Note(1, 2, 3, 4, 'Lost')]
+
+        def copy_notes(source_posts, notes, results):
+            results[0].copied_notes.append((notes[0][0], None))
+            results[0].notes_written = 1
+            results[0].notes_missing = 1
+
+        mock_copy_notes.side_effect = copy_notes
+        mock_get_notes.return_value = (
+            [note_copy.NoteChange(902123, notes[0]), note_copy.NoteChange(902124, notes[1])],
+            '2013-06-08T21:39:37.142-04:00',
+        )
+        result = sync.sync_notes(self.source, self.destination, self.state)
+        self.assertTrue(result.ok)
+        # The timestamp stays put so that the missing note is copied by the next sync
+        self.state.set.assert_called_once_with(
+            self.source,
+            self.destination,
+            '2013-06-08T21:39:20.012-04:00',
+            {'902123': None},
+        )
+
+    @mock.patch('note_copy.sync.transport.get_rate_limiter')
+    @mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts')
+    @mock.patch('note_copy.note_copy.DanbooruPost.delete_note')
+    @mock.patch('note_copy.note_copy.DanbooruPost.update_note')
+    @mock.patch('note_copy.note_copy.GelbooruPost.get_notes_updated_since')
+    def test_edited_and_deleted_notes(self, mock_get_notes, mock_update_note, mock_delete_note,
+                                      mock_copy_notes, mock_get_rate_limiter):
+        source = note_copy.GelbooruPost(1904252)
+        source.post_info = {'width': 1000, 'height': 1000}
+        destination = note_copy.DanbooruPost(1437880, mode='w')
+        destination.post_info = {'image_width': 2000, 'image_height': 2000}
+        self.state.get_notes.return_value = {'1': 11, '2': 12}
+        mock_get_notes.return_value = (
+            [
+                note_copy.NoteChange(1, note_copy.Note(10, 10, 10, 10, 'Edited')),
+                note_copy.NoteChange(2, None),
+            ],
+            '2013-06-08T21:39:37.142-04:00',
+        )
+        result = sync.sync_notes(source, destination, self.state)
+        self.assertEqual((1, 1, 0), (result.notes_updated, result.notes_deleted,
+                                     result.notes_written))
+        mock_update_note.assert_called_once_with(11, note_copy.Note(20, 20, 20, 20, 'Edited'))
+        mock_delete_note.assert_called_once_with(12)
+        mock_copy_notes.assert_not_called()
+        self.assertEqual(2, mock_get_rate_limiter.return_value.acquire.call_count)
+        self.state.set.assert_called_once_with(
+            source,
+            destination,
+            '2013-06-08T21:39:37.142-04:00',
+            {'1': 11},
+        )
+
+    @mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts')
+    @mock.patch('note_copy.note_copy.DanbooruPost.get_notes_updated_since')
+    def test_edits_refused(self, mock_get_notes, mock_copy_notes):
+        self.state.get_notes.return_value = {'902123': None}
+        mock_get_notes.return_value = (
+            [note_copy.NoteChange(902123, note_copy.Note(187, 879, 40, 95, 'Edited'))],
+            '2013-06-08T21:39:37.142-04:00',
+        )
+        result = sync.sync_notes(self.source, self.destination, self.state)
+        self.assertTrue(result.ok)
+        self.assertEqual(1, len(result.warnings))
+        mock_copy_notes.assert_not_called()
+        self.state.set.assert_called_once_with(
+            self.source,
+            self.destination,
+            '2013-06-08T21:39:37.142-04:00',
+            {'902123': None},
+        )
+
+    @mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts')
+    @mock.patch('note_copy.note_copy.DanbooruPost.get_notes_updated_since')
+    def test_no_changed_notes(self, mock_get_notes, mock_copy_notes):
+        mock_get_notes.return_value = ([], '2013-06-08T21:39:20.012-04:00')
+        result = sync.sync_notes(self.source, self.destination, self.state)
+        self.assertEqual(0, result.notes_written)
+        mock_copy_notes.assert_not_called()
+        self.state.set.assert_not_called()
+
+    def test_unsupported_source(self):
+        source = note_copy.GelbooruPost(1904252)
+        destination = note_copy.DanbooruPost(1437880, mode='w')
+
+        with self.assertRaises(exceptions.SyncNotSupported):
+            sync.sync_notes(source, destination, self.state)
+
+    @mock.patch('note_copy.note_copy.BooruPost.copy_notes_from_posts')
+    @mock.patch('note_copy.note_copy.DanbooruPost.get_notes_updated_since')
+    def test_sync_notes_to_post(self, mock_get_notes, mock_copy_notes):
+        notes = [note_copy.Note(187, 879, 40, 95, 'Tights')]
+        mock_get_notes.side_effect = [
+            ([note_copy.NoteChange(902123, notes[0])], '2013-06-08T21:39:37.142-04:00'),
+            ([], '2013-06-08T21:39:20.012-04:00'),
+        ]
+        sources = [self.source, note_copy.DanbooruPost(1), note_copy.GelbooruPost(2)]
+        results = sync.sync_notes_to_post(sources, self.destination, self.state)
+        self.assertEqual([True, True, False], [result.ok for result in results])
+        self.assertIsInstance(results[2].error, exceptions.SyncNotSupported)
+        mock_copy_notes.assert_called_once_with(
+            [self.source],
+            notes=[notes],
+            results=[results[0]],
+        )
+        self.state.set.assert_called_once_with(
+            self.source,
+            self.destination,
+            '2013-06-08T21:39:37.142-04:00',
+            {},
+        )
@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from note_copy import tags
+
+
+class TestTagDiff(TestCase):
+    def test_empty(self):
+        self.assertFalse(tags.TagDiff())
+
+    def test_not_empty(self):
+        self.assertTrue(tags.TagDiff(added=['translated']))
+
+    def test_str(self):
+        diff = tags.TagDiff(added=['translated'], removed=['translation_request'])
+        self.assertEqual('translated -translation_request', str(diff))
+
+    def test_apply(self):
+        diff = tags.TagDiff(added=['translated', 'solo'], removed=['translation_request'])
+        result = diff.apply('1girl  translation_request solo\n')
+        self.assertEqual('1girl solo translated', result)
+
+
+class TestTagEditor(TestCase):
+    def setUp(self):
+        self.editor = tags.TagEditor(
+            add=['translated'],
+            remove=['translation_request', 'check_translation'],
+            aliases={'translated_(check)': 'check_translation_(needed)'},
+        )
+
+    def test_no_change(self):
+        result = self.editor.diff('1girl solo translated')
+        self.assertEqual(tags.TagDiff(), result)
+
+    def test_add_and_remove(self):
+        result = self.editor.diff('1girl translation_request solo')
+        expected_result = tags.TagDiff(added=['translated'], removed=['translation_request'])
+        self.assertEqual(expected_result, result)
+
+    def test_whole_tags_only(self):
+        result = self.editor.diff('check_translation_(artist) translated')
+        self.assertEqual(tags.TagDiff(), result)
+
+    def test_alias(self):
+        result = self.editor.diff('translated_(check) translated')
+        expected_result = tags.TagDiff(
+            added=['check_translation_(needed)'],
+            removed=['translated_(check)'],
+        )
+        self.assertEqual(expected_result, result)
+
+    def test_duplicate_tags(self):
+        result = self.editor.diff('translation_request translation_request')
+        expected_result = tags.TagDiff(
+            added=['translated'],
+            removed=['translation_request', 'translation_request'],
+        )
+        self.assertEqual(expected_result, result)
+        self.assertEqual('translated', result.apply('translation_request translation_request'))
+
+    def test_conflict(self):
+        with self.assertRaises(ValueError):
+            tags.TagEditor(add=['translated'], remove=['translated'])
+
+    def test_extend(self):
+        result = self.editor.extend(add=['check_translation'], remove=['translated'])
+        self.assertEqual(('check_translation',), result.add)
+        self.assertEqual(frozenset({'translation_request', 'translated'}), result.remove)
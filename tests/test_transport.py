@@ -0,0 +1,190 @@
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest import mock
+from unittest import skipIf
+
+import requests
+
+from note_copy import exceptions
+from note_copy import transport
+
+
+def make_response(status_code):
+    response = mock.Mock()
+    response.status_code = status_code
+    return response
+
+
+class TestRetryPolicy(TestCase):
+    def setUp(self):
+        self.policy = transport.RetryPolicy(max_attempts=3, base_delay=1, max_delay=5)
+
+    def test_delay_bounds(self):
+        for attempt, limit in [(1, 1), (2, 2), (3, 4), (10, 5)]:
+            for _ in range(20):
+                delay = self.policy.get_delay(attempt)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, limit)
+
+    def test_server_error(self):
+        self.assertTrue(self.policy.is_retryable('GET', response=make_response(503)))
+        self.assertFalse(self.policy.is_retryable('POST', response=make_response(503)))
+
+    def test_rate_limited(self):
+        self.assertTrue(self.policy.is_retryable('POST', response=make_response(429)))
+
+    def test_client_error(self):
+        self.assertFalse(self.policy.is_retryable('GET', response=make_response(404)))
+
+    def test_connect_timeout(self):
+        error = requests.exceptions.ConnectTimeout()
+        self.assertTrue(self.policy.is_retryable('POST', error=error))
+
+    def test_read_timeout(self):
+        error = requests.exceptions.ReadTimeout()
+        self.assertTrue(self.policy.is_retryable('PUT', error=error))
+        self.assertFalse(self.policy.is_retryable('POST', error=error))
+
+
+class TestCircuitBreaker(TestCase):
+    def test_opens_after_threshold(self):
+        breaker = transport.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.check('example.com')
+        breaker.record_failure()
+
+        with self.assertRaises(exceptions.CircuitOpen):
+            breaker.check('example.com')
+
+    def test_success_resets(self):
+        breaker = transport.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.check('example.com')
+
+    @mock.patch('note_copy.transport.time.monotonic')
+    def test_half_open(self, mock_monotonic):
+        breaker = transport.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        mock_monotonic.return_value = 100
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        mock_monotonic.return_value = 161
+        self.assertFalse(breaker.is_open)
+
+
+@mock.patch('note_copy.transport.time.sleep')
+@mock.patch('note_copy.transport.time.monotonic', return_value=100)
+class TestTokenBucket(TestCase):
+    def test_burst(self, mock_monotonic, mock_sleep):
+        bucket = transport.TokenBucket(rate=1, burst=3)
+
+        for _ in range(3):
+            self.assertEqual(0, bucket.acquire())
+
+        mock_sleep.assert_not_called()
+        self.assertEqual(1, bucket.acquire())
+        self.assertEqual(2, bucket.acquire())
+
+    def test_refills(self, mock_monotonic, mock_sleep):
+        bucket = transport.TokenBucket(rate=0.5, burst=1)
+        bucket.acquire()
+        mock_monotonic.return_value = 101
+        self.assertEqual(1, bucket.acquire())
+        mock_monotonic.return_value = 200
+        self.assertEqual(0, bucket.acquire())
+
+
+@skipIf(transport.fcntl is None, 'no file locks')
+@mock.patch('note_copy.transport.time.sleep')
+@mock.patch('note_copy.transport.time.monotonic', return_value=100)
+class TestSharedTokenBucket(TestCase):
+    def setUp(self):
+        self.tmp_dir = mkdtemp()
+        self.path = Path(self.tmp_dir) / 'limits' / 'danbooru.donmai.us.bucket'
+
+    def tearDown(self):
+        transport.set_rate_limit_dir(None)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_shared_between_buckets(self, mock_monotonic, mock_sleep):
+        # Separate buckets on one file lock it like separate processes would
+        first = transport.SharedTokenBucket(self.path, rate=1, burst=2)
+        second = transport.SharedTokenBucket(self.path, rate=1, burst=2)
+        self.assertEqual(0, first.acquire())
+        self.assertEqual(0, second.acquire())
+        self.assertEqual(1, first.acquire())
+        self.assertEqual(2, second.acquire())
+        first.close()
+        second.close()
+
+    def test_clock_restarted(self, mock_monotonic, mock_sleep):
+        bucket = transport.SharedTokenBucket(self.path, rate=1, burst=1)
+        bucket.acquire()
+        bucket.close()
+        mock_monotonic.return_value = 5
+        bucket = transport.SharedTokenBucket(self.path, rate=1, burst=1)
+        self.assertEqual(1, bucket.acquire())
+        self.assertEqual(2, bucket.acquire())
+        bucket.close()
+
+    def test_rate_limit_dir(self, mock_monotonic, mock_sleep):
+        transport.set_rate_limit_dir(self.path.parent)
+        limiter = transport.get_rate_limiter('danbooru.donmai.us', 1)
+        self.assertIsInstance(limiter, transport.SharedTokenBucket)
+        self.assertEqual(self.path, limiter.path)
+        transport.set_rate_limit_dir(None)
+        limiter = transport.get_rate_limiter('danbooru.donmai.us', 1)
+        self.assertNotIsInstance(limiter, transport.SharedTokenBucket)
+
+
+@mock.patch('note_copy.transport.time.sleep')
+@mock.patch('note_copy.transport.get_session')
+@mock.patch('note_copy.transport.get_breaker')
+class TestRequest(TestCase):
+    def setUp(self):
+        self.breaker = transport.CircuitBreaker()
+
+    def test_retries_transient_failure(self, mock_get_breaker, mock_get_session, mock_sleep):
+        mock_get_breaker.return_value = self.breaker
+        session = mock_get_session.return_value
+        session.request.side_effect = [make_response(502), make_response(200)]
+        r = transport.request('example.com', 'GET', 'https://example.com', timeout=1)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(2, session.request.call_count)
+        session.request.assert_called_with('GET', 'https://example.com', timeout=1)
+        self.assertEqual(1, mock_sleep.call_count)
+        self.assertEqual(0, self.breaker.failures)
+
+    def test_gives_up(self, mock_get_breaker, mock_get_session, mock_sleep):
+        mock_get_breaker.return_value = self.breaker
+        session = mock_get_session.return_value
+        session.request.side_effect = requests.exceptions.ConnectTimeout()
+
+        with self.assertRaises(requests.exceptions.ConnectTimeout):
+            transport.request('example.com', 'POST', 'https://example.com')
+
+        self.assertEqual(transport.RETRY_POLICY.max_attempts, session.request.call_count)
+        self.assertEqual(transport.RETRY_POLICY.max_attempts, self.breaker.failures)
+
+    def test_post_not_resent(self, mock_get_breaker, mock_get_session, mock_sleep):
+        mock_get_breaker.return_value = self.breaker
+        session = mock_get_session.return_value
+        session.request.side_effect = requests.exceptions.ReadTimeout()
+
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            transport.request('example.com', 'POST', 'https://example.com')
+
+        self.assertEqual(1, session.request.call_count)
+        mock_sleep.assert_not_called()
+
+    def test_open_circuit(self, mock_get_breaker, mock_get_session, mock_sleep):
+        mock_get_breaker.return_value = transport.CircuitBreaker(failure_threshold=1)
+        mock_get_breaker.return_value.record_failure()
+
+        with self.assertRaises(exceptions.CircuitOpen):
+            transport.request('example.com', 'GET', 'https://example.com')
+
+        mock_get_session.return_value.request.assert_not_called()
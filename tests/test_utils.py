@@ -6,6 +6,49 @@ from defusedxml import ElementTree
 from note_copy import utils
 
 
+class TestCachedProperty(TestCase):
+    def setUp(self):
+        class Example:
+            calls = 0
+
+            @utils.cached_property
+            def value(self):
+                self.calls += 1
+                return self.calls
+
+        self.example = Example()
+
+    def test_computed_once(self):
+        self.assertEqual(1, self.example.value)
+        self.assertEqual(1, self.example.value)
+
+    def test_delete_resets(self):
+        self.assertEqual(1, self.example.value)
+        del self.example.value
+        self.assertEqual(2, self.example.value)
+
+
+class TestLazyModule(TestCase):
+    def test_attribute(self):
+        module = utils.LazyModule('json')
+        self.assertEqual('[]', module.dumps([]))
+
+    def test_mock_attribute(self):
+        module = utils.LazyModule('json')
+
+        with mock.patch.object(module, 'dumps') as mock_dumps:
+            module.dumps([])
+
+        mock_dumps.assert_called_once_with([])
+        self.assertEqual('[]', module.dumps([]))
+
+    def test_missing_module(self):
+        module = utils.LazyModule('note_copy_does_not_exist')
+
+        with self.assertRaises(ImportError):
+            module.anything
+
+
 class TestYesNo(TestCase):
     @mock.patch('note_copy.utils.input')
     def test_y(self, mock_input):
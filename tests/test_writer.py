@@ -0,0 +1,65 @@
+import threading
+from unittest import TestCase
+from unittest import mock
+
+from note_copy import note_copy
+from note_copy import writer
+
+
+class TestOverlaps(TestCase):
+    def test_overlapping(self):
+        note = note_copy.Note(0, 0, 10, 10, 'a')
+        other = note_copy.Note(9, 9, 10, 10, 'b')
+        self.assertTrue(writer.overlaps(note, other))
+        self.assertTrue(writer.overlaps(other, note))
+
+    def test_touching(self):
+        note = note_copy.Note(0, 0, 10, 10, 'a')
+        other = note_copy.Note(10, 0, 10, 10, 'b')
+        self.assertFalse(writer.overlaps(note, other))
+
+
+@mock.patch('note_copy.writer.transport.get_rate_limiter')
+class TestWriteNotes(TestCase):
+    def setUp(self):
+        self.post = mock.Mock(domain='example.com', cooldown=1, write_burst=10)
+        self.notes = [
+            note_copy.Note(0, 0, 10, 10, 'bottom'),
+            note_copy.Note(50, 50, 10, 10, 'elsewhere'),
+            note_copy.Note(5, 5, 10, 10, 'top'),
+        ]
+
+    def test_sequential(self, mock_get_rate_limiter):
+        self.post.write_concurrency = 1
+        writer.write_notes(self.post, self.notes)
+        self.assertEqual([mock.call(n) for n in self.notes], self.post.write_note.call_args_list)
+        self.assertEqual(3, mock_get_rate_limiter.return_value.acquire.call_count)
+
+    def test_overlapping_notes_stay_in_order(self, mock_get_rate_limiter):
+        self.post.domain = 'ordering.example.com'
+        self.post.write_concurrency = 3
+        elsewhere_written = threading.Event()
+        written = []
+
+        def write_note(note):
+            # The bottom note is only done once a later note was written next to it
+            if note.body == 'bottom':
+                elsewhere_written.wait(5)
+            elif note.body == 'elsewhere':
+                elsewhere_written.set()
+
+            written.append(note.body)
+
+        self.post.write_note.side_effect = write_note
+        writer.write_notes(self.post, self.notes)
+        self.assertEqual(['elsewhere', 'bottom', 'top'], written)
+
+    def test_failure(self, mock_get_rate_limiter):
+        self.post.domain = 'failure.example.com'
+        self.post.write_concurrency = 2
+        self.post.write_note.side_effect = ValueError('rejected')
+
+        with self.assertRaises(ValueError):
+            writer.write_notes(self.post, self.notes)
+
+        self.assertLess(self.post.write_note.call_count, 3)